@@ -0,0 +1,171 @@
+import asyncio
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import h11
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+import h2.settings
+
+# The first bytes of every HTTP/2 connection without negotiation (h2c prior knowledge)
+PREFACE = b'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n'
+
+
+class H2Origin:
+    def __init__(self, latency: float = 0.0, body_size: int = 1024, max_concurrent_streams: int = 1000):
+        """
+        Local origin speaking HTTP/1.1 and HTTP/2 (h2c prior knowledge) on the same port, so transports can be
+        compared against the same server. It counts the connections it accepted, GET /_stats returns them as JSON.
+        'latency' and 'size' query parameters override the defaults per request like on the MockOrigin.
+
+        :param latency: Seconds to wait before answering.
+        :param body_size: Size of the response body in bytes.
+        :param max_concurrent_streams: Streams a client may open at once on one HTTP/2 connection.
+        """
+        self.latency = latency
+        self.body_size = body_size
+        self.max_concurrent_streams = max_concurrent_streams
+
+        self.connections = {'http/1.1': 0, 'h2': 0}
+        self.requests = {'http/1.1': 0, 'h2': 0}
+        self.bodies = {}
+        self.server = None
+
+    def body(self, size: int) -> bytes:
+        body = self.bodies.get(size)
+        if body is None:
+            body = self.bodies[size] = b'x' * size
+        return body
+
+    async def respond(self, target: str) -> tuple:
+        """
+        Returns the (status, content type, body) of a request target.
+        """
+        url = urlsplit(target)
+        if url.path == '/_stats':
+            return 200, 'application/json', json.dumps({'connections': self.connections,
+                                                        'requests': self.requests}).encode()
+
+        query = parse_qs(url.query)
+        latency = float(query['latency'][0]) if 'latency' in query else self.latency
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+        size = int(query['size'][0]) if 'size' in query else self.body_size
+        return 200, 'application/octet-stream', self.body(size)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            start = await reader.readexactly(len(PREFACE))
+        except asyncio.IncompleteReadError:
+            writer.close()
+            return
+
+        try:
+            if start == PREFACE:
+                await self.serve_h2(start, reader, writer)
+            else:
+                await self.serve_h1(start, reader, writer)
+        except (ConnectionError, h11.ProtocolError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_h1(self, start: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections['http/1.1'] += 1
+        connection = h11.Connection(h11.SERVER)
+        connection.receive_data(start)
+        target = None
+
+        while True:
+            event = connection.next_event()
+
+            if event is h11.NEED_DATA:
+                connection.receive_data(await reader.read(65536))
+            elif isinstance(event, h11.Request):
+                target = event.target.decode()
+            elif isinstance(event, h11.EndOfMessage):
+                self.requests['http/1.1'] += 1
+                status, content_type, body = await self.respond(target)
+                writer.write(connection.send(h11.Response(status_code=status, headers=[
+                    ('content-type', content_type), ('content-length', str(len(body)))])))
+                writer.write(connection.send(h11.Data(data=body)))
+                writer.write(connection.send(h11.EndOfMessage()))
+                await writer.drain()
+                connection.start_next_cycle()
+            elif isinstance(event, h11.ConnectionClosed) or event is h11.PAUSED:
+                return
+
+    async def serve_h2(self, start: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections['h2'] += 1
+        connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        connection.local_settings = h2.settings.Settings(client=False, initial_values={
+            h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: self.max_concurrent_streams})
+        connection.initiate_connection()
+        writer.write(connection.data_to_send())
+
+        targets = {}
+        tasks = set()
+        # Set (and replaced) whenever the client opens its flow control window, blocked streams wait for it
+        window_opened = [asyncio.Event()]
+
+        async def send(stream_id: int, target: str):
+            status, content_type, body = await self.respond(target)
+            try:
+                connection.send_headers(stream_id, [(':status', str(status)), ('content-type', content_type),
+                                                    ('content-length', str(len(body)))], end_stream=not body)
+                writer.write(connection.data_to_send())
+
+                while body:
+                    window = min(connection.local_flow_control_window(stream_id), connection.max_outbound_frame_size)
+                    if window <= 0:
+                        await window_opened[0].wait()
+                        continue
+
+                    chunk, body = body[:window], body[window:]
+                    connection.send_data(stream_id, chunk, end_stream=not body)
+                    writer.write(connection.data_to_send())
+            except h2.exceptions.StreamClosedError:
+                # The client reset the stream
+                pass
+
+        data = start
+        while data:
+            for event in connection.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    targets[event.stream_id] = dict(event.headers)[':path']
+                elif isinstance(event, h2.events.DataReceived):
+                    connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    self.requests['h2'] += 1
+                    task = asyncio.ensure_future(send(event.stream_id, targets.pop(event.stream_id)))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                elif isinstance(event, h2.events.WindowUpdated):
+                    window_opened[0].set()
+                    window_opened[0] = asyncio.Event()
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    data = None
+
+            writer.write(connection.data_to_send())
+            if data is not None:
+                data = await reader.read(65536)
+
+        for task in tasks:
+            task.cancel()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """
+        Starts serving and returns the base url, port 0 picks a free port.
+        """
+        self.server = await asyncio.start_server(self.handle, host, port)
+        port = self.server.sockets[0].getsockname()[1]
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+
+# The entry points a worker imports
+MODULES = ('request_generator', 'data_fetcher')
+# Every entry point needs aiohttp (and asyncio), the budget covers the time on top of importing it alone
+BASELINE = 'aiohttp'
+# Only needed by the proxy scraper or the command line tools, importing them is a regression
+FORBIDDEN = ('requests', 'bs4', 'schedule', 'dotenv', 'argparse')
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Parses `-X importtime` output into module name -> cumulative microseconds.
+    """
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative_us, name = line.split('|')
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def measure(module: str) -> dict:
+    """
+    Imports `module` in a fresh interpreter, in an empty working directory and without ROOT_DIR, and reports how
+    long it took, which of the forbidden modules got imported and whether the import created any files.
+    """
+    env = {key: value for key, value in os.environ.items() if key not in ('ROOT_DIR', 'PYTHONPATH')}
+    env['PYTHONPATH'] = ROOT_DIR
+    # Compiled files would show up as created files and .pyc writing isn't what we measure
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=directory,
+                                 env=env, capture_output=True, text=True)
+        created = os.listdir(directory)
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr[-2000:]}")
+
+    cumulative = parse_importtime(process.stderr)
+    return {
+        'total_ms': cumulative[module] / 1000,
+        'forbidden': [name for name in FORBIDDEN if name in cumulative],
+        'created_files': created,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the import time of the package entry points')
+    parser.add_argument('--module', action='append', help='Module to measure, can be repeated')
+    parser.add_argument('--runs', type=int, default=7,
+                        help='Runs per module, the fastest is reported since noise only ever adds time')
+    parser.add_argument('--budget-ms', type=float, default=50,
+                        help=f'Allowed import time on top of {BASELINE} in milliseconds')
+    parser.add_argument('--output', type=str, help='Where to write the JSON results, defaults to benchmarks/results')
+    args = parser.parse_args()
+
+    results = []
+    failed = False
+
+    baseline = min(measure(BASELINE)['total_ms'] for _ in range(args.runs))
+
+    for module in args.module or MODULES:
+        runs = [measure(module) for _ in range(args.runs)]
+
+        total = min(run['total_ms'] for run in runs)
+        result = {
+            'module': module,
+            'total_ms': round(total, 2),
+            'baseline_ms': round(baseline, 2),
+            'own_ms': round(total - baseline, 2),
+            'budget_ms': args.budget_ms,
+            'forbidden': runs[0]['forbidden'],
+            'created_files': runs[0]['created_files'],
+        }
+        result['passed'] = (result['own_ms'] <= args.budget_ms and not result['forbidden']
+                            and not result['created_files'])
+        failed = failed or not result['passed']
+        results.append(result)
+
+        print(f"{module:<20} total {result['total_ms']:>8.1f}ms  {BASELINE} {result['baseline_ms']:>8.1f}ms  "
+              f"own {result['own_ms']:>7.1f}ms / {args.budget_ms:.0f}ms  "
+              f"{'ok' if result['passed'] else 'FAILED'}")
+        if result['forbidden']:
+            print(f"  imports {', '.join(result['forbidden'])}")
+        if result['created_files']:
+            print(f"  created {', '.join(result['created_files'])} on import")
+
+    output = args.output or os.path.join(RESULTS_DIR, 'import-' + time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'timestamp': time.time(), 'python': sys.version.split()[0], 'results': results}, f, indent=2)
+
+    print(f"\nResults written to {output}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
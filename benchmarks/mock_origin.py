@@ -0,0 +1,90 @@
+import asyncio
+import random
+
+from aiohttp import web
+
+
+class MockOrigin:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 throttle_status: int = 429, retry_after: float = None, body_size: int = 1024, seed: int = None):
+        """
+        Local HTTP origin with injectable latency, errors and throttling. Every option is the default for all
+        requests and can be overridden per request with a query parameter of the same name (body_size is 'size'),
+        e.g. /bench?latency=0.05&error_rate=0.1&size=65536, so one server can serve every scenario.
+
+        :param latency: Seconds to wait before answering.
+        :param jitter: Up to this many seconds are added to the latency at random.
+        :param error_rate: Share of requests answered with a 500.
+        :param throttle_rate: Share of requests answered with throttle_status.
+        :param throttle_status: The status of throttled answers, 429 or 503.
+        :param retry_after: Retry-After value in seconds sent with throttled answers, no header if omitted.
+        :param body_size: Size of the response body in bytes.
+        :param seed: Seed of the random generator so runs inject the same failures.
+        """
+        self.defaults = {
+            'latency': latency,
+            'jitter': jitter,
+            'error_rate': error_rate,
+            'throttle_rate': throttle_rate,
+            'throttle_status': throttle_status,
+            'retry_after': retry_after,
+            'size': body_size,
+        }
+        self.random = random.Random(seed)
+        self.bodies = {}
+        self.requests = 0
+        self.runner = None
+        self.port = None
+
+    def option(self, request: web.Request, name: str):
+        value = request.query.get(name)
+        if value is None:
+            return self.defaults[name]
+        return int(value) if name in ('size', 'throttle_status') else float(value)
+
+    def body(self, size: int) -> bytes:
+        # Bodies are built once per size, the origin shouldn't be what a benchmark measures
+        body = self.bodies.get(size)
+        if body is None:
+            body = self.bodies[size] = b'x' * size
+        return body
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+
+        latency = self.option(request, 'latency') + self.random.uniform(0, self.option(request, 'jitter'))
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+        # Drain the request body so POSTs and PUTs cost what they would on a real server
+        await request.read()
+
+        if self.random.random() < self.option(request, 'error_rate'):
+            return web.Response(status=500, text='Injected error')
+
+        if self.random.random() < self.option(request, 'throttle_rate'):
+            retry_after = self.option(request, 'retry_after')
+            headers = {'Retry-After': str(retry_after)} if retry_after is not None else None
+            return web.Response(status=self.option(request, 'throttle_status'), headers=headers, text='Throttled')
+
+        return web.Response(body=self.body(self.option(request, 'size')), content_type='application/octet-stream')
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """
+        Starts serving and returns the base url, port 0 picks a free port.
+        """
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self.handle)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        self.port = self.runner.addresses[0][1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
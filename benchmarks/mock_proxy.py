@@ -0,0 +1,81 @@
+import asyncio
+import random
+
+import aiohttp
+from aiohttp import web
+
+# Hop-by-hop and length headers are handled by each connection on its own and must not be forwarded
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authorization', 'proxy-connection', 'te', 'trailer',
+               'transfer-encoding', 'upgrade', 'content-length', 'host'}
+
+
+class MockProxy:
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: int = None):
+        """
+        Local forwarding proxy for plain http targets, a stand-in for the scraped proxies that can be made slow or
+        flaky. Clients send absolute-form requests (GET http://host/path) like they do with aiohttp's proxy=.
+
+        :param latency: Seconds added before every request is forwarded.
+        :param failure_rate: Share of requests answered with a 502 instead of being forwarded.
+        :param seed: Seed of the random generator so runs inject the same failures.
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.session = None
+        self.runner = None
+        self.port = None
+
+    @staticmethod
+    def forward_headers(headers) -> dict:
+        return {key: value for key, value in headers.items() if key.lower() not in HOP_HEADERS}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+
+        if not request.raw_path.startswith('http://'):
+            return web.Response(status=400, text='Only absolute-form http requests are proxied')
+
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        if self.random.random() < self.failure_rate:
+            return web.Response(status=502, text='Injected proxy failure')
+
+        try:
+            async with self.session.request(request.method, request.raw_path, data=await request.read(),
+                                            headers=self.forward_headers(request.headers)) as upstream:
+                body = await upstream.read()
+                return web.Response(status=upstream.status, body=body,
+                                    headers=self.forward_headers(upstream.headers))
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return web.Response(status=502, text=f"Upstream failed: {e!r}")
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> dict:
+        """
+        Starts serving and returns the proxy as a dictionary like the ones the ProxyManager hands out.
+        """
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0),
+                                             cookie_jar=aiohttp.DummyCookieJar(), auto_decompress=False)
+
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self.handle)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        self.port = self.runner.addresses[0][1]
+        return {'ip': host, 'port': self.port, 'country': 'Local', 'https': 'no', 'rank': 10}
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.mock_origin import MockOrigin
+from benchmarks.mock_proxy import MockProxy
+from benchmarks.scenarios import MOCK_PROXIES, SCENARIOS, run_scenario
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+async def serve(addresses, seed: int):
+    origin = MockOrigin(seed=seed)
+    proxies = {name: MockProxy(seed=seed, **options) for name, options in MOCK_PROXIES.items()}
+
+    origin_url = await origin.start()
+    started = {name: await proxy.start() for name, proxy in proxies.items()}
+    addresses.put((origin_url, started))
+
+    # Serve until the benchmark terminates the process
+    await asyncio.Event().wait()
+
+
+def serve_forever(addresses, seed: int):
+    asyncio.run(serve(addresses, seed))
+
+
+def git_commit() -> [str, None]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(RESULTS_DIR)).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {result['name']: result for result in json.load(f)['results']}
+
+    print(f"\nCompared to {baseline_path}:")
+    for result in results:
+        previous = baseline.get(result['name'])
+        if previous is None:
+            continue
+
+        changes = []
+        for key in ('requests_per_second', 'latency_p95_ms', 'peak_rss_mb'):
+            if previous[key]:
+                changes.append(f"{key} {(result[key] - previous[key]) / previous[key] * 100:+.1f}%")
+        print(f"  {result['name']:<15} " + ', '.join(changes))
+
+
+def print_result(result: dict):
+    print(f"{result['name']:<15} {result['requests_per_second']:>10.1f} req/s  "
+          f"p50 {result['latency_p50_ms']:>8.2f}ms  p95 {result['latency_p95_ms']:>8.2f}ms  "
+          f"p99 {result['latency_p99_ms']:>8.2f}ms  rss {result['peak_rss_mb']:>7.1f}MB  "
+          f"retries {result['retries']:>5}  failed {result['failed']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the load scenarios against a local mock origin and proxies')
+    parser.add_argument('--scenario', action='append', choices=[scenario.name for scenario in SCENARIOS],
+                        help='Scenario to run, can be repeated. Runs all of them if omitted')
+    parser.add_argument('--requests', type=int, help='Override the number of requests of every scenario')
+    parser.add_argument('--concurrency', type=int, help='Override the concurrency of every scenario')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the injected failures')
+    parser.add_argument('--output', type=str, help='Where to write the JSON results, defaults to benchmarks/results')
+    parser.add_argument('--compare', type=str, help='A previous results file to compare the run against')
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenario or scenario.name in args.scenario]
+    for scenario in scenarios:
+        scenario.requests = args.requests or scenario.requests
+        scenario.concurrency = args.concurrency or scenario.concurrency
+
+    context = multiprocessing.get_context('spawn')
+
+    # The mock servers run in their own process so they don't compete with the client for the event loop
+    addresses = context.Queue()
+    server = context.Process(target=serve_forever, args=(addresses, args.seed), daemon=True)
+    server.start()
+
+    try:
+        origin_url, proxies = addresses.get(timeout=30)
+
+        results = []
+        for scenario in scenarios:
+            # A fresh process per scenario, peak RSS is per process and can't be reset
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_scenario, scenario, origin_url, proxies).result()
+
+            print_result(result)
+            results.append(result)
+
+    finally:
+        server.terminate()
+        server.join()
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'timestamp': time.time(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'results': results,
+        }, f, indent=2)
+
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from data_fetcher import fetch_data
+from metrics.metrics import Metrics
+from proxy.proxy_manager import ProxyManager
+from proxy.proxy_store import CsvProxyStore
+from request_generator import HttpMethod, RequestGenerator
+from retry_strategies.backoff import ExponentialBackoff
+from retry_strategies.retry_strategy import RetryStrategy
+
+# The mock proxies started next to the origin, scenarios pick them by name
+MOCK_PROXIES = {
+    'fast_1': {'latency': 0.0, 'failure_rate': 0.0},
+    'fast_2': {'latency': 0.0, 'failure_rate': 0.0},
+    'fast_3': {'latency': 0.0, 'failure_rate': 0.0},
+    'slow': {'latency': 0.2, 'failure_rate': 0.0},
+    'flaky': {'latency': 0.0, 'failure_rate': 0.3},
+}
+
+
+class Scenario:
+    def __init__(self, name: str, description: str, requests: int = 2000, concurrency: int = 100,
+                 origin: dict = None, proxies: list = None, method: HttpMethod = HttpMethod.GET, body: bytes = None,
+                 max_retries: int = 3, backoff_base: float = 0.01):
+        """
+        :param name: Name of the scenario, results are compared by name.
+        :param description: What the scenario exercises.
+        :param requests: Number of requests sent.
+        :param concurrency: Maximum number of requests in flight.
+        :param origin: MockOrigin options for these requests, sent as query parameters.
+        :param proxies: Names of the MOCK_PROXIES to send the requests through, direct requests if omitted.
+        :param method: The HttpMethod of the requests.
+        :param body: Request body sent with every request.
+        :param max_retries: The maximum number of retries per request.
+        :param backoff_base: Base delay of the exponential backoff, kept small so runs stay short.
+        """
+        self.name = name
+        self.description = description
+        self.requests = requests
+        self.concurrency = concurrency
+        self.origin = origin or {}
+        self.proxies = proxies or []
+        self.method = method
+        self.body = body
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+    def build_requests(self, origin_url: str, proxy_manager: ProxyManager) -> list:
+        req_list = []
+        for i in range(self.requests):
+            # A unique query per request, identical GETs would be coalesced into a single request otherwise
+            req = {'url': f"{origin_url}/bench?{urlencode({**self.origin, 'i': i})}", 'message_id': i}
+            if self.body is not None:
+                req['body'] = self.body
+            if self.proxies:
+                req['proxy'] = proxy_manager.get_proxy()
+            req_list.append(req)
+        return req_list
+
+
+SCENARIOS = [
+    Scenario('baseline', 'Small bodies, no latency, no failures: the overhead of the client itself',
+             requests=5000, concurrency=200),
+    Scenario('latency', '50ms origin latency with jitter, throughput is bound by concurrency',
+             requests=2000, concurrency=200, origin={'latency': 0.05, 'jitter': 0.02}),
+    Scenario('large_bodies', '256KB bodies, measures body reading and memory',
+             requests=500, concurrency=50, origin={'size': 256 * 1024}),
+    Scenario('post', 'POSTs with a 4KB body',
+             requests=2000, concurrency=100, method=HttpMethod.POST, body=b'x' * 4096),
+    Scenario('errors', '10% of the requests fail with a 500 and are retried',
+             requests=2000, concurrency=100, origin={'error_rate': 0.1}),
+    Scenario('throttled', '10% of the requests are throttled with a 429 and Retry-After',
+             requests=2000, concurrency=100, origin={'throttle_rate': 0.1, 'retry_after': 0}),
+    Scenario('proxied', 'Requests through healthy proxies',
+             requests=2000, concurrency=100, proxies=['fast_1', 'fast_2', 'fast_3']),
+    Scenario('flaky_proxies', 'Requests through a mix of fast, slow and flaky proxies',
+             requests=1000, concurrency=100, proxies=['fast_1', 'slow', 'flaky']),
+]
+
+
+class TimedRequestGenerator(RequestGenerator):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    async def request(self, *args, **kwargs):
+        # End to end latency of a request, retries and backoff included
+        start = time.perf_counter()
+        try:
+            return await super().request(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def make_proxy_manager(scenario: Scenario, proxies: dict, directory: str) -> ProxyManager:
+    store = CsvProxyStore(os.path.join(directory, 'proxies.csv'))
+    rows = []
+    for name in scenario.proxies:
+        proxy = proxies[name]
+        rows.append((proxy['ip'], proxy['port'], name, proxy['https'], proxy['rank']))
+    store.save(rows)
+
+    return ProxyManager(proxy_list_size=len(rows), store=store)
+
+
+async def run_scenario_async(scenario: Scenario, origin_url: str, proxies: dict) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        proxy_manager = make_proxy_manager(scenario, proxies, directory)
+        retry_strategy = RetryStrategy(max_retries=scenario.max_retries, proxy_manager=proxy_manager,
+                                       backoff=ExponentialBackoff(base=scenario.backoff_base))
+        metrics = Metrics()
+
+        req_list = scenario.build_requests(origin_url, proxy_manager)
+
+        async with TimedRequestGenerator(retry_strategy=retry_strategy, metrics=metrics,
+                                         timeout=10) as generator:
+            start = time.perf_counter()
+            results = await fetch_data(req_list, scenario.method, generator, scenario.concurrency)
+            duration = time.perf_counter() - start
+
+    latencies = sorted(generator.latencies)
+    counters = metrics.snapshot()['counters']
+
+    return {
+        'name': scenario.name,
+        'description': scenario.description,
+        'requests': scenario.requests,
+        'concurrency': scenario.concurrency,
+        'succeeded': sum(result is not None for result in results),
+        'failed': sum(result is None for result in results),
+        'retries': sum(counter['value'] for counter in counters if counter['name'] == 'retries_total'),
+        'duration_seconds': round(duration, 4),
+        'requests_per_second': round(scenario.requests / duration, 2),
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 2),
+    }
+
+
+def run_scenario(scenario: Scenario, origin_url: str, proxies: dict) -> dict:
+    """
+    Runs one scenario against the mock servers. Meant to be run in a fresh process so peak RSS belongs to it alone.
+    """
+    return asyncio.run(run_scenario_async(scenario, origin_url, proxies))
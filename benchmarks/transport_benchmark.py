@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.h2_origin import H2Origin
+from benchmarks.run_benchmarks import RESULTS_DIR, git_commit
+from benchmarks.scenarios import TimedRequestGenerator, peak_rss_mb, percentile
+from data_fetcher import fetch_data
+from proxy.proxy_manager import ProxyManager
+from proxy.proxy_pool import ProxyPool
+from request_generator import HttpMethod
+from retry_strategies.retry_strategy import RetryStrategy
+from sessions.session_pool import SessionPool
+
+# name -> HttpxTransport options, None is the default aiohttp transport
+BACKENDS = {
+    'aiohttp': None,
+    'httpx-http1': {'http2': False},
+    'httpx-h2': {'http2': True, 'http1': False},
+}
+
+
+async def serve(addresses, latency: float, body_size: int):
+    origin = H2Origin(latency=latency, body_size=body_size)
+    addresses.put(await origin.start())
+
+    # Serve until the benchmark terminates the process
+    await asyncio.Event().wait()
+
+
+def serve_forever(addresses, latency: float, body_size: int):
+    asyncio.run(serve(addresses, latency, body_size))
+
+
+def origin_stats(origin_url: str) -> dict:
+    with urllib.request.urlopen(f'{origin_url}/_stats') as response:
+        return json.load(response)
+
+
+async def run_backend_async(backend: str, origin_url: str, requests: int, concurrency: int) -> dict:
+    # Direct requests only
+    proxy_manager = ProxyManager(proxy_list_size=0)
+    proxy_manager.pool = ProxyPool()
+
+    # Every backend may open as many connections as there are requests in flight
+    transports = {}
+    if BACKENDS[backend] is not None:
+        from transports.httpx_transport import HttpxTransport
+        transports[backend] = HttpxTransport(max_connections=concurrency, **BACKENDS[backend])
+
+    req_list = [{'url': f'{origin_url}/bench?i={i}'} for i in range(requests)]
+    retry_strategy = RetryStrategy(max_retries=3, proxy_manager=proxy_manager)
+
+    async with TimedRequestGenerator(retry_strategy=retry_strategy, session_pool=SessionPool(limit=concurrency),
+                                     transports=transports, default_transport=backend, timeout=30) as generator:
+        start = time.perf_counter()
+        results = await fetch_data(req_list, HttpMethod.GET, generator, concurrency)
+        duration = time.perf_counter() - start
+
+    latencies = sorted(generator.latencies)
+    return {
+        'name': backend,
+        'requests': requests,
+        'concurrency': concurrency,
+        'failed': sum(result is None for result in results),
+        'duration_seconds': round(duration, 4),
+        'requests_per_second': round(requests / duration, 2),
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 2),
+    }
+
+
+def run_backend(backend: str, origin_url: str, requests: int, concurrency: int) -> dict:
+    return asyncio.run(run_backend_async(backend, origin_url, requests, concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the transports against a local HTTP/1.1 and h2c origin')
+    parser.add_argument('--backend', action='append', choices=list(BACKENDS),
+                        help='Backend to run, can be repeated. Runs all of them if omitted')
+    parser.add_argument('--requests', type=int, default=5000, help='Number of requests per backend')
+    parser.add_argument('--concurrency', type=int, default=200, help='Maximum number of requests in flight')
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds the origin waits before answering')
+    parser.add_argument('--size', type=int, default=1024, help='Response body size in bytes')
+    parser.add_argument('--output', type=str, help='Where to write the JSON results, defaults to benchmarks/results')
+    args = parser.parse_args()
+
+    # The origin needs h2 and h11 even when only aiohttp is measured
+    if importlib.util.find_spec('httpx') is None or importlib.util.find_spec('h2') is None:
+        parser.error("the benchmark needs httpx with HTTP/2 support: pip install 'httpx[http2]'")
+
+    context = multiprocessing.get_context('spawn')
+
+    # The origin runs in its own process so it doesn't compete with the client for the event loop
+    addresses = context.Queue()
+    server = context.Process(target=serve_forever, args=(addresses, args.latency, args.size), daemon=True)
+    server.start()
+
+    try:
+        origin_url = addresses.get(timeout=30)
+
+        results = []
+        for backend in args.backend or BACKENDS:
+            before = origin_stats(origin_url)['connections']
+            # A fresh process per backend, peak RSS is per process and can't be reset
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_backend, backend, origin_url, args.requests, args.concurrency).result()
+            after = origin_stats(origin_url)['connections']
+
+            # The stats request itself opened one HTTP/1.1 connection
+            result['connections'] = sum(after.values()) - sum(before.values()) - 1
+            results.append(result)
+
+            print(f"{backend:<12} {result['requests_per_second']:>10.1f} req/s  "
+                  f"p50 {result['latency_p50_ms']:>8.2f}ms  p99 {result['latency_p99_ms']:>8.2f}ms  "
+                  f"connections {result['connections']:>5}  rss {result['peak_rss_mb']:>7.1f}MB  "
+                  f"failed {result['failed']}")
+
+    finally:
+        server.terminate()
+        server.join()
+
+    output = args.output or os.path.join(RESULTS_DIR, 'transports-' + time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'timestamp': time.time(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'latency': args.latency,
+            'body_size': args.size,
+            'results': results,
+        }, f, indent=2)
+
+    print(f"\nResults written to {output}")
+
+
+if __name__ == '__main__':
+    main()
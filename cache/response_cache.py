@@ -0,0 +1,424 @@
+import asyncio
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+from logs.Logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def parse_cache_control(value: str) -> dict:
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def parse_http_date(value: str) -> [float, None]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class CachedResponse:
+    __slots__ = ('url', 'body', 'encoding', 'status', 'etag', 'last_modified', 'vary', 'expires_at', 'stored_at')
+
+    def __init__(self, url: str, body: bytes, status: int, etag: str = None, last_modified: str = None, vary=(),
+                 expires_at: float = 0.0, encoding: str = None):
+        self.url = url
+        self.body = body
+        self.encoding = encoding
+        self.status = status
+        self.etag = etag
+        self.last_modified = last_modified
+        self.vary = tuple(vary)
+        self.expires_at = expires_at
+        self.stored_at = time.time()
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    def text(self) -> str:
+        return self.body.decode(self.encoding or 'utf-8', errors='replace')
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validators(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class DiskCache:
+    # Every file is the length of the JSON header, the header and the raw body
+    HEADER_LENGTH = struct.Struct('>I')
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024, max_entries: int = 100000,
+                 sweep_interval: float = 60):
+        """
+        Second cache tier, one file per key holding a JSON header and the raw body, so reading a file never runs
+        code from it. Files are written via rename so readers never see partial files. Unreadable files are
+        treated as misses and removed.
+
+        :param directory: The directory of the files.
+        :param max_bytes: The maximum total size of the files, least recently used ones are removed beyond it.
+        :param max_entries: The maximum number of files.
+        :param sweep_interval: Seconds between two scans for files that passed their delete_at.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        os.makedirs(directory, exist_ok=True)
+
+        # Methods run on executor threads
+        self.lock = threading.Lock()
+        # File name -> (size, delete_at), least recently used first. Built from the directory on first use
+        self.index = None
+        self.size = 0
+        self.swept_at = time.time()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _read(self, name: str) -> tuple:
+        with open(self._path(name), 'rb') as file:
+            data = file.read()
+
+        (length,) = self.HEADER_LENGTH.unpack_from(data)
+        start = self.HEADER_LENGTH.size
+        header = json.loads(data[start:start + length].decode())
+        if not isinstance(header, dict):
+            raise ValueError("Cache file header is not an object")
+        return header, data[start + length:]
+
+    def _build_index(self):
+        if self.index is not None:
+            return
+
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(self._path(name))
+                header, _ = self._read(name)
+                files.append((stat.st_mtime, name, stat.st_size, header.get('delete_at')))
+            except Exception as e:
+                logger.warning("Removing unreadable cache file %s: %r", name, e)
+                self._unlink(name)
+
+        self.index = OrderedDict()
+        for _, name, size, delete_at in sorted(files):
+            self.index[name] = (size, delete_at)
+            self.size += size
+
+        self._cleanup(force=True)
+
+    def _unlink(self, name: str):
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def _forget(self, name: str):
+        size, _ = self.index.pop(name, (0, None))
+        self.size -= size
+        self._unlink(name)
+
+    def _cleanup(self, force: bool = False):
+        now = time.time()
+        if force or now - self.swept_at >= self.sweep_interval:
+            self.swept_at = now
+            for name, (_, delete_at) in list(self.index.items()):
+                if delete_at is not None and delete_at <= now:
+                    self._forget(name)
+
+        while self.index and (len(self.index) > self.max_entries or self.size > self.max_bytes):
+            self._forget(next(iter(self.index)))
+
+    def load(self, key: str) -> [tuple, None]:
+        """
+        Returns the (header, body) stored for the key, None if there is none or it can't be read.
+        """
+        name = self._name(key)
+        with self.lock:
+            self._build_index()
+            if name not in self.index:
+                return None
+
+            try:
+                header, body = self._read(name)
+                if header.get('key') != key:
+                    raise ValueError("Cache file belongs to another key")
+            except Exception as e:
+                logger.warning("Removing unreadable cache file for %s: %r", key, e)
+                self._forget(name)
+                return None
+
+            delete_at = header.get('delete_at')
+            if delete_at is not None and delete_at <= time.time():
+                self._forget(name)
+                return None
+
+            self.index.move_to_end(name)
+            return header, body
+
+    def store(self, key: str, header: dict, body: bytes = b'', delete_at: float = None):
+        """
+        :param key: The cache key.
+        :param header: JSON serializable metadata returned with the body by load.
+        :param body: The raw body.
+        :param delete_at: time.time() after which the file is removed, None keeps it until it is evicted.
+        """
+        name = self._name(key)
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        encoded = json.dumps({**header, 'key': key, 'delete_at': delete_at}).encode()
+        with open(tmp_path, 'wb') as file:
+            file.write(self.HEADER_LENGTH.pack(len(encoded)))
+            file.write(encoded)
+            file.write(body)
+
+        with self.lock:
+            self._build_index()
+            os.replace(tmp_path, path)
+
+            size, _ = self.index.pop(name, (0, None))
+            self.size -= size
+            size = self.HEADER_LENGTH.size + len(encoded) + len(body)
+            self.index[name] = (size, delete_at)
+            self.size += size
+
+            self._cleanup()
+
+    def delete(self, key: str):
+        with self.lock:
+            self._build_index()
+            self._forget(self._name(key))
+
+    def stats(self) -> dict:
+        with self.lock:
+            self._build_index()
+            return {'entries': len(self.index), 'bytes': self.size}
+
+
+class ResponseCache:
+    CACHEABLE_STATUSES = {200}
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, default_ttl: float = 300,
+                 disk_dir: str = None, disk_max_bytes: int = 1024 * 1024 * 1024, disk_max_entries: int = 100000,
+                 max_stale: float = 24 * 3600):
+        """
+        HTTP cache for GET responses with an in-memory LRU tier and an optional on-disk tier.
+
+        Entries are keyed by URL plus the request headers named in the response's Vary header. Cache-Control
+        (no-store, no-cache, max-age) and Expires are honored, responses without them live for `default_ttl`.
+        Stale entries with an ETag or Last-Modified are revalidated with a conditional request.
+
+        :param max_entries: The maximum number of responses kept in memory.
+        :param max_bytes: The maximum total body size kept in memory.
+        :param default_ttl: Seconds a response without caching headers stays fresh.
+        :param disk_dir: Directory of the on-disk tier, None keeps the cache in memory only.
+        :param disk_max_bytes: The maximum total size of the on-disk tier.
+        :param disk_max_entries: The maximum number of responses in the on-disk tier.
+        :param max_stale: Seconds an expired response with an ETag or Last-Modified is kept on disk to be
+                          revalidated, expired responses without them are removed right away.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+        self.disk = DiskCache(disk_dir, disk_max_bytes, disk_max_entries) if disk_dir else None
+
+        self.entries = OrderedDict()
+        self.vary = {}
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    @staticmethod
+    def _header(headers, name: str):
+        if not headers:
+            return None
+        for key, value in headers.items():
+            if key.lower() == name.lower():
+                return value
+        return None
+
+    def make_key(self, url: str, headers: dict, vary=None) -> str:
+        vary = self.vary.get(url, ()) if vary is None else vary
+        values = '\n'.join(f"{name}:{self._header(headers, name) or ''}" for name in vary)
+        return f"GET {url}\n{values}"
+
+    def bypass(self, headers: dict) -> bool:
+        # The caller explicitly asked not to be served from cache
+        directives = parse_cache_control(self._header(headers, 'Cache-Control'))
+        return 'no-store' in directives or 'no-cache' in directives
+
+    async def _run(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+    async def get(self, url: str, headers: dict) -> [CachedResponse, None]:
+        """
+        Returns the cached entry for the request, fresh or stale, or None. Check is_fresh() before serving it.
+        """
+        if url not in self.vary and self.disk is not None:
+            stored = await self._run(self.disk.load, f"VARY {url}")
+            if stored is not None:
+                self.vary[url] = tuple(stored[0].get('vary', ()))
+
+        key = self.make_key(url, headers)
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            self.entries.move_to_end(key)
+        elif self.disk is not None:
+            stored = await self._run(self.disk.load, key)
+            if stored is not None:
+                entry = self._from_disk(*stored)
+                if entry is not None:
+                    self._remember(key, entry)
+
+        return entry
+
+    def record_hit(self, revalidated: bool = False):
+        self.hits += 1
+        if revalidated:
+            self.revalidations += 1
+
+    def record_miss(self):
+        self.misses += 1
+
+    def _expires_at(self, response_headers) -> [float, None]:
+        directives = parse_cache_control(self._header(response_headers, 'Cache-Control'))
+
+        if 'no-store' in directives:
+            return None
+
+        now = time.time()
+        if 'no-cache' in directives:
+            # Store it but revalidate before every use
+            return now
+
+        if directives.get('max-age') is not None:
+            try:
+                return now + int(directives['max-age'])
+            except ValueError:
+                pass
+
+        expires = parse_http_date(self._header(response_headers, 'Expires'))
+        if expires is not None:
+            return expires
+
+        return now + self.default_ttl
+
+    async def store(self, url: str, request_headers: dict, status: int, response_headers, body: bytes,
+                    encoding: str = None):
+        if status not in self.CACHEABLE_STATUSES:
+            return
+
+        expires_at = self._expires_at(response_headers)
+        if expires_at is None:
+            return
+
+        vary_header = self._header(response_headers, 'Vary') or ''
+        if vary_header.strip() == '*':
+            return
+
+        vary = tuple(sorted(name.strip().lower() for name in vary_header.split(',') if name.strip()))
+        if self.vary.get(url) != vary:
+            self.vary[url] = vary
+            if self.disk is not None:
+                await self._run(self.disk.store, f"VARY {url}", {'vary': list(vary)})
+
+        entry = CachedResponse(url, body, status, self._header(response_headers, 'ETag'),
+                               self._header(response_headers, 'Last-Modified'), vary, expires_at, encoding)
+        key = self.make_key(url, request_headers, vary)
+        self._remember(key, entry)
+
+        if self.disk is not None:
+            await self._store_on_disk(key, entry)
+
+    async def refresh(self, url: str, request_headers: dict, entry: CachedResponse, response_headers):
+        """
+        Extends a stale entry after the origin answered 304 Not Modified.
+        """
+        expires_at = self._expires_at(response_headers)
+        if expires_at is None:
+            return
+
+        entry.expires_at = expires_at
+        entry.etag = self._header(response_headers, 'ETag') or entry.etag
+        entry.last_modified = self._header(response_headers, 'Last-Modified') or entry.last_modified
+
+        if self.disk is not None:
+            await self._store_on_disk(self.make_key(url, request_headers, entry.vary), entry)
+
+    async def _store_on_disk(self, key: str, entry: CachedResponse):
+        header = {'url': entry.url, 'status': entry.status, 'etag': entry.etag,
+                  'last_modified': entry.last_modified, 'vary': list(entry.vary), 'expires_at': entry.expires_at,
+                  'encoding': entry.encoding, 'stored_at': entry.stored_at}
+        # Stale entries are only worth keeping while they can be revalidated
+        delete_at = entry.expires_at + self.max_stale if entry.validators() else entry.expires_at
+        await self._run(self.disk.store, key, header, entry.body, delete_at)
+
+    @staticmethod
+    def _from_disk(header: dict, body: bytes) -> [CachedResponse, None]:
+        try:
+            entry = CachedResponse(header['url'], body, int(header['status']), header.get('etag'),
+                                   header.get('last_modified'), header.get('vary', ()),
+                                   float(header['expires_at']), header.get('encoding'))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning("Ignoring malformed cached response: %r", e)
+            return None
+
+        entry.stored_at = header.get('stored_at', entry.stored_at)
+        return entry
+
+    def _remember(self, key: str, entry: CachedResponse):
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous.size
+
+        if entry.size > self.max_bytes:
+            return
+
+        self.entries[key] = entry
+        self.size += entry.size
+
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+            'bytes': self.size,
+        }
@@ -0,0 +1,55 @@
+import asyncio
+
+
+class _Call:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls: while a call for a key is running, later callers with the same key await
+    the same task instead of starting their own, and all of them get the same result object.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(method: str, url: str, headers: dict = None, cookies: dict = None, *extra) -> tuple:
+        headers = tuple(sorted((str(name).lower(), str(value)) for name, value in (headers or {}).items()))
+        cookies = tuple(sorted((str(name), str(value)) for name, value in (cookies or {}).items()))
+        return (method, url, headers, cookies) + extra
+
+    def _forget(self, key, call: _Call):
+        if self.calls.get(key) is call:
+            del self.calls[key]
+
+    async def do(self, key, function):
+        """
+        :param key: Identifies the call, see make_key.
+        :param function: A zero argument coroutine function, only called if no call for the key is in flight.
+        """
+        call = self.calls.get(key)
+
+        if call is None:
+            call = _Call(asyncio.ensure_future(function()))
+            self.calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # Shielded so one caller being cancelled doesn't cancel the request for everybody else
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Forget it right away, a new caller must not join a task that is being cancelled
+                self._forget(key, call)
+                call.task.cancel()
@@ -1,47 +1,151 @@
 import asyncio
 import json
-from enum import Enum
-from typing import Callable
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Tuple, Union
 
-from request_generator import RequestGenerator
+from request_generator import HttpMethod, RequestGenerator, ResponseMode
+from scheduling.request_scheduler import Priority
 
 from logs.Logger import get_logger
 
 logger = get_logger(__name__)
 
 
-class HttpMethod(Enum):
-    GET = 'GET'
-    POST = 'POST'
-    PUT = 'PUT'
-    DELETE = 'DELETE'
+def start_request(generator: RequestGenerator, method: [HttpMethod, None], req: dict,
+                  options: dict) -> asyncio.Future:
+    """
+    Starts a request task. A request may carry its own 'method', which wins over the batch method, so GETs, POSTs,
+    PUTs, ... can be mixed in a single batch. 'body' is accepted as an alias of 'data' like in RequestGenerator.post.
+    The same goes for the batch options, e.g. a request's own 'priority' wins over the batch priority.
+    """
+    req = dict(req)
+    req_method = req.pop('method', None) or method
+    if req_method is None:
+        raise ValueError(f"No method given for request {req}")
+
+    if 'body' in req:
+        req['data'] = req.pop('body')
+
+    return asyncio.ensure_future(generator.request(req_method, **{**options, **req}))
+
+
+async def iterate_requests(req_list: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    if hasattr(req_list, '__aiter__'):
+        async for req in req_list:
+            yield req
+    else:
+        for req in req_list:
+            yield req
+
+
+async def stream_data(req_list: Union[Iterable, AsyncIterable], method: [HttpMethod, None],
+                      generator: RequestGenerator, concurrency: int = 100, ordered: bool = False,
+                      stream_parser: Callable = None, priority: Priority = None, tenant: str = None,
+                      transport: str = None) -> AsyncIterator[Tuple[dict, object]]:
+    """
+    Runs the requests with at most `concurrency` of them in flight and yields (request, result) pairs.
+
+    Requests are pulled from the (async) iterable lazily, a new one is only started once a finished result has been
+    handed to the consumer, so a slow consumer slows down fetching instead of piling up results in memory.
+
+    :param req_list: An iterable or async iterable of request kwargs for the generator method.
+    :param method: The HttpMethod of the requests that don't have a 'method' of their own.
+    :param generator: The RequestGenerator that sends the requests.
+    :param concurrency: The maximum number of requests in flight (and buffered results in ordered mode).
+    :param ordered: Yield results in input order instead of completion order.
+    :param stream_parser: A callable returning a new StreamParser. If given, bodies are parsed chunk by chunk while
+                          they are downloaded and the parse results are yielded instead of the bodies.
+    :param priority: The Priority of the requests for the generator's scheduler, e.g. Priority.BULK for a backfill.
+    :param tenant: The tenant or job the requests belong to, the scheduler shares its slots fairly between tenants.
+    :param transport: Name of the generator transport the batch is sent with, e.g. an HTTP/2 one for a chatty API.
+    """
+    options = {'mode': ResponseMode.STREAM, 'stream_parser': stream_parser} if stream_parser else {}
+    if priority is not None:
+        options['priority'] = priority
+    if tenant is not None:
+        options['tenant'] = tenant
+    if transport is not None:
+        options['transport'] = transport
+
+    requests = iterate_requests(req_list)
+    # Ordered mode keeps (request, task) pairs in input order, otherwise tasks are mapped back to their request
+    pending = deque() if ordered else {}
+    exhausted = False
+
+    async def fill():
+        nonlocal exhausted
+        while not exhausted and len(pending) < concurrency:
+            try:
+                req = await requests.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+                break
+
+            task = start_request(generator, method, req, options)
+
+            if ordered:
+                pending.append((req, task))
+            else:
+                pending[task] = req
+
+    try:
+        await fill()
+
+        while pending:
+            if ordered:
+                req, task = pending.popleft()
+                result = await task
+                yield req, result
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield pending.pop(task), task.result()
+
+            await fill()
+
+    finally:
+        # The consumer stopped early or something failed, don't leave orphaned requests running
+        tasks = [task for _, task in pending] if ordered else list(pending)
+        for task in tasks:
+            task.cancel()
 
 
 # Use request generator to fetch data from the API
-async def fetch_data(req_list: list, method: HttpMethod, generator: RequestGenerator) -> tuple:
-    coroutines = []
-
-    if method == HttpMethod.GET:
-        coroutines = [generator.get(**req) for req in req_list]
-
-    elif method == HttpMethod.POST:
-        coroutines = [generator.post(**req) for req in req_list]
-
-    elif method == HttpMethod.PUT:
-        logger.warning("PUT method is not implemented yet.")
-
-    elif method == HttpMethod.DELETE:
-        logger.warning("DELETE method is not implemented yet.")
-
-    return await asyncio.gather(*coroutines)
+async def fetch_data(req_list: list, method: HttpMethod, generator: RequestGenerator, concurrency: int = 100,
+                     stream_parser: Callable = None, priority: Priority = None, tenant: str = None,
+                     transport: str = None) -> list:
+    return [result async for _, result in stream_data(req_list, method, generator, concurrency, ordered=True,
+                                                      stream_parser=stream_parser, priority=priority, tenant=tenant,
+                                                      transport=transport)]
 
 
 async def parse_requests(req_list: list, parser: Callable, method: HttpMethod,
-                         generator: RequestGenerator) -> tuple:
+                         generator: RequestGenerator, concurrency: int = 100, stream_parser: Callable = None) -> tuple:
     # Wait for the responses to come back
-    responses = await fetch_data(req_list, method, generator)
+    responses = await fetch_data(req_list, method, generator, concurrency, stream_parser)
 
     # It uses special parsers to parse the responses. Check out the parsers in utils/parsers.py
     results = parser(responses)
 
     return results
+
+
+async def stream_parse_requests(req_list: Union[Iterable, AsyncIterable], parser: Callable, method: HttpMethod,
+                                generator: RequestGenerator, concurrency: int = 100, chunk_size: int = 100,
+                                ordered: bool = False, stream_parser: Callable = None) -> AsyncIterator:
+    """
+    Streaming version of parse_requests, the parser is called with chunks of at most `chunk_size` responses as soon
+    as they are available and every parsed chunk is yielded. With a stream_parser the parser gets the stream parse
+    results instead of the response bodies.
+    """
+    responses = []
+
+    async for _, response in stream_data(req_list, method, generator, concurrency, ordered, stream_parser):
+        responses.append(response)
+
+        if len(responses) >= chunk_size:
+            yield parser(responses)
+            responses = []
+
+    if responses:
+        yield parser(responses)
@@ -0,0 +1,64 @@
+from metrics.rolling_quantile import RollingQuantile
+
+
+class HedgePolicy:
+    def __init__(self, quantile: float = 0.95, window: int = 500, min_samples: int = 20, min_delay: float = 0.05,
+                 max_delay: float = None, default_delay: float = None, max_ratio: float = 0.1,
+                 methods: tuple = ('GET', 'HEAD')):
+        """
+        Decides when a slow request gets a hedged duplicate through another proxy. The delay is a rolling latency
+        quantile of the host, so only the slowest requests are hedged, and hedges are capped to a share of the
+        requests so they can't double the load when a host is slow for everybody.
+
+        :param quantile: Requests still running after this latency quantile of their host are hedged, 0.95 is p95.
+        :param window: Number of recent latencies per host the quantile is computed from.
+        :param min_samples: Hosts with fewer latencies use default_delay.
+        :param min_delay: Lower bound of the delay in seconds, so fast hosts don't get hedged on every hiccup.
+        :param max_delay: Upper bound of the delay in seconds, no bound if omitted.
+        :param default_delay: Delay for hosts without enough latencies, no hedging until then if omitted.
+        :param max_ratio: Maximum share of the requests that are hedged, 0.1 means at most one hedge per ten requests.
+        :param methods: The HTTP methods that are hedged, only idempotent ones should be.
+        """
+        self.quantile = quantile
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.max_ratio = max_ratio
+        self.methods = set(methods)
+
+        self.hosts = {}
+        # Every request deposits max_ratio tokens and every hedge spends one, a few hedges can be saved up
+        self.tokens = 0.0
+        self.max_tokens = max(max_ratio * 100, 1)
+
+    def applies(self, method: str) -> bool:
+        return method in self.methods
+
+    def record(self, host: str, latency: float):
+        latencies = self.hosts.get(host)
+        if latencies is None:
+            latencies = self.hosts[host] = RollingQuantile(self.quantile, self.window)
+
+        latencies.add(latency)
+
+    def delay(self, host: str) -> [float, None]:
+        """
+        Seconds to wait for a request to `host` before hedging it, None means don't hedge.
+        """
+        latencies = self.hosts.get(host)
+        if latencies is None or len(latencies) < self.min_samples:
+            return self.default_delay
+
+        delay = max(latencies.get(), self.min_delay)
+        return min(delay, self.max_delay) if self.max_delay is not None else delay
+
+    def record_request(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.max_ratio)
+
+    def try_hedge(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
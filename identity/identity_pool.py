@@ -0,0 +1,219 @@
+import asyncio
+import time
+from typing import Callable, Union
+
+import aiohttp
+
+from logs.Logger import get_logger
+from proxy.proxy_manager import ProxyManager
+
+logger = get_logger(__name__)
+
+# Header profiles of common browsers, every identity gets one of them
+DEFAULT_PROFILES = [
+    {
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Accept-Language": "en-US,en;q=0.9",
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                      "Chrome/106.0.0.0 Safari/537.36",
+    },
+    {
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Accept-Language": "en-US,en;q=0.5",
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:106.0) Gecko/20100101 Firefox/106.0",
+    },
+    {
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Encoding": "gzip, deflate, br",
+        "Accept-Language": "en-GB,en;q=0.9",
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+                      "Version/16.1 Safari/605.1.15",
+    },
+]
+
+# Lowercase snippets of challenge and block pages served with a 200
+DEFAULT_BLOCK_MARKERS = ('captcha', 'cf-chl-', 'unusual traffic', 'access denied', 'are you a robot')
+
+
+class Identity:
+    __slots__ = ('host', 'headers', 'cookies', 'proxy', 'warm', 'uses', 'last_used')
+
+    def __init__(self, host: str, headers: dict, proxy=None, warm: bool = False):
+        """
+        A client identity for one host: a header profile, the cookies the host gave it and the proxy it is pinned
+        to, so the origin keeps seeing the same client on the same address.
+        """
+        self.host = host
+        self.headers = headers
+        self.cookies = {}
+        self.proxy = proxy
+        self.warm = warm
+        self.uses = 0
+        self.last_used = 0.0
+
+
+class IdentityPool:
+    def __init__(self, profiles: list = None, size: int = 10, warm_url: Union[str, Callable[[str], str]] = None,
+                 warm_timeout: float = 10, block_statuses=(403,), block_markers=DEFAULT_BLOCK_MARKERS,
+                 max_uses: int = None, proxy_manager: ProxyManager = None):
+        """
+        Keeps up to `size` identities per host and hands out the least recently used one. Identities that get
+        blocked are retired and replaced, replacements are warmed up in the background so a warm one is ready.
+
+        :param profiles: Header profiles (dictionaries of headers) the identities are created from.
+        :param size: Number of identities per host.
+        :param warm_url: A url or a callable taking the host and returning one, requested by every new identity in
+                         the background to collect its cookies. Identities are used right away if omitted.
+        :param warm_timeout: Total timeout of a warm-up request in seconds.
+        :param block_statuses: Response statuses that mean the identity is blocked.
+        :param block_markers: Lowercase snippets of a body that mean the identity got a block or captcha page.
+        :param max_uses: Retire identities after this many requests, never if omitted.
+        :param proxy_manager: The ProxyManager new identities get their proxy from, the RequestGenerator sets its
+                              retry strategy's one if omitted. Identities go direct when there are no proxies.
+        """
+        self.profiles = profiles or DEFAULT_PROFILES
+        self.size = size
+        self.warm_url = warm_url
+        self.warm_timeout = warm_timeout
+        self.block_statuses = set(block_statuses)
+        self.block_markers = tuple(block_markers)
+        self.max_uses = max_uses
+        self.proxy_manager = proxy_manager
+
+        self.hosts = {}
+        self.created = 0
+        self.session_pool = None
+        self.ssl = None
+        self.warmups = set()
+
+    def bind(self, session_pool, proxy_manager: ProxyManager = None, ssl=None):
+        """
+        Called by the RequestGenerator, warm-up requests go through its session pool.
+        """
+        self.session_pool = session_pool
+        self.ssl = ssl
+        if self.proxy_manager is None:
+            self.proxy_manager = proxy_manager
+
+    def _pick_proxy(self, host: str):
+        if self.proxy_manager is None:
+            return None
+        try:
+            return self.proxy_manager.get_other_proxy(None, host)
+        except LookupError:
+            return None
+
+    def _create(self, host: str) -> Identity:
+        profile = self.profiles[self.created % len(self.profiles)]
+        self.created += 1
+
+        identity = Identity(host, dict(profile), self._pick_proxy(host), warm=self.warm_url is None)
+        if not identity.warm:
+            self._start_warmup(identity)
+        return identity
+
+    def acquire(self, host: str, exclude: Identity = None) -> Identity:
+        """
+        Picks the identity for the next request to `host`, warm ones first.
+
+        :param host: The target host.
+        :param exclude: An identity not to pick, e.g. the one the request is already using.
+        """
+        identities = self.hosts.get(host)
+        if identities is None:
+            identities = self.hosts[host] = []
+
+        while len(identities) < self.size:
+            identities.append(self._create(host))
+
+        candidates = [identity for identity in identities if identity.warm and identity is not exclude]
+        if not candidates:
+            candidates = [identity for identity in identities if identity is not exclude] or identities
+
+        identity = min(candidates, key=lambda candidate: candidate.last_used)
+        identity.last_used = time.monotonic()
+        identity.uses += 1
+
+        if self.max_uses is not None and identity.uses >= self.max_uses:
+            # Used for this request one last time, its replacement starts warming up now
+            self.retire(identity)
+
+        return identity
+
+    def retire(self, identity: Identity):
+        identities = self.hosts.get(identity.host, [])
+        if identity in identities:
+            identities.remove(identity)
+            identities.append(self._create(identity.host))
+
+    def rotate(self, identity: Identity) -> Identity:
+        """
+        Retires a blocked identity and returns another one for the retry.
+        """
+        logger.info("Rotating identity for %s", identity.host)
+        self.retire(identity)
+        return self.acquire(identity.host, exclude=identity)
+
+    @staticmethod
+    def update_cookies(identity: Identity, cookies):
+        # cookies is the SimpleCookie of the response's Set-Cookie headers
+        for name, morsel in cookies.items():
+            if morsel['max-age'] == '0':
+                identity.cookies.pop(name, None)
+            else:
+                identity.cookies[name] = morsel.value
+
+    def is_blocked_status(self, status: int) -> bool:
+        return status in self.block_statuses
+
+    def is_blocked_body(self, body, content_type: str = 'text/html') -> bool:
+        # Only html pages are checked, the markers could just as well be data in a json or text response
+        if not self.block_markers or content_type != 'text/html' or not isinstance(body, (str, bytes)):
+            return False
+
+        # Block pages are small, looking at the start of the body is enough
+        head = body[:16 * 1024]
+        text = (head.decode('latin-1') if isinstance(head, bytes) else head).lower()
+        return any(marker in text for marker in self.block_markers)
+
+    def _start_warmup(self, identity: Identity):
+        try:
+            task = asyncio.get_running_loop().create_task(self._warm(identity))
+        except RuntimeError:
+            # No event loop yet, the identity is used cold
+            identity.warm = True
+            return
+
+        self.warmups.add(task)
+        task.add_done_callback(self.warmups.discard)
+
+    async def _warm(self, identity: Identity):
+        url = self.warm_url(identity.host) if callable(self.warm_url) else self.warm_url
+        proxy_str = ProxyManager.proxy_to_string(identity.proxy)
+
+        session = self.session_pool.acquire(proxy_str)
+        try:
+            async with session.get(url, headers=identity.headers, cookies=identity.cookies, proxy=proxy_str,
+                                   ssl=self.ssl, timeout=aiohttp.ClientTimeout(total=self.warm_timeout)) as response:
+                await response.read()
+                self.update_cookies(identity, response.cookies)
+
+                # Retiring it here could loop through identities without end, a real request rotates it instead
+                if self.is_blocked_status(response.status):
+                    logger.warning("Identity for %s was blocked while warming up", identity.host)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Warming up identity for %s failed: %r", identity.host, e)
+
+        finally:
+            self.session_pool.release(proxy_str)
+
+        # A failed warm-up still leaves a usable, if cold, identity
+        identity.warm = True
+
+    async def close(self):
+        for task in list(self.warmups):
+            task.cancel()
+        await asyncio.gather(*self.warmups, return_exceptions=True)
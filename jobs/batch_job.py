@@ -0,0 +1,94 @@
+from typing import Callable
+
+from data_fetcher import stream_data
+from jobs.checkpoint import Checkpoint
+from jobs.request_queue import RequestQueue
+from jobs.result_sink import ResultSink
+from logs.Logger import get_logger
+from request_generator import HttpMethod, RequestGenerator
+
+logger = get_logger(__name__)
+
+
+class BatchJob:
+    def __init__(self, queue: RequestQueue, checkpoint: Checkpoint, sink: ResultSink, method: [HttpMethod, None],
+                 generator: RequestGenerator, concurrency: int = 100, flush_every: int = 100,
+                 stream_parser: Callable = None):
+        """
+        A resumable batch of requests. Requests already recorded in the checkpoint are skipped, the others are
+        streamed through the generator and their results written to the sink as they complete.
+
+        Results are flushed before the checkpoint, so a crash can only make a request run twice (and its result show
+        up twice in the sink), never lose it. Failed requests (None results) are neither written nor checkpointed,
+        they are tried again on the next run.
+
+        :param queue: The RequestQueue the requests are read from.
+        :param checkpoint: The Checkpoint recording completed message_ids.
+        :param sink: The ResultSink the results are written to.
+        :param method: The HttpMethod of the requests that don't have a 'method' of their own.
+        :param generator: The RequestGenerator that sends the requests.
+        :param concurrency: The maximum number of requests in flight.
+        :param flush_every: Flush the sink and the checkpoint after this many completed requests.
+        :param stream_parser: A callable returning a new StreamParser, see stream_data.
+        """
+        self.queue = queue
+        self.checkpoint = checkpoint
+        self.sink = sink
+        self.method = method
+        self.generator = generator
+        self.concurrency = concurrency
+        self.flush_every = flush_every
+        self.stream_parser = stream_parser
+
+    def pending_requests(self, completed: set, counts: dict):
+        """
+        Yields the requests of the queue that aren't in `completed`, counting the others as skipped in `counts`.
+        """
+        for req in self.queue:
+            if str(req['message_id']) in completed:
+                counts['skipped'] += 1
+            else:
+                yield req
+
+    def flush(self):
+        self.sink.flush()
+        self.checkpoint.flush()
+
+    async def run(self) -> dict:
+        """
+        Runs (or resumes) the job and returns the number of completed, failed and skipped requests of this run.
+        """
+        completed = self.checkpoint.load()
+        counts = {'completed': 0, 'failed': 0, 'skipped': 0}
+
+        # The ids of earlier runs are only needed to filter the queue, new ones are just appended to the log
+        requests = self.pending_requests(completed, counts)
+        unflushed = 0
+
+        try:
+            async for req, result in stream_data(requests, self.method, self.generator, self.concurrency,
+                                                 stream_parser=self.stream_parser):
+                if result is None:
+                    counts['failed'] += 1
+                    continue
+
+                self.sink.write(req, result)
+                self.checkpoint.mark(req['message_id'])
+                counts['completed'] += 1
+
+                unflushed += 1
+                if unflushed >= self.flush_every:
+                    self.flush()
+                    unflushed = 0
+
+        finally:
+            # Whatever finished before a failure or cancellation is kept
+            self.flush()
+
+        logger.info("Job finished: %s completed, %s failed, %s skipped", counts['completed'], counts['failed'],
+                    counts['skipped'])
+        return counts
+
+    def close(self):
+        self.sink.close()
+        self.checkpoint.close()
@@ -0,0 +1,83 @@
+import os
+
+from logs.Logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def open_for_append(filepath: str):
+    """
+    Opens a line based file for appending, creating its directory if needed. Starts on a fresh line in case the last
+    run died in the middle of writing one.
+    """
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    file = open(filepath, 'a')
+    if file.tell() > 0:
+        with open(filepath, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                file.write('\n')
+    return file
+
+
+class Checkpoint:
+    def __init__(self, filepath: str, fsync: bool = False):
+        """
+        Append-only log of completed message_ids, one per line. Nothing is ever rewritten, so a crash can at most
+        lose the ids that weren't flushed yet and those requests are simply done again on resume. Ids are buffered
+        by mark() and written by flush(), the owner decides when so it can flush its results first.
+
+        :param filepath: The checkpoint file, created if missing.
+        :param fsync: Also fsync on every flush, survives power loss at the cost of a disk round trip.
+        """
+        self.filepath = filepath
+        self.fsync = fsync
+        self.pending = []
+        self.file = None
+
+    def load(self) -> set:
+        """
+        Reads the message_ids completed by earlier runs, as strings.
+        """
+        completed = set()
+        try:
+            with open(self.filepath, 'r') as f:
+                for line in f:
+                    # A line without a newline was cut off by a crash and might be the prefix of another id
+                    if line.endswith('\n'):
+                        completed.add(line[:-1])
+        except FileNotFoundError:
+            pass
+
+        logger.info("Loaded %s completed message ids from %s", len(completed), self.filepath)
+        return completed
+
+    def open(self):
+        if self.file is not None:
+            return
+
+        self.file = open_for_append(self.filepath)
+
+    def mark(self, message_id):
+        self.pending.append(str(message_id))
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        self.open()
+        self.file.write('\n'.join(self.pending) + '\n')
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
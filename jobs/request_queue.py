@@ -0,0 +1,95 @@
+import json
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator
+
+
+class RequestQueue(ABC):
+    """
+    A file-backed source of request dicts (the kwargs of RequestGenerator.request plus an optional 'method').
+    Requests are read lazily, in the same order on every run, and every request gets a stable 'message_id' so a
+    checkpoint can tell which of them are done.
+    """
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[dict]:
+        pass
+
+
+class JsonlRequestQueue(RequestQueue):
+    def __init__(self, filepath: str):
+        """
+        One JSON object per line. Lines without a 'message_id' get their line number, so the file must not be
+        reordered between a run and its resume.
+        """
+        self.filepath = filepath
+
+    def __iter__(self) -> Iterator[dict]:
+        with open(self.filepath, 'r') as f:
+            for line_number, line in enumerate(f):
+                if not line.strip():
+                    continue
+
+                req = json.loads(line)
+                req.setdefault('message_id', line_number)
+                yield req
+
+
+class SqliteRequestQueue(RequestQueue):
+    def __init__(self, filepath: str, page_size: int = 1000):
+        """
+        Requests stored in a SQLite table, read page by page so only one page is in memory at a time.
+
+        :param filepath: The database file.
+        :param page_size: Number of requests read per query.
+        """
+        self.filepath = filepath
+        self.page_size = page_size
+
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(filepath, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS requests (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                'message_id TEXT UNIQUE, request TEXT NOT NULL)')
+
+    def put(self, requests: Iterable[dict]):
+        """
+        Adds requests to the queue. Requests without a 'message_id' get their row id, requests whose message_id is
+        already queued are ignored so a producer can safely be rerun.
+        """
+        self.connection.execute('BEGIN')
+        try:
+            for req in requests:
+                message_id = req.get('message_id')
+                cursor = self.connection.execute('INSERT OR IGNORE INTO requests (message_id, request) VALUES (?, ?)',
+                                                 (None if message_id is None else str(message_id), json.dumps(req)))
+                if message_id is None and cursor.rowcount:
+                    self.connection.execute('UPDATE requests SET message_id = id WHERE id = ?', (cursor.lastrowid,))
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM requests').fetchone()[0]
+
+    def __iter__(self) -> Iterator[dict]:
+        last_id = 0
+        while True:
+            # Keyset pagination, OFFSET would scan all the skipped rows again for every page
+            rows = self.connection.execute('SELECT id, message_id, request FROM requests WHERE id > ? ORDER BY id '
+                                           'LIMIT ?', (last_id, self.page_size)).fetchall()
+            if not rows:
+                return
+
+            for last_id, message_id, request in rows:
+                req = json.loads(request)
+                req['message_id'] = message_id
+                yield req
+
+    def close(self):
+        self.connection.close()
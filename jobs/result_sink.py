@@ -0,0 +1,60 @@
+import base64
+import json
+import os
+from abc import ABC, abstractmethod
+
+from jobs.checkpoint import open_for_append
+
+
+class ResultSink(ABC):
+    """
+    Where the results of a batch job are written as they come in, so they never have to be held in memory.
+    """
+
+    @abstractmethod
+    def write(self, req: dict, result):
+        pass
+
+    @abstractmethod
+    def flush(self):
+        """
+        Makes everything written so far durable, called before the checkpoint records the requests as done.
+        """
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+
+class JsonlResultSink(ResultSink):
+    def __init__(self, filepath: str, fsync: bool = False):
+        """
+        Appends one {"message_id", "url", "result"} object per line. Byte results (ResponseMode.BYTES) are stored
+        base64 encoded with "encoding": "base64", anything else has to be JSON serializable.
+
+        :param filepath: The output file, appended to so a resumed job continues the same file.
+        :param fsync: Also fsync on every flush.
+        """
+        self.filepath = filepath
+        self.fsync = fsync
+
+        self.file = open_for_append(filepath)
+
+    def write(self, req: dict, result):
+        entry = {'message_id': req.get('message_id'), 'url': req.get('url'), 'result': result}
+        if isinstance(result, bytes):
+            entry['result'] = base64.b64encode(result).decode('ascii')
+            entry['encoding'] = 'base64'
+
+        self.file.write(json.dumps(entry) + '\n')
+
+    def flush(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
@@ -1,3 +1,4 @@
+import json
 import logging
 import time
 
@@ -24,12 +25,55 @@ class CoolFormatter(logging.Formatter):
         "CRITICAL": COLOR_CODES["BOLD"] + COLOR_CODES["RED"]
     }
 
+    # The colored pieces only depend on the level and the logger name, so they are built once
+    COLORED_LEVEL_NAMES = {}
+    for level_name, color in LEVEL_TO_COLOR.items():
+        COLORED_LEVEL_NAMES[level_name] = color + level_name + COLOR_CODES["END"]
+    del level_name, color
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.colored_names = {}
+        self.last_second = None
+        self.last_timestamp = None
+
+    def get_timestamp(self, created: float) -> str:
+        # Many records share the same second, only call strftime when it changes
+        second = int(created)
+        if second != self.last_second:
+            self.last_timestamp = (self.COLOR_CODES['GREY'] + time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+                                   + self.COLOR_CODES['END'])
+            self.last_second = second
+        return self.last_timestamp
+
     def format(self, record):
         level_name = record.levelname
-        colored_level_name = self.LEVEL_TO_COLOR.get(level_name, "") + level_name + self.COLOR_CODES["END"]
-        colored_name = self.COLOR_CODES["MAGENTA"] + record.name + self.COLOR_CODES["END"]
+        colored_level_name = self.COLORED_LEVEL_NAMES.get(level_name, level_name)
+
+        colored_name = self.colored_names.get(record.name)
+        if colored_name is None:
+            colored_name = self.COLOR_CODES["MAGENTA"] + record.name + self.COLOR_CODES["END"]
+            self.colored_names[record.name] = colored_name
 
         message = super().format(record)
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
 
-        return f"{self.COLOR_CODES['GREY']}{timestamp}{self.COLOR_CODES['END']} - {colored_level_name} - {colored_name} - {message}"
+        return f"{self.get_timestamp(record.created)} - {colored_level_name} - {colored_name} - {message}"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Writes every record as one JSON object per line, for log shippers that parse structured logs.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
@@ -1,25 +1,53 @@
+import atexit
 import logging
 import os
+import queue
 import sys
-from logging.handlers import TimedRotatingFileHandler
+import threading
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 
-from logs.CustomFormatter import CoolFormatter
-from dotenv import load_dotenv
+from logs.CustomFormatter import CoolFormatter, JsonFormatter
 
-# Load the .env file
-load_dotenv()
+FILE_FORMATTER = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+FORMATTER = CoolFormatter()
 
-ROOT_DIR = os.getenv('ROOT_DIR')
-LOG_DIR = os.path.join(ROOT_DIR, 'logs')
 
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
+def get_log_level(level_name: str) -> int:
+    level = logging.getLevelName(level_name.upper())
+    return level if isinstance(level, int) else logging.WARNING
 
-LOG_FILE = os.path.join(LOG_DIR, 'log_history/logs.log')
 
-FILE_FORMATTER = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-FORMATTER = CoolFormatter()
+def load_env():
+    # .env support is optional, nothing is read until logging is configured
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler for a listener in the same process. The stock handler formats the record before queueing it, so the
+    message would still be built on the event loop. Records don't have to be pickled here, so they are queued as they
+    are and all the formatting happens on the listener thread.
+    """
+
+    def __init__(self, queue, singleton: 'LoggerSingleton'):
+        super().__init__(queue)
+        self.singleton = singleton
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        # Logging that was never configured explicitly is set up from the environment by the first record
+        if self.singleton.listener is None:
+            with self.singleton.lock:
+                if self.singleton.listener is None:
+                    self.singleton.configure()
+        self.queue.put_nowait(record)
 
 
 class LoggerSingleton:
@@ -33,28 +61,82 @@ class LoggerSingleton:
 
     def __init__(self):
         self.loggers = {}
+        self.level = get_log_level(os.getenv('LOG_LEVEL', 'WARNING'))
 
-    def get_console_handler(self):
+        # Every logger only puts records on the queue, the listener thread writes them to the shared handlers
+        self.queue = queue.SimpleQueue()
+        self.queue_handler = LocalQueueHandler(self.queue, self)
+        self.listener = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_console_handler(formatter: logging.Formatter):
         console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setFormatter(FORMATTER)
+        console_handler.setFormatter(formatter)
         return console_handler
 
-    def get_file_handler(self):
-        file_handler = TimedRotatingFileHandler(LOG_FILE, when='midnight')
-        file_handler.setFormatter(FILE_FORMATTER)
+    @staticmethod
+    def get_file_handler(log_file: str, formatter: logging.Formatter):
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+
+        file_handler = TimedRotatingFileHandler(log_file, when='midnight')
+        file_handler.setFormatter(formatter)
         return file_handler
 
+    def configure(self, level: str = None, log_format: str = None, log_dir: str = None, console: bool = True):
+        """
+        Sets up the log handlers. Settings that aren't given are read from the environment (and a .env file):
+        LOG_LEVEL (default WARNING), LOG_FORMAT ('text' or 'json') and ROOT_DIR, logs are written to
+        ROOT_DIR/logs/log_history/logs.log. Without a log directory only the console gets the logs.
+
+        :param level: The level of every logger, e.g. 'INFO'.
+        :param log_format: 'json' writes one JSON object per line instead of the colored text format.
+        :param log_dir: The directory of the log files.
+        :param console: Also write the logs to stdout.
+        """
+        self.stop()
+        load_env()
+
+        self.level = get_log_level(level or os.getenv('LOG_LEVEL', 'WARNING'))
+        for logger in self.loggers.values():
+            logger.setLevel(self.level)
+
+        json_format = (log_format or os.getenv('LOG_FORMAT', 'text')).lower() == 'json'
+
+        if log_dir is None and os.getenv('ROOT_DIR'):
+            log_dir = os.path.join(os.getenv('ROOT_DIR'), 'logs')
+
+        handlers = []
+        if console:
+            handlers.append(self.get_console_handler(JsonFormatter() if json_format else FORMATTER))
+        if log_dir is not None:
+            handlers.append(self.get_file_handler(os.path.join(log_dir, 'log_history/logs.log'),
+                                                  JsonFormatter() if json_format else FILE_FORMATTER))
+
+        self.listener = QueueListener(self.queue, *handlers)
+        self.listener.start()
+
+        # Drain the queue before the interpreter exits so the last records aren't lost
+        atexit.unregister(self.stop)
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.listener is None:
+            return
+
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
+
     def get_logger(self, logger_name):
         if logger_name in self.loggers:
             return self.loggers[logger_name]
 
         logger = logging.getLogger(logger_name)
 
-        #logger.setLevel(logging.DEBUG)  # better to have too much log than not enough
-        logger.setLevel(logging.WARNING)  # better to have too much log than not enough
-
-        logger.addHandler(self.get_console_handler())
-        logger.addHandler(self.get_file_handler())
+        logger.setLevel(self.level)
+        logger.addHandler(self.queue_handler)
 
         # with this pattern, it's rarely necessary to propagate the error up to parent
         logger.propagate = False
@@ -65,3 +147,13 @@ class LoggerSingleton:
 
 def get_logger(logger_name):
     return LoggerSingleton.get_instance().get_logger(logger_name)
+
+
+def configure_logging(level: str = None, log_format: str = None, log_dir: str = None, console: bool = True):
+    """
+    Sets up logging explicitly, see LoggerSingleton.configure. Optional, the first log record sets it up from the
+    environment otherwise.
+    """
+    instance = LoggerSingleton.get_instance()
+    with instance.lock:
+        instance.configure(level, log_format, log_dir, console)
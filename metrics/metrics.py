@@ -0,0 +1,118 @@
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # One extra slot for the observations above the last bucket (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Approximates the quantile with the upper bound of the bucket it falls in.
+        """
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': dict(zip([*self.buckets, float('inf')], self.counts)),
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+
+class Metrics:
+    enabled = True
+
+    def __init__(self, sinks: list = None, buckets=DEFAULT_BUCKETS):
+        """
+        In-process registry of counters, gauges and latency histograms, all keyed by name and labels.
+
+        :param sinks: Push sinks (e.g. StatsdSink) that get every event as it happens. Pull style exports read the
+                      registry instead, see snapshot() and PrometheusExporter.
+        :param buckets: Upper bounds in seconds of the histogram buckets.
+        """
+        self.sinks = sinks or []
+        self.buckets = buckets
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        # Metrics can be read from another thread (e.g. an http exporter), writes stay on the event loop
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+        for sink in self.sinks:
+            sink.increment(name, value, labels)
+
+    def gauge(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+        for sink in self.sinks:
+            sink.gauge(name, value, labels)
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+        for sink in self.sinks:
+            sink.observe(name, value, labels)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in self.counters.items()],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                           for (name, labels), value in self.gauges.items()],
+                'histograms': [{'name': name, 'labels': dict(labels), **histogram.to_dict()}
+                               for (name, labels), histogram in self.histograms.items()],
+            }
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics that drops everything, the default so the hot path doesn't need to check whether metrics are on.
+    """
+    enabled = False
+
+    def increment(self, name: str, value: float = 1, **labels):
+        pass
+
+    def gauge(self, name: str, value: float, **labels):
+        pass
+
+    def observe(self, name: str, value: float, **labels):
+        pass
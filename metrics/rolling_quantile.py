@@ -0,0 +1,37 @@
+from collections import deque
+
+
+class RollingQuantile:
+    __slots__ = ('quantile', 'samples', 'refresh_every', 'new_samples', 'value')
+
+    def __init__(self, quantile: float, window: int = 500):
+        """
+        A quantile over the last `window` samples. Sorting the window on every read would be wasteful, the value is
+        only recomputed once a tenth of the window has been replaced.
+
+        :param quantile: The quantile to track, 0.95 is p95.
+        :param window: Number of recent samples the quantile is computed from.
+        """
+        self.quantile = quantile
+        self.samples = deque(maxlen=window)
+        self.refresh_every = max(window // 10, 1)
+        self.new_samples = 0
+        self.value = None
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def add(self, sample: float):
+        self.samples.append(sample)
+        self.new_samples += 1
+
+    def get(self) -> [float, None]:
+        if not self.samples:
+            return None
+
+        if self.value is None or self.new_samples >= self.refresh_every:
+            samples = sorted(self.samples)
+            self.value = samples[min(len(samples) - 1, int(self.quantile * len(samples)))]
+            self.new_samples = 0
+
+        return self.value
@@ -0,0 +1,110 @@
+import socket
+from abc import ABC, abstractmethod
+
+from logs.Logger import get_logger
+from metrics.metrics import Metrics
+
+logger = get_logger(__name__)
+
+
+class MetricsSink(ABC):
+    """
+    Push sink, gets every metric event as it is recorded.
+    """
+
+    @abstractmethod
+    def increment(self, name: str, value: float, labels: dict):
+        pass
+
+    @abstractmethod
+    def gauge(self, name: str, value: float, labels: dict):
+        pass
+
+    @abstractmethod
+    def observe(self, name: str, value: float, labels: dict):
+        pass
+
+
+class StatsdSink(MetricsSink):
+    def __init__(self, host: str = '127.0.0.1', port: int = 8125, prefix: str = 'request_generator'):
+        """
+        Sends metrics to a StatsD agent over UDP, labels are sent as DogStatsD style tags.
+        UDP sends never block on the agent and lost packets are simply dropped.
+        """
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def _send(self, name: str, value, kind: str, labels: dict):
+        tags = ','.join(f"{key}:{value}" for key, value in labels.items())
+        line = f"{self.prefix}.{name}:{value}|{kind}" + (f"|#{tags}" if tags else '')
+
+        try:
+            self.socket.sendto(line.encode(), self.address)
+        except OSError:
+            pass
+
+    def increment(self, name: str, value: float, labels: dict):
+        self._send(name, value, 'c', labels)
+
+    def gauge(self, name: str, value: float, labels: dict):
+        self._send(name, value, 'g', labels)
+
+    def observe(self, name: str, value: float, labels: dict):
+        # StatsD timers are in milliseconds
+        self._send(name, round(value * 1000, 3), 'ms', labels)
+
+
+class PrometheusExporter:
+    def __init__(self, metrics: Metrics, prefix: str = 'request_generator'):
+        """
+        Renders a Metrics registry in the Prometheus text exposition format.
+        """
+        self.metrics = metrics
+        self.prefix = prefix
+
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def _labels(self, labels: dict) -> str:
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{key}="{self._escape(value)}"' for key, value in labels.items()) + '}'
+
+    def render(self) -> str:
+        snapshot = self.metrics.snapshot()
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        # Samples of one metric have to be grouped together
+        for counter in sorted(snapshot['counters'], key=lambda entry: entry['name']):
+            name = f"{self.prefix}_{counter['name']}"
+            declare(name, 'counter')
+            lines.append(f"{name}{self._labels(counter['labels'])} {counter['value']}")
+
+        for gauge in sorted(snapshot['gauges'], key=lambda entry: entry['name']):
+            name = f"{self.prefix}_{gauge['name']}"
+            declare(name, 'gauge')
+            lines.append(f"{name}{self._labels(gauge['labels'])} {gauge['value']}")
+
+        for histogram in sorted(snapshot['histograms'], key=lambda entry: entry['name']):
+            name = f"{self.prefix}_{histogram['name']}"
+            declare(name, 'histogram')
+
+            cumulative = 0
+            for bound, count in histogram['buckets'].items():
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{self._labels({**histogram['labels'], 'le': le})} {cumulative}")
+
+            lines.append(f"{name}_sum{self._labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{self._labels(histogram['labels'])} {histogram['count']}")
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,70 @@
+import time
+from types import SimpleNamespace
+
+import aiohttp
+
+from metrics.metrics import Metrics
+
+
+def create_trace_config(metrics: Metrics) -> aiohttp.TraceConfig:
+    """
+    aiohttp hooks that break a request down into connection pool wait, DNS, connect and time to first byte.
+    aiohttp doesn't report the TLS handshake separately, it is part of the connect time of https connections.
+    """
+
+    def trace_context(trace_request_ctx):
+        return SimpleNamespace(started_at=None, host=None)
+
+    trace_config = aiohttp.TraceConfig(trace_config_ctx_factory=trace_context)
+
+    async def on_request_start(session, context, params):
+        context.started_at = time.perf_counter()
+        url = params.url
+        # Same host label as the request metrics, which use the netloc of the URL
+        context.host = url.host if url.is_default_port() else f"{url.host}:{url.port}"
+
+    async def on_connection_queued_start(session, context, params):
+        context.queued_at = time.perf_counter()
+
+    async def on_connection_queued_end(session, context, params):
+        metrics.observe('pool_wait_seconds', time.perf_counter() - context.queued_at, host=context.host)
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.dns_started_at = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        metrics.observe('dns_seconds', time.perf_counter() - context.dns_started_at, host=context.host)
+
+    async def on_dns_cache_hit(session, context, params):
+        metrics.increment('dns_cache_total', result='hit')
+
+    async def on_dns_cache_miss(session, context, params):
+        metrics.increment('dns_cache_total', result='miss')
+
+    async def on_connection_create_start(session, context, params):
+        context.connect_started_at = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        metrics.observe('connect_seconds', time.perf_counter() - context.connect_started_at, host=context.host)
+        metrics.increment('connections_total', host=context.host, reused='false')
+
+    async def on_connection_reuseconn(session, context, params):
+        metrics.increment('connections_total', host=context.host, reused='true')
+
+    async def on_request_end(session, context, params):
+        # on_request_end fires once the response headers are in
+        metrics.observe('ttfb_seconds', time.perf_counter() - context.started_at, host=context.host)
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_queued_start.append(on_connection_queued_start)
+    trace_config.on_connection_queued_end.append(on_connection_queued_end)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+    trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_request_end.append(on_request_end)
+
+    return trace_config
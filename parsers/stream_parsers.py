@@ -0,0 +1,86 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Callable
+
+
+class StreamParser(ABC):
+    """
+    Consumes a response body chunk by chunk. A new parser is created for every attempt of a request,
+    so parsers don't have to handle retries.
+    """
+
+    @abstractmethod
+    def feed(self, chunk: bytes):
+        pass
+
+    @abstractmethod
+    def close(self):
+        """
+        Called once the whole body was fed, returns the parse result.
+        """
+        pass
+
+
+class BytesParser(StreamParser):
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, chunk: bytes):
+        self.buffer += chunk
+
+    def close(self) -> bytes:
+        return bytes(self.buffer)
+
+
+class JsonParser(StreamParser):
+    """
+    Buffers the raw bytes and parses them once, json.loads accepts bytes so the body is never decoded to a str first.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, chunk: bytes):
+        self.buffer += chunk
+
+    def close(self):
+        return json.loads(self.buffer) if self.buffer else None
+
+
+class NdjsonParser(StreamParser):
+    def __init__(self, on_item: Callable = None):
+        """
+        Parses newline delimited JSON as it arrives, only the unfinished last line is kept in memory.
+
+        :param on_item: Called with every parsed item. If given the items aren't collected and close() returns
+                        the number of items instead.
+        """
+        self.on_item = on_item
+        self.items = []
+        self.count = 0
+        self.remainder = b''
+
+    def _emit(self, line: bytes):
+        line = line.strip()
+        if not line:
+            return
+
+        item = json.loads(line)
+        self.count += 1
+
+        if self.on_item is None:
+            self.items.append(item)
+        else:
+            self.on_item(item)
+
+    def feed(self, chunk: bytes):
+        lines = (self.remainder + chunk).split(b'\n')
+        self.remainder = lines.pop()
+
+        for line in lines:
+            self._emit(line)
+
+    def close(self):
+        self._emit(self.remainder)
+        self.remainder = b''
+        return self.items if self.on_item is None else self.count
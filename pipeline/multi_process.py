@@ -0,0 +1,38 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+from logs.Logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _run_job(job: Callable, req_list: list):
+    return asyncio.run(job(req_list))
+
+
+def split_requests(req_list: list, parts: int) -> list:
+    # Round robin so every worker gets a similar mix of hosts
+    return [req_list[i::parts] for i in range(parts) if req_list[i::parts]]
+
+
+def run_in_processes(req_list: list, job: Callable, processes: int = None) -> list:
+    """
+    Splits the request list between worker processes, each running its own event loop.
+
+    The job is an async function taking the list of requests of one worker, e.g. one that creates a
+    RequestGenerator and calls fetch_data. It must be a module level function so it can be pickled, and it has to
+    create its sessions, proxy managers etc. itself because those can't be shared between processes. Proxy health
+    can be, pass a SharedProxyState along (e.g. with functools.partial) and use a SharedProxyScorer in every job.
+
+    :return: The results of the jobs, one per worker.
+    """
+    processes = processes or os.cpu_count() or 1
+    slices = split_requests(req_list, processes)
+
+    logger.info("Running %s requests in %s worker processes", len(req_list), len(slices))
+
+    with ProcessPoolExecutor(len(slices) or 1) as executor:
+        futures = [executor.submit(_run_job, job, requests) for requests in slices]
+        return [future.result() for future in futures]
@@ -0,0 +1,103 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Union
+
+from data_fetcher import HttpMethod, stream_data
+from logs.Logger import get_logger
+from request_generator import RequestGenerator
+
+logger = get_logger(__name__)
+
+_DONE = object()
+
+
+async def pipeline_parse_requests(req_list: Union[Iterable, AsyncIterable], parser: Callable, method: HttpMethod,
+                                  generator: RequestGenerator, concurrency: int = 100, chunk_size: int = 100,
+                                  executor: Executor = None, workers: int = None, use_processes: bool = True,
+                                  queue_size: int = 4) -> AsyncIterator:
+    """
+    Fetches on the event loop while parsing runs in a pool, so a CPU heavy parser neither blocks networking nor is
+    capped at one core. Responses are handed to the pool in chunks to keep the pickling overhead low, and parsed
+    chunks are yielded in completion order.
+
+    Backpressure: at most `queue_size` chunks wait for the pool and at most one chunk per worker is being parsed,
+    when both are full fetching pauses until the parser catches up.
+
+    :param req_list: An iterable or async iterable of request kwargs for the generator method.
+    :param parser: Called in the pool with a list of responses. Must be picklable (a module level function) when
+                   processes are used.
+    :param method: The HttpMethod used for every request.
+    :param generator: The RequestGenerator that sends the requests.
+    :param concurrency: The maximum number of requests in flight.
+    :param chunk_size: The number of responses per parser call.
+    :param executor: The pool to parse in, a new pool is created (and shut down afterwards) if omitted.
+    :param workers: The number of workers of the created pool, defaults to the number of CPUs.
+    :param use_processes: Create a ProcessPoolExecutor, otherwise a ThreadPoolExecutor.
+    :param queue_size: The number of fetched chunks that may wait for a free worker.
+    """
+    workers = workers or os.cpu_count() or 1
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(workers) if use_processes else ThreadPoolExecutor(workers)
+
+    loop = asyncio.get_event_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    errors = []
+
+    async def produce():
+        chunk = []
+        try:
+            async for _, response in stream_data(req_list, method, generator, concurrency):
+                chunk.append(response)
+                if len(chunk) >= chunk_size:
+                    await queue.put(chunk)
+                    chunk = []
+
+            if chunk:
+                await queue.put(chunk)
+
+        except Exception as e:
+            errors.append(e)
+
+        await queue.put(_DONE)
+
+    producer = asyncio.ensure_future(produce())
+    parsing = set()
+    getter = None
+    finished = False
+
+    try:
+        while True:
+            if getter is None and not finished and len(parsing) < workers:
+                getter = asyncio.ensure_future(queue.get())
+
+            waiting = (parsing | {getter}) if getter is not None else parsing
+            if not waiting:
+                break
+
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if getter in done:
+                chunk = getter.result()
+                getter = None
+
+                if chunk is _DONE:
+                    finished = True
+                else:
+                    parsing.add(loop.run_in_executor(executor, parser, chunk))
+
+            for future in done & parsing:
+                parsing.discard(future)
+                yield future.result()
+
+        if errors:
+            raise errors[0]
+
+    finally:
+        for task in [producer, getter, *parsing]:
+            if task is not None:
+                task.cancel()
+
+        if own_executor:
+            executor.shutdown(wait=False)
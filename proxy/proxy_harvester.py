@@ -0,0 +1,53 @@
+import asyncio
+
+import aiohttp
+
+from logs.Logger import get_logger
+from proxy.proxy_sources import DEFAULT_SOURCES
+from proxy.proxy_validator import ProxyValidator
+
+logger = get_logger(__name__)
+
+
+class ProxyHarvester:
+    def __init__(self, sources: list = None, validator: ProxyValidator = None, timeout: float = 30):
+        """
+        Scrapes all proxy sources at the same time, deduplicates the candidates and validates them.
+
+        :param sources: ProxySource instances to scrape, defaults to all sources in DEFAULT_SOURCES.
+        :param validator: The ProxyValidator used to probe the candidates.
+        :param timeout: Seconds a single source may take.
+        """
+        self.sources = sources if sources is not None else [source() for source in DEFAULT_SOURCES]
+        self.validator = validator or ProxyValidator()
+        self.timeout = timeout
+
+    async def scrape(self) -> list:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            results = await asyncio.gather(*(source.fetch(session) for source in self.sources),
+                                           return_exceptions=True)
+
+        proxies = []
+        for source, result in zip(self.sources, results):
+            if isinstance(result, Exception):
+                logger.error("Failed to scrape proxies from %s: %r", source.name, result)
+            else:
+                proxies.extend(result)
+
+        return proxies
+
+    async def harvest(self, exclude=()) -> list:
+        """
+        :param exclude: (ip, port) keys of proxies we already have, they are neither returned nor probed.
+        :return: The validated new proxies, fastest first.
+        """
+        seen = set(exclude)
+        candidates = []
+
+        for proxy in await self.scrape():
+            if proxy.key not in seen:
+                seen.add(proxy.key)
+                candidates.append(proxy)
+
+        logger.info("Validating %s unique candidate proxies", len(candidates))
+        return await self.validator.validate(candidates)
@@ -1,38 +1,44 @@
-import os
-import sys
-
-
-# Get the directory path of the logs module
-app_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-
-# Add the logs directory to the Python path
-sys.path.append(app_dir)
-
-from logs.str_tool import boxify
-
-import argparse
-import csv
-
-import requests
-from bs4 import BeautifulSoup
-import schedule
+import asyncio
 import time
-import itertools
-import sys
 
 from logs.Logger import get_logger
+from proxy.proxy_harvester import ProxyHarvester
+from proxy.proxy_pool import ProxyPool, ProxyRecord
+from proxy.proxy_scoring import ProxyScorer
+from proxy.proxy_store import BatchedPersister, CsvProxyStore, ProxyStore, record_to_row
+from proxy.proxy_validator import ProxyValidator
 
 logger = get_logger(__name__)
 
 
 class ProxyManager:
-    def __init__(self, proxy_list_size: int, schedule_period=1, filepath='data/proxies.csv'):
+    def __init__(self, proxy_list_size: int, schedule_period=1, filepath='data/proxies.csv', store: ProxyStore = None,
+                 flush_interval: float = 5.0, flush_every: int = 100, harvester: ProxyHarvester = None,
+                 scorer: ProxyScorer = None, persist: bool = True):
+        """
+        :param proxy_list_size: The number of proxies to keep in the pool.
+        :param schedule_period: Interval in seconds between two harvesting runs.
+        :param filepath: The csv file used when no store is given.
+        :param store: The ProxyStore persisting the proxies, e.g. a SqliteProxyStore. Defaults to a CsvProxyStore.
+        :param flush_interval: Seconds between two background flushes of rank changes.
+        :param flush_every: Flush early once this many rank changes are pending.
+        :param harvester: The ProxyHarvester used to find new proxies, created on first use if omitted.
+        :param scorer: The ProxyScorer tracking proxy health and picking proxies, e.g. a SharedProxyScorer to share
+                       it between worker processes.
+        :param persist: Write rank changes to the store. When several processes share their proxy state only one of
+                        them should, the others would just overwrite each other's file.
+        """
         self.filepath = filepath
         self.proxy_list_size = proxy_list_size
         self.schedule_period = schedule_period
-        self.proxies = []
-        self.proxy_cycle = itertools.cycle(self.proxies)
-        self.load_proxies()
+        self.store = store or CsvProxyStore(filepath)
+        self.persister = BatchedPersister(self.store, flush_interval, flush_every)
+        self.harvester = harvester
+        self.scorer = scorer or ProxyScorer()
+        self.persist = persist
+        # Proxies are read from the store on first use, creating a ProxyManager doesn't touch the disk
+        self._pool = None
+        self._refreshing = False
 
     @staticmethod
     def testing_proxy() -> str:
@@ -50,179 +56,215 @@ class ProxyManager:
             return f"http://{proxy['ip']}:{proxy['port']}"
         return None
 
-    def scrape_proxies_p2(self):
-        url = 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=https&timeout=500&country=all&ssl=all&anonymity=all'
-        response = requests.get(url)
-        proxies_data = response.text.split('\r\n')[:-1]
-
-        proxies = []
-
-        for data in proxies_data:
-            proxy_info = data.split(':')
-            proxy = {
-                'ip': proxy_info[0],
-                'port': proxy_info[1],
-                'country': '',
-                'https': 'no',
-                'rank': 5
-            }
-            proxies.append(proxy)
-
-        logger.info(f"Found {len(proxies)} proxies from ProxyScrape")
-        return proxies
-
-    def scrape_proxies_p1(self):
-        logger.info("Getting free proxies")
-        url = 'https://www.sslproxies.org/'
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        proxies_table = soup.find(class_='table table-striped table-bordered')
-
-        proxies = []
-
-        for row in proxies_table.tbody.find_all('tr'):
-            columns = row.find_all('td')
-            proxy = {
-                'ip': columns[0].string,
-                'port': columns[1].string,
-                'country': columns[3].string,
-                'https': 'yes' if columns[6].string == 'yes' else 'no',
-                'rank': 5
-            }
-            proxies.append(proxy)
-
-        logger.info(f"Found {len(proxies)} proxies from sslproxies.org")
-        return proxies
-
-    def save_proxies_to_csv(self):
-        with open(self.filepath, 'w', newline='') as csvfile:
-            fieldnames = ['ip', 'port', 'country', 'https', 'rank']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            writer.writeheader()
-            for proxy in self.proxies:
-                writer.writerow(proxy)
-
-        logger.info(f"Saved {len(self.proxies)} proxies to csv")
+    @property
+    def pool(self) -> ProxyPool:
+        if self._pool is None:
+            self.load_proxies()
+        return self._pool
 
-    def load_proxies(self):
-        self.proxies = []
+    @pool.setter
+    def pool(self, pool: ProxyPool):
+        self._pool = pool
 
-        try:
-            with open(self.filepath, 'r', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
+    @property
+    def proxies(self) -> list:
+        # Proxies ordered by rank, highest first
+        return self.pool.ranked()
 
-                for row in reader:
-                    proxy = {'ip': row['ip'], 'port': row['port'], 'country': row['country'], 'https': row['https'],
-                             'rank': int(row['rank']) if row['rank'] else 0}
-                    self.proxies.append(proxy)
+    def save_proxies(self):
+        # Saves the whole pool right away, rank updates go through the batched persister instead
+        self.persister.reset(self.pool)
+        self.store.save([record_to_row(proxy) for proxy in self.pool.ranked()])
 
-            self.proxy_cycle = itertools.cycle(self.proxies)
-            logger.critical(f"Loaded {len(self.proxies)} proxies from csv")
+        logger.info("Saved %s proxies", len(self.pool))
+
+    def load_proxies(self):
+        try:
+            self.pool = ProxyPool(self.store.load())
+            self.persister.reset(self.pool)
+
+            logger.critical("Loaded %s proxies", len(self.pool))
 
         except FileNotFoundError:
-            logger.error("proxies.csv not found. Creating new file")
+            logger.error("Proxy file not found. Creating new file")
+            if self._pool is None:
+                self._pool = ProxyPool()
+
+    def refresh_proxies(self):
+        """
+        Picks up proxies added or dropped by another process (e.g. the harvester) while keeping the ranks we
+        learned in memory. Nothing is read when the store didn't change since our last load or save.
+
+        Called from the event loop the store is read on a worker thread and the pool is updated on the loop once it
+        is read, a refresh that is still running isn't started again.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._apply_refresh(self._read_store())
+            return
 
-    def reset_proxies(self):
-        self.proxies = []
-        self.proxy_cycle = itertools.cycle(self.proxies)
-        self.save_proxies_to_csv()
+        if self._refreshing:
+            return
 
-    def find_and_save_proxies(self):
-        self.load_proxies()
-        new_proxies = self.scrape_proxies_p1()
-        new_proxies_p2 = self.scrape_proxies_p2()
+        self._refreshing = True
+        loop.run_in_executor(None, self._read_store).add_done_callback(self._refreshed)
 
-        new_proxies.extend(new_proxies_p2)
+    def _read_store(self) -> [dict, None]:
+        if not self.store.has_changed():
+            return None
 
-        # Get the proxies only with rank > 3, the others will be replaced
-        self.proxies = [proxy for proxy in self.proxies if proxy['rank'] > 3]
+        # Write our pending rank changes first so they aren't lost on the next flush
+        self.persister.flush()
 
-        if len(self.proxies) >= self.proxy_list_size:
+        try:
+            return {record.key: record for record in self.store.load()}
+        except FileNotFoundError:
+            return None
+
+    def _refreshed(self, future: asyncio.Future):
+        self._refreshing = False
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.error("Failed to refresh proxies: %s", future.exception())
             return
+        self._apply_refresh(future.result())
 
-        # Get the number of proxies needed to reach the proxy_list_size
-        proxies_needed = self.proxy_list_size - len(self.proxies)
-        logger.info(f"Need {proxies_needed} proxies to reach {self.proxy_list_size} proxies")
+    def _apply_refresh(self, stored: [dict, None]):
+        if stored is None:
+            return
 
-        # Add only the required number of new proxies
-        new_proxies = new_proxies[:proxies_needed]
+        for proxy in self.pool:
+            if proxy.key not in stored:
+                self.pool.remove(proxy)
+                self.scorer.forget(proxy)
 
-        # Remove the proxies that already exist in the list
-        existing_ips = [proxy['ip'] for proxy in self.proxies]
-        new_proxies = [proxy for proxy in new_proxies if proxy['ip'] not in existing_ips]
+        added = [record for record in stored.values() if self.pool.add(record)]
+        # Rank changes made while the store was read are still written
+        self.persister.sync(self.pool)
 
-        self.proxies.extend(new_proxies)
-        self.proxies = sorted(self.proxies, key=lambda x: x['rank'], reverse=True)[:self.proxy_list_size]
+        logger.info("Refreshed proxies, %s new, %s in total", len(added), len(self.pool))
 
-        self.proxy_cycle = itertools.cycle(self.proxies)
-        self.save_proxies_to_csv()
+    def reset_proxies(self):
+        self.pool.clear()
+        self.save_proxies()
 
-        logger.info(f"Updated proxy list with {len(new_proxies)} new proxies")
+    def close(self):
+        # Flush pending rank changes and stop the background writer
+        self.persister.stop()
 
-    def get_proxy(self):
-        try:
-            return next(self.proxy_cycle)
-        except StopIteration:
-            # If the proxy is not found in the list itertools throws this error.
-            logger.warning("Proxy list is empty. Loading proxies from csv")
-            time.sleep(5)
-            self.load_proxies()
-            return next(self.proxy_cycle)
+    def find_and_save_proxies(self):
+        asyncio.run(self.harvest_proxies())
 
-    def update_proxy_rank(self, proxy: dict, delta: int):
-        try:
-            proxy_index = next(
-                i for i, p in enumerate(self.proxies) if p['ip'] == proxy['ip'] and p['port'] == proxy['port'])
-        except StopIteration:
-            logger.warning(f"Proxy {proxy['ip']}:{proxy['port']} not found in the list.")
+    async def harvest_proxies(self):
+        self.load_proxies()
+
+        # Get the proxies only with rank > 3, the others will be replaced
+        for proxy in self.pool:
+            if proxy.rank <= 3:
+                self.pool.remove(proxy)
+
+        if len(self.pool) >= self.proxy_list_size:
             return
 
-        logger.info(f"Updating proxy rank for {proxy['ip']}:{proxy['port']} with "
-                    f"rank {self.proxies[proxy_index]['rank']} by {delta}")
+        # Get the number of proxies needed to reach the proxy_list_size
+        proxies_needed = self.proxy_list_size - len(self.pool)
+        logger.info("Need %s proxies to reach %s proxies", proxies_needed, self.proxy_list_size)
 
-        proxy = self.proxies[proxy_index]
-        proxy_rank = proxy['rank']
+        if self.harvester is None:
+            self.harvester = ProxyHarvester()
 
-        # I set 20 as the maximum rank value because I don't want to have a proxy with rank 1000,
-        # it will take quite a long time to pop it from the list
-        new_rank = proxy_rank + delta if proxy_rank + delta <= 20 else proxy_rank
+        # Only validated proxies come back, fastest first and ranked by their latency
+        new_proxies = await self.harvester.harvest(exclude={proxy.key for proxy in self.pool})
 
-        proxy['rank'] = new_rank
+        # Add only the required number of new proxies
+        new_proxies = [proxy for proxy in new_proxies[:proxies_needed] if self.pool.add(proxy)]
+
+        self.save_proxies()
+
+        logger.info("Updated proxy list with %s new proxies", len(new_proxies))
+
+    def get_proxy(self, host: str = None) -> ProxyRecord:
+        """
+        Picks a proxy by score, proxies in circuit breaker cooldown are skipped. See ProxyScorer.choose.
+        Raises LookupError right away when the pool is empty, it is called on the event loop and must not wait for
+        the harvester. Proxies it adds show up with the next refresh_proxies.
+
+        :param host: The target host, used when the scorer keeps per host stats.
+        """
+        proxy = self.scorer.choose(self.pool, host)
+        if proxy is None:
+            raise LookupError("Proxy list is empty")
+        return proxy
+
+    def get_other_proxy(self, proxy, host: str = None, attempts: int = 5):
+        """
+        Picks a proxy other than `proxy`, e.g. for a hedged request.
+
+        :param proxy: The proxy (record or dict) to avoid, None for a direct request.
+        :param host: The target host, used when the scorer keeps per host stats.
+        :param attempts: How many picks to try before giving up.
+        """
+        avoid = ProxyPool.key_of(proxy) if proxy is not None else None
+
+        for _ in range(attempts):
+            candidate = self.scorer.choose(self.pool, host)
+            if candidate is None:
+                break
+            if ProxyPool.key_of(candidate) != avoid:
+                return candidate
+
+        raise LookupError("No other proxy available")
+
+    def report_result(self, proxy, success: bool, latency: float = None, host: str = None):
+        """
+        Feeds the outcome of a request through the proxy into its score. Failing proxies are put in cooldown by the
+        scorer instead of being dropped, the harvester prunes the ones that stay low ranked.
+
+        :param proxy: The proxy (record or dict) the request went through.
+        :param success: Whether the request succeeded.
+        :param latency: Seconds until the response headers arrived, None for failed requests.
+        :param host: The target host of the request.
+        """
+        record = self.pool.get(proxy)
+        if record is None:
+            logger.warning("Proxy %s:%s not found in the list.", proxy['ip'], proxy['port'])
+            return
 
-        if new_rank < 0:
-            self.proxies.pop(proxy_index)
-        else:
-            # Move the updated proxy to its new position in the sorted list
-            while (proxy_index > 0 and
-                   self.proxies[proxy_index]['rank'] > self.proxies[proxy_index - 1]['rank']):
-                self.proxies[proxy_index], self.proxies[proxy_index - 1] = self.proxies[proxy_index - 1], self.proxies[
-                    proxy_index]
-                proxy_index -= 1
+        self.scorer.record(record, success, latency, host)
 
-            while (proxy_index < len(self.proxies) - 1 and
-                   self.proxies[proxy_index]['rank'] < self.proxies[proxy_index + 1]['rank']):
-                self.proxies[proxy_index], self.proxies[proxy_index + 1] = self.proxies[proxy_index + 1], self.proxies[
-                    proxy_index]
-                proxy_index += 1
+        # Only persist when the rank bucket actually moves, most results don't change it
+        new_rank = self.scorer.rank(record)
+        if new_rank != record.rank:
+            logger.info("Updating proxy rank for %s:%s from %s to %s", record.ip, record.port, record.rank, new_rank)
+            self.pool.set_rank(record, new_rank)
+            if self.persist:
+                self.persister.mark(record)
 
-        self.proxy_cycle = itertools.cycle(self.proxies)
-        self.save_proxies_to_csv()
 
+def main():
+    import argparse
 
-if __name__ == '__main__':
+    import schedule
+
+    from logs.str_tool import boxify
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--interval", type=int, default=0,
                         help="Interval (in seconds) to refresh the proxy pool")
     parser.add_argument('--proxy_count', type=int, default=50,
                         help='Number of proxies to maintain in the pool')
+    parser.add_argument('--check_url', type=str, default='https://httpbin.org/ip',
+                        help='URL requested through every scraped proxy to validate it')
     args = parser.parse_args()
 
     print(boxify(header="~~~~~~~~~~~~~~~ Proxy Manager ~~~~~~~~~~~~~~~",
-                 params={'Interval': args.interval, 'Proxy Count': args.proxy_count}), '\n')
+                 params={'Interval': args.interval, 'Proxy Count': args.proxy_count,
+                         'Check URL': args.check_url}), '\n')
 
-    proxy_manager = ProxyManager(args.proxy_count, args.interval)
+    harvester = ProxyHarvester(validator=ProxyValidator(check_url=args.check_url))
+    proxy_manager = ProxyManager(args.proxy_count, args.interval, harvester=harvester)
     proxy_manager.find_and_save_proxies()
 
     schedule.every(args.interval).seconds.do(proxy_manager.find_and_save_proxies)
@@ -230,3 +272,7 @@ if __name__ == '__main__':
     while True:
         schedule.run_pending()
         time.sleep(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import random
+
+
+class ProxyRecord:
+    """
+    Compact proxy entry. Supports item access (proxy['ip']) so code written for the old proxy dicts keeps working.
+    The in-memory health stats (see proxy_scoring) are not part of the persisted fields.
+    """
+    __slots__ = ('ip', 'port', 'country', 'https', 'rank', 'stats')
+
+    FIELDS = ('ip', 'port', 'country', 'https', 'rank')
+
+    def __init__(self, ip: str, port: str, country: str = '', https: str = 'no', rank: int = 5):
+        self.ip = ip
+        self.port = str(port)
+        self.country = country
+        self.https = https
+        self.rank = rank
+        self.stats = None
+
+    @property
+    def key(self) -> tuple:
+        return self.ip, self.port
+
+    def __getitem__(self, item):
+        if item not in self.FIELDS:
+            raise KeyError(item)
+        return getattr(self, item)
+
+    def get(self, item, default=None):
+        return getattr(self, item, default) if item in self.FIELDS else default
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, proxy: dict) -> 'ProxyRecord':
+        return cls(proxy['ip'], proxy['port'], proxy.get('country', ''), proxy.get('https', 'no'),
+                   int(proxy['rank']) if proxy.get('rank') not in (None, '') else 0)
+
+    def __repr__(self):
+        return f"ProxyRecord({self.ip}:{self.port}, rank={self.rank})"
+
+
+class ProxyPool:
+    """
+    Proxy container with O(1) lookup by (ip, port), O(1) rank updates and rank-weighted selection.
+
+    Proxies are kept in one bucket per rank. Every bucket is a list and the position of each proxy in its bucket is
+    indexed, so a proxy can be moved between buckets with a swap-and-pop. Selection first picks a rank with
+    probability proportional to (rank + 1) * bucket size, then a random proxy from that bucket. Ranks are capped
+    so there are only a handful of buckets to walk.
+    """
+
+    def __init__(self, records=()):
+        self.index = {}
+        self.buckets = {}
+        self.positions = {}
+        self.total_weight = 0
+
+        for record in records:
+            self.add(record)
+
+    @staticmethod
+    def key_of(proxy) -> tuple:
+        return proxy['ip'], str(proxy['port'])
+
+    @staticmethod
+    def weight_of(rank: int) -> int:
+        return max(rank, 0) + 1
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(list(self.index.values()))
+
+    def __contains__(self, proxy):
+        return self.key_of(proxy) in self.index
+
+    def get(self, proxy) -> [ProxyRecord, None]:
+        return self.index.get(self.key_of(proxy))
+
+    def _insert(self, record: ProxyRecord):
+        bucket = self.buckets.setdefault(record.rank, [])
+        self.positions[record.key] = len(bucket)
+        bucket.append(record)
+        self.total_weight += self.weight_of(record.rank)
+
+    def _detach(self, record: ProxyRecord):
+        bucket = self.buckets[record.rank]
+        position = self.positions.pop(record.key)
+
+        last = bucket.pop()
+        if last is not record:
+            bucket[position] = last
+            self.positions[last.key] = position
+
+        if not bucket:
+            del self.buckets[record.rank]
+
+        self.total_weight -= self.weight_of(record.rank)
+
+    def add(self, record: ProxyRecord) -> bool:
+        if record.key in self.index:
+            return False
+
+        self.index[record.key] = record
+        self._insert(record)
+        return True
+
+    def remove(self, proxy) -> [ProxyRecord, None]:
+        record = self.index.pop(self.key_of(proxy), None)
+        if record is not None:
+            self._detach(record)
+        return record
+
+    def set_rank(self, record: ProxyRecord, rank: int):
+        if rank == record.rank:
+            return
+
+        self._detach(record)
+        record.rank = rank
+        self._insert(record)
+
+    def clear(self):
+        self.index.clear()
+        self.buckets.clear()
+        self.positions.clear()
+        self.total_weight = 0
+
+    def select(self) -> [ProxyRecord, None]:
+        if not self.index:
+            return None
+
+        threshold = random.random() * self.total_weight
+        for rank in sorted(self.buckets, reverse=True):
+            bucket = self.buckets[rank]
+            threshold -= self.weight_of(rank) * len(bucket)
+            if threshold < 0:
+                return random.choice(bucket)
+
+        # Float rounding can leave a tiny remainder, fall back to the lowest rank
+        return random.choice(self.buckets[min(self.buckets)])
+
+    def ranked(self) -> list:
+        return [record for rank in sorted(self.buckets, reverse=True) for record in self.buckets[rank]]
@@ -0,0 +1,160 @@
+import math
+import time
+
+from logs.Logger import get_logger
+from proxy.proxy_pool import ProxyPool, ProxyRecord
+
+logger = get_logger(__name__)
+
+MAX_RANK = 20
+
+
+class ProxyStats:
+    """
+    Health of a proxy (optionally towards a single host): EWMA latency and success rate, and circuit breaker state.
+    """
+    __slots__ = ('latency', 'success_rate', 'last_failure', 'consecutive_failures', 'trips', 'open_until')
+
+    def __init__(self, latency: float = None, success_rate: float = 1.0):
+        self.latency = latency
+        self.success_rate = success_rate
+        self.last_failure = None
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+
+
+class ProxyScorer:
+    def __init__(self, alpha: float = 0.2, latency_target: float = 1.0, recovery_time: float = 60,
+                 failure_threshold: int = 5, cooldown: float = 30, max_cooldown: float = 600,
+                 per_host: bool = False, sample_size: int = 2):
+        """
+        Scores proxies by latency, success rate and time since their last failure and picks them with
+        power-of-two-choices: sample two proxies and take the better one.
+
+        :param alpha: Weight of the newest observation in the moving averages.
+        :param latency_target: Latency in seconds at which the latency factor of the score is 0.5.
+        :param recovery_time: Seconds it takes for the penalty of a failure to mostly wear off.
+        :param failure_threshold: Consecutive failures after which the proxy is put in cooldown.
+        :param cooldown: Seconds of the first cooldown, it doubles every time the breaker trips again.
+        :param max_cooldown: Upper bound for a single cooldown.
+        :param per_host: Keep separate stats for every target host as well.
+        :param sample_size: The number of proxies sampled per selection.
+        """
+        self.alpha = alpha
+        self.latency_target = latency_target
+        self.recovery_time = recovery_time
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.per_host = per_host
+        self.sample_size = sample_size
+
+        self.host_stats = {}
+
+    @staticmethod
+    def stats_of(record: ProxyRecord) -> ProxyStats:
+        if record.stats is None:
+            # Proxies loaded from disk only have their rank, use it as the starting success rate
+            record.stats = ProxyStats(success_rate=min(1.0, (record.rank + 1) / 10))
+        return record.stats
+
+    def _host_stats_of(self, record: ProxyRecord, host: str) -> ProxyStats:
+        key = (record.key, host)
+        stats = self.host_stats.get(key)
+        if stats is None:
+            stats = self.host_stats[key] = ProxyStats(self.stats_of(record).latency)
+        return stats
+
+    def _update(self, stats: ProxyStats, success: bool, latency: float, now: float):
+        stats.success_rate += self.alpha * ((1.0 if success else 0.0) - stats.success_rate)
+
+        if latency is not None:
+            stats.latency = latency if stats.latency is None else stats.latency + self.alpha * (latency - stats.latency)
+
+        if success:
+            stats.consecutive_failures = 0
+            stats.trips = 0
+            return
+
+        stats.last_failure = now
+        stats.consecutive_failures += 1
+
+        # Open the breaker, half-open proxies that fail again go back in cooldown for twice as long
+        if stats.consecutive_failures >= self.failure_threshold:
+            stats.trips += 1
+            stats.open_until = now + min(self.max_cooldown, self.cooldown * 2 ** (stats.trips - 1))
+
+    def record(self, record: ProxyRecord, success: bool, latency: float = None, host: str = None):
+        now = time.monotonic()
+        self._update(self.stats_of(record), success, latency, now)
+
+        if self.per_host and host:
+            self._update(self._host_stats_of(record, host), success, latency, now)
+
+    def _score(self, stats: ProxyStats, now: float) -> float:
+        latency = stats.latency if stats.latency is not None else self.latency_target
+        latency_factor = self.latency_target / (self.latency_target + latency)
+
+        recency = 1.0
+        if stats.last_failure is not None:
+            recency = 0.5 + 0.5 * (1 - math.exp(-(now - stats.last_failure) / self.recovery_time))
+
+        return stats.success_rate * latency_factor * recency
+
+    def score(self, record: ProxyRecord, host: str = None) -> float:
+        now = time.monotonic()
+
+        if self.per_host and host:
+            stats = self.host_stats.get((record.key, host))
+            if stats is not None:
+                return self._score(stats, now)
+
+        return self._score(self.stats_of(record), now)
+
+    def rank(self, record: ProxyRecord) -> int:
+        # Ranks are what gets persisted and what the harvester prunes on, keep them in line with the score
+        return min(MAX_RANK, int(round(self.score(record) * MAX_RANK)))
+
+    def is_available(self, record: ProxyRecord, host: str = None) -> bool:
+        now = time.monotonic()
+
+        if self.stats_of(record).open_until > now:
+            return False
+
+        if self.per_host and host:
+            stats = self.host_stats.get((record.key, host))
+            if stats is not None and stats.open_until > now:
+                return False
+
+        return True
+
+    def choose(self, pool: ProxyPool, host: str = None, attempts: int = 10) -> [ProxyRecord, None]:
+        """
+        Picks the best of `sample_size` rank-weighted samples, skipping proxies in cooldown. If every sample is in
+        cooldown the first one is returned anyway, better a cooling down proxy than no proxy.
+        """
+        candidates = []
+        fallback = None
+
+        for _ in range(attempts):
+            record = pool.select()
+            if record is None:
+                return None
+
+            if self.is_available(record, host):
+                candidates.append(record)
+                if len(candidates) >= self.sample_size:
+                    break
+            elif fallback is None:
+                fallback = record
+
+        if not candidates:
+            return fallback
+
+        return max(candidates, key=lambda candidate: self.score(candidate, host))
+
+    def forget(self, record: ProxyRecord):
+        if self.per_host:
+            for key in [key for key in self.host_stats if key[0] == record.key]:
+                del self.host_stats[key]
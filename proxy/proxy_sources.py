@@ -0,0 +1,69 @@
+from abc import ABC, abstractmethod
+
+import aiohttp
+
+from logs.Logger import get_logger
+from proxy.proxy_pool import ProxyRecord
+
+logger = get_logger(__name__)
+
+
+class ProxySource(ABC):
+    """
+    A place to scrape free proxies from. Subclasses give the url and know how to parse the page.
+    """
+    name = None
+    url = None
+
+    async def fetch(self, session: aiohttp.ClientSession) -> list:
+        async with session.get(self.url) as response:
+            response.raise_for_status()
+            text = await response.text()
+
+        proxies = self.parse(text)
+        logger.info("Found %s proxies from %s", len(proxies), self.name)
+        return proxies
+
+    @abstractmethod
+    def parse(self, text: str) -> list:
+        pass
+
+
+class SslProxiesSource(ProxySource):
+    name = 'sslproxies.org'
+    url = 'https://www.sslproxies.org/'
+
+    def parse(self, text: str) -> list:
+        # bs4 is only needed by this scraper, importing it up front would slow down every import of the package
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(text, 'html.parser')
+        proxies_table = soup.find(class_='table table-striped table-bordered')
+
+        proxies = []
+
+        for row in proxies_table.tbody.find_all('tr'):
+            columns = row.find_all('td')
+            proxy = ProxyRecord(ip=columns[0].string, port=columns[1].string, country=columns[3].string,
+                                https='yes' if columns[6].string == 'yes' else 'no', rank=5)
+            proxies.append(proxy)
+
+        return proxies
+
+
+class ProxyScrapeSource(ProxySource):
+    name = 'ProxyScrape'
+    url = 'https://api.proxyscrape.com/v2/?request=getproxies&protocol=https&timeout=500&country=all&ssl=all&anonymity=all'
+
+    def parse(self, text: str) -> list:
+        proxies = []
+
+        for data in text.split('\r\n')[:-1]:
+            proxy_info = data.split(':')
+            proxy = ProxyRecord(ip=proxy_info[0], port=proxy_info[1], country='', https='no', rank=5)
+            proxies.append(proxy)
+
+        return proxies
+
+
+DEFAULT_SOURCES = (SslProxiesSource, ProxyScrapeSource)
@@ -0,0 +1,251 @@
+import atexit
+import csv
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+
+from logs.Logger import get_logger
+from proxy.proxy_pool import ProxyRecord
+
+logger = get_logger(__name__)
+
+
+def record_to_row(record: ProxyRecord) -> tuple:
+    return record.ip, record.port, record.country, record.https, record.rank
+
+
+class ProxyStore(ABC):
+    """
+    Where proxy state is persisted. Rows are (ip, port, country, https, rank) tuples so they can be handed to a
+    background thread without sharing the live ProxyRecord objects.
+    """
+
+    @abstractmethod
+    def load(self) -> list:
+        pass
+
+    @abstractmethod
+    def save(self, rows: list):
+        pass
+
+    @abstractmethod
+    def has_changed(self) -> bool:
+        """
+        Tells whether somebody else changed the stored proxies since we last loaded or saved them.
+        """
+        pass
+
+
+class IncrementalProxyStore(ProxyStore):
+    """
+    A ProxyStore that can apply single row changes, the others need the full list of rows on every save.
+    """
+
+    @abstractmethod
+    def save_changes(self, changes: dict):
+        """
+        Applies a dictionary of (ip, port) -> row changes.
+        """
+        pass
+
+
+class CsvProxyStore(ProxyStore):
+    def __init__(self, filepath: str = 'data/proxies.csv'):
+        self.filepath = filepath
+        self.seen_stat = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.filepath)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> list:
+        with open(self.filepath, 'r', newline='') as csvfile:
+            records = [ProxyRecord.from_dict(row) for row in csv.DictReader(csvfile)]
+
+        self.seen_stat = self._stat()
+        return records
+
+    def save(self, rows: list):
+        directory = os.path.dirname(self.filepath) or '.'
+        os.makedirs(directory, exist_ok=True)
+
+        # Write next to the target and rename, readers never see a half written file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.proxies-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', newline='') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(ProxyRecord.FIELDS)
+                writer.writerows(rows)
+
+            os.replace(tmp_path, self.filepath)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self.seen_stat = self._stat()
+
+    def has_changed(self) -> bool:
+        return self._stat() != self.seen_stat
+
+
+class SqliteProxyStore(IncrementalProxyStore):
+    def __init__(self, filepath: str = 'data/proxies.db'):
+        """
+        SQLite store in WAL mode, a rank update is a single row upsert instead of a full file rewrite.
+        """
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.seen_version = None
+
+        directory = os.path.dirname(filepath)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # The connection is shared between the event loop and the flush thread, the lock serializes access
+        self.connection = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS proxies (ip TEXT NOT NULL, port TEXT NOT NULL, '
+                                'country TEXT, https TEXT, rank INTEGER, PRIMARY KEY (ip, port))')
+
+    def _data_version(self) -> int:
+        # data_version only changes when another connection commits
+        return self.connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def load(self) -> list:
+        with self.lock:
+            rows = self.connection.execute('SELECT ip, port, country, https, rank FROM proxies').fetchall()
+            self.seen_version = self._data_version()
+
+        return [ProxyRecord(*row) for row in rows]
+
+    def save(self, rows: list):
+        with self.lock:
+            self.connection.execute('BEGIN')
+            try:
+                self.connection.execute('DELETE FROM proxies')
+                self.connection.executemany('INSERT INTO proxies VALUES (?, ?, ?, ?, ?)', rows)
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    def save_changes(self, changes: dict):
+        with self.lock:
+            self.connection.execute('BEGIN')
+            try:
+                self.connection.executemany(
+                    'INSERT INTO proxies VALUES (?, ?, ?, ?, ?) ON CONFLICT (ip, port) DO UPDATE SET '
+                    'country = excluded.country, https = excluded.https, rank = excluded.rank', changes.values())
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    def has_changed(self) -> bool:
+        with self.lock:
+            return self._data_version() != self.seen_version
+
+
+class BatchedPersister:
+    def __init__(self, store: ProxyStore, flush_interval: float = 5.0, flush_every: int = 100):
+        """
+        Collects proxy changes in memory and writes them to the store in batches on a background thread, so the
+        event loop never waits for the disk.
+
+        :param store: The ProxyStore to write to.
+        :param flush_interval: Seconds between two flushes.
+        :param flush_every: Flush early once this many changes are pending.
+        """
+        self.store = store
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+
+        self.lock = threading.Lock()
+        # Held for a whole flush, so an older snapshot can never be written after a newer one
+        self.flush_lock = threading.Lock()
+        # Mirror of the pool as rows, full rewrite stores are saved from this instead of the live records
+        self.rows = {}
+        self.dirty = {}
+
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def reset(self, records):
+        with self.lock:
+            self.rows = {record.key: record_to_row(record) for record in records}
+            self.dirty = {}
+
+    def sync(self, records):
+        """
+        Like reset, but changes that are still pending stay pending unless their proxy is gone.
+        """
+        with self.lock:
+            self.rows = {record.key: record_to_row(record) for record in records}
+            self.dirty = {key: self.rows[key] for key in self.dirty if key in self.rows}
+
+    def mark(self, record: ProxyRecord):
+        # Removals aren't marked: a refresh only drops proxies that are already gone from the store, and a harvest
+        # saves the whole pool
+        row = record_to_row(record)
+        with self.lock:
+            self.rows[record.key] = row
+            self.dirty[record.key] = row
+            pending = len(self.dirty)
+
+        self.start()
+        if pending >= self.flush_every:
+            self.wakeup.set()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                changes, self.dirty = self.dirty, {}
+                rows = None if isinstance(self.store, IncrementalProxyStore) else list(self.rows.values())
+
+            try:
+                if rows is None:
+                    self.store.save_changes(changes)
+                else:
+                    self.store.save(rows)
+                logger.info("Flushed %s proxy changes", len(changes))
+
+            except Exception as e:
+                logger.error("Failed to flush proxy changes: %s", e)
+                # Put the changes back unless they were overwritten in the meantime
+                with self.lock:
+                    for key, row in changes.items():
+                        self.dirty.setdefault(key, row)
+
+    def start(self):
+        if self.thread is not None:
+            return
+
+        self.thread = threading.Thread(target=self._run, name='proxy-persister', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.wakeup.set()
+            self.thread.join()
+            self.thread = None
+            self.stopped.clear()
+            atexit.unregister(self.stop)
+
+        self.flush()
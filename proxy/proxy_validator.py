@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import aiohttp
+
+from logs.Logger import get_logger
+from proxy.proxy_pool import ProxyRecord
+from proxy.proxy_scoring import ProxyStats
+
+logger = get_logger(__name__)
+
+
+class ProxyValidator:
+    # (max latency in seconds, starting rank) pairs, slower proxies that still work start at DEFAULT_RANK
+    LATENCY_RANKS = ((0.5, 10), (1.0, 8), (2.0, 6))
+    DEFAULT_RANK = 5
+
+    def __init__(self, check_url: str = 'https://httpbin.org/ip', timeout: float = 5, concurrency: int = 200):
+        """
+        Probes candidate proxies before they are allowed into the pool.
+
+        :param check_url: The URL requested through every candidate, it must answer with a 2xx status.
+        :param timeout: Seconds a probe may take before the candidate is dropped.
+        :param concurrency: The number of probes running at the same time.
+        """
+        self.check_url = check_url
+        self.timeout = timeout
+        self.concurrency = concurrency
+
+    @classmethod
+    def rank_for_latency(cls, latency: float) -> int:
+        for max_latency, rank in cls.LATENCY_RANKS:
+            if latency <= max_latency:
+                return rank
+        return cls.DEFAULT_RANK
+
+    async def probe(self, session: aiohttp.ClientSession, proxy: ProxyRecord) -> [float, None]:
+        """
+        :return: The latency of the probe in seconds, or None if the proxy didn't work.
+        """
+        started_at = time.perf_counter()
+
+        try:
+            async with session.get(self.check_url, proxy=f"http://{proxy.ip}:{proxy.port}", ssl=False) as response:
+                if not 200 <= response.status < 300:
+                    return None
+                await response.read()
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+
+        return time.perf_counter() - started_at
+
+    async def validate(self, candidates: list) -> list:
+        """
+        Probes all candidates and returns the working ones, fastest first, with a starting rank based on latency.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, force_close=True)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+            async def check(proxy: ProxyRecord):
+                async with semaphore:
+                    return proxy, await self.probe(session, proxy)
+
+            results = await asyncio.gather(*(check(proxy) for proxy in candidates))
+
+        validated = []
+        for proxy, latency in sorted((r for r in results if r[1] is not None), key=lambda r: r[1]):
+            proxy.rank = self.rank_for_latency(latency)
+            proxy.stats = ProxyStats(latency=latency)
+            validated.append(proxy)
+
+        logger.info("Validated %s out of %s proxies", len(validated), len(candidates))
+        return validated
@@ -0,0 +1,229 @@
+import fcntl
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from logs.Logger import get_logger
+from proxy.proxy_pool import ProxyRecord
+from proxy.proxy_scoring import ProxyScorer, ProxyStats
+
+logger = get_logger(__name__)
+
+MAGIC = b'PRXSTAT1'
+# magic, capacity, number of used slots
+HEADER = struct.Struct('<8sII')
+# seq, 'ip:port', latency, success_rate, last_failure, open_until, consecutive_failures, trips
+RECORD = struct.Struct('<Q64sddddII')
+SEQ = struct.Struct('<Q')
+COUNT = struct.Struct('<I')
+COUNT_OFFSET = 12
+
+NAN = float('nan')
+# Reads of a record that stays odd for this long wait for the lock, its writer most likely died mid-write
+MAX_SPINS = 1000
+
+
+def default_path(name: str) -> str:
+    # tmpfs keeps the scoreboard in memory, the file is only how processes find it
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, f'{name}.proxy-state')
+
+
+class SharedProxyState:
+    # One lock per file and process, the file lock alone doesn't keep threads of the same process apart
+    _thread_locks = {}
+
+    def __init__(self, path: str = None, capacity: int = 4096):
+        """
+        Proxy health shared by all the worker processes of one host: a memory mapped array of fixed size proxy
+        records. Every process that opens the same path sees the same scores, failures and cooldowns.
+
+        Writes are serialized with a lock on the file, reads don't lock: every record has a sequence number that is
+        odd while the record is written, readers retry until they got a consistent copy. A record that stays odd
+        because its writer died is made consistent again under the lock.
+
+        :param path: The file backing the array, defaults to /dev/shm/request_generator.proxy-state.
+        :param capacity: Maximum number of proxies, only used by the process that creates the file.
+        """
+        self.path = path or default_path('request_generator')
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.thread_lock = self._thread_locks.setdefault(os.path.realpath(self.path), threading.Lock())
+
+        with self._locked():
+            size = os.fstat(self.fd).st_size
+            if size == 0:
+                size = HEADER.size + capacity * RECORD.size
+                os.ftruncate(self.fd, size)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, capacity, 0), 0)
+
+            magic, self.capacity, _ = HEADER.unpack(os.pread(self.fd, HEADER.size, 0))
+            if magic != MAGIC:
+                os.close(self.fd)
+                raise ValueError(f"{self.path} is not a proxy state file")
+
+            self.buffer = mmap.mmap(self.fd, size)
+
+        self.slots = {}
+        self.scanned = 0
+        self.full_logged = False
+
+    def __reduce__(self):
+        # Workers get the path and map the same file
+        return self.__class__, (self.path, self.capacity)
+
+    def __len__(self) -> int:
+        return COUNT.unpack_from(self.buffer, COUNT_OFFSET)[0]
+
+    @contextmanager
+    def _locked(self):
+        with self.thread_lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _offset(slot: int) -> int:
+        return HEADER.size + slot * RECORD.size
+
+    @staticmethod
+    def _encode(key: tuple) -> bytes:
+        return f'{key[0]}:{key[1]}'.encode()
+
+    def _find(self, name: bytes) -> [int, None]:
+        slot = self.slots.get(name)
+        if slot is not None:
+            return slot
+
+        # Only look at the slots other processes added since the last scan, a slot never changes its proxy
+        count = len(self)
+        for slot in range(self.scanned, count):
+            offset = self._offset(slot) + SEQ.size
+            self.slots[bytes(self.buffer[offset:offset + 64]).rstrip(b'\0')] = slot
+        self.scanned = count
+
+        return self.slots.get(name)
+
+    def _allocate(self, name: bytes, stats: ProxyStats) -> [int, None]:
+        # Called with the lock held
+        slot = self._find(name)
+        if slot is not None:
+            return slot
+
+        slot = len(self)
+        if slot >= self.capacity:
+            if not self.full_logged:
+                logger.warning("Proxy state %s is full, new proxies keep their stats per process", self.path)
+                self.full_logged = True
+            return None
+
+        self._write(slot, name, stats, 0)
+        COUNT.pack_into(self.buffer, COUNT_OFFSET, slot + 1)
+        return self._find(name)
+
+    def _write(self, slot: int, name: bytes, stats: ProxyStats, seq: int):
+        offset = self._offset(slot)
+        SEQ.pack_into(self.buffer, offset, seq + 1)
+        RECORD.pack_into(self.buffer, offset, seq + 1, name,
+                         NAN if stats.latency is None else stats.latency, stats.success_rate,
+                         NAN if stats.last_failure is None else stats.last_failure, stats.open_until,
+                         stats.consecutive_failures, stats.trips)
+        SEQ.pack_into(self.buffer, offset, seq + 2)
+
+    def _read(self, slot: int, stats: ProxyStats, locked: bool = False) -> int:
+        offset = self._offset(slot)
+        for _ in range(1 if locked else MAX_SPINS):
+            values = RECORD.unpack_from(self.buffer, offset)
+            seq = values[0]
+            # An odd sequence means a write is in progress, a changed one that it happened while we read
+            if not seq & 1 and SEQ.unpack_from(self.buffer, offset)[0] == seq:
+                break
+        else:
+            if not locked:
+                with self._locked():
+                    return self._read(slot, stats, locked=True)
+
+            # Writers hold the lock, a record that is still odd under it was left behind by a process that died
+            logger.warning("Repairing proxy state record %s of %s left torn by a dead writer", slot, self.path)
+            seq += 1
+            SEQ.pack_into(self.buffer, offset, seq)
+
+        _, _, latency, stats.success_rate, last_failure, stats.open_until, stats.consecutive_failures, \
+            stats.trips = values
+        stats.latency = None if math.isnan(latency) else latency
+        stats.last_failure = None if math.isnan(last_failure) else last_failure
+        return seq
+
+    def read(self, key: tuple, stats: ProxyStats) -> bool:
+        """
+        Copies the shared stats of the proxy with `key` into `stats`, False if no process recorded it yet.
+        """
+        slot = self._find(self._encode(key))
+        if slot is None:
+            return False
+
+        self._read(slot, stats)
+        return True
+
+    @contextmanager
+    def update(self, key: tuple, stats: ProxyStats):
+        """
+        Locks the record of the proxy with `key` and loads it into `stats`, which is written back on exit. A proxy
+        without a record gets one initialized from `stats`.
+        """
+        name = self._encode(key)
+
+        with self._locked():
+            slot = self._allocate(name, stats)
+            if slot is None:
+                yield stats
+                return
+
+            seq = self._read(slot, stats, locked=True)
+            yield stats
+            self._write(slot, name, stats, seq)
+
+    def close(self):
+        self.buffer.close()
+        os.close(self.fd)
+
+    def unlink(self):
+        # Removes the file, processes that still have it mapped keep working on their copy
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SharedProxyScorer(ProxyScorer):
+    def __init__(self, state: SharedProxyState, **kwargs):
+        """
+        A ProxyScorer whose proxy stats live in a SharedProxyState, so every worker process scores and cools down
+        proxies on what all of them observed. Per host stats stay in the process.
+
+        :param state: The SharedProxyState of the host.
+        :param kwargs: The ProxyScorer settings, every process should use the same ones.
+        """
+        super().__init__(**kwargs)
+        self.state = state
+
+    def stats_of(self, record: ProxyRecord) -> ProxyStats:
+        stats = ProxyScorer.stats_of(record)
+        self.state.read(record.key, stats)
+        return stats
+
+    def record(self, record: ProxyRecord, success: bool, latency: float = None, host: str = None):
+        now = time.monotonic()
+
+        # Read, update and write back under the lock so concurrent results from other processes aren't lost
+        with self.state.update(record.key, ProxyScorer.stats_of(record)) as stats:
+            self._update(stats, success, latency, now)
+
+        if self.per_host and host:
+            self._update(self._host_stats_of(record, host), success, latency, now)
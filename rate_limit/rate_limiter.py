@@ -0,0 +1,145 @@
+import asyncio
+from urllib.parse import urlsplit
+
+from logs.Logger import get_logger
+from rate_limit.token_bucket import TokenBucket
+from sessions.client_cache import ClientCache
+
+logger = get_logger(__name__)
+
+
+class RateLimiter:
+    def __init__(self, host_rate: float = None, host_burst: int = 1, host_concurrency: int = None,
+                 proxy_rate: float = None, proxy_burst: int = 1, proxy_concurrency: int = None,
+                 host_overrides: dict = None, adaptive: bool = True, throttle_codes=(429, 503),
+                 max_entries: int = 10000, idle_timeout: float = 300):
+        """
+        Limits request rate and concurrency per target host and per proxy. Every limit is optional, a RateLimiter
+        without any limits is a no-op.
+
+        :param host_rate: Requests per second allowed per host, None disables host rate limiting.
+        :param host_burst: Burst size of the host token buckets.
+        :param host_concurrency: Maximum requests in flight per host, None means unlimited.
+        :param proxy_rate: Requests per second allowed per proxy, None disables proxy rate limiting.
+        :param proxy_burst: Burst size of the proxy token buckets.
+        :param proxy_concurrency: Maximum requests in flight per proxy, None means unlimited.
+        :param host_overrides: Dictionary of host -> dict(rate=..., burst=..., concurrency=...) for specific origins.
+        :param adaptive: Lower the host rate on throttle responses and slowly raise it again on success.
+        :param throttle_codes: Status codes that are treated as the origin asking us to slow down.
+        :param max_entries: Number of hosts and of proxies the limiter keeps state for, the least recently used ones
+                            are dropped beyond that.
+        :param idle_timeout: Seconds after which the state of a host or proxy that isn't used anymore is dropped.
+        """
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.host_concurrency = host_concurrency
+        self.proxy_rate = proxy_rate
+        self.proxy_burst = proxy_burst
+        self.proxy_concurrency = proxy_concurrency
+        self.host_overrides = host_overrides or {}
+        self.adaptive = adaptive
+        self.throttle_codes = set(throttle_codes)
+
+        # Only hosts and proxies that actually have a limit get an entry, unused ones are dropped again
+        self.host_buckets = ClientCache(self._create_host_bucket, max_clients=max_entries, idle_timeout=idle_timeout)
+        self.proxy_buckets = ClientCache(lambda proxy: TokenBucket(self.proxy_rate, self.proxy_burst),
+                                         max_clients=max_entries, idle_timeout=idle_timeout)
+        self.host_semaphores = ClientCache(
+            lambda host: asyncio.Semaphore(self._host_setting(host, 'concurrency', self.host_concurrency)),
+            max_clients=max_entries, idle_timeout=idle_timeout)
+        self.proxy_semaphores = ClientCache(lambda proxy: asyncio.Semaphore(self.proxy_concurrency),
+                                            max_clients=max_entries, idle_timeout=idle_timeout)
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlsplit(url).netloc
+
+    def _host_setting(self, host: str, name: str, default):
+        return self.host_overrides.get(host, {}).get(name, default)
+
+    def _create_host_bucket(self, host: str) -> TokenBucket:
+        return TokenBucket(self._host_setting(host, 'rate', self.host_rate),
+                           self._host_setting(host, 'burst', self.host_burst))
+
+    def _limits(self, host: str, proxy: [str, None]) -> list:
+        """
+        The (cache, key) pairs of the semaphores and token buckets that apply to a request, semaphores first.
+        """
+        limits = []
+        if self._host_setting(host, 'concurrency', self.host_concurrency):
+            limits.append((self.host_semaphores, host))
+        if self.proxy_concurrency:
+            limits.append((self.proxy_semaphores, proxy))
+        if self._host_setting(host, 'rate', self.host_rate):
+            limits.append((self.host_buckets, host))
+        if self.proxy_rate:
+            limits.append((self.proxy_buckets, proxy))
+        return limits
+
+    def limit(self, url: str, proxy: str = None) -> 'RateLimitPermit':
+        """
+        Returns an async context manager that waits for the host and proxy limits and holds the concurrency slots
+        while the request runs.
+
+        :param url: The URL that is going to be requested.
+        :param proxy: The proxy string the request goes through, None for direct requests.
+        """
+        return RateLimitPermit(self, self.host_of(url), proxy)
+
+    def record(self, url: str, status: int):
+        """
+        Feeds a response status back into the adaptive host rate.
+        """
+        if not self.adaptive:
+            return
+
+        host = self.host_of(url)
+        bucket = self.host_buckets.peek(host)
+        if bucket is None:
+            return
+
+        if status in self.throttle_codes:
+            bucket.on_throttle()
+            logger.warning("Throttled by %s with status %s, lowering rate to %.2f/s", host, status, bucket.rate)
+        elif 200 <= status < 300:
+            bucket.on_success()
+
+
+class RateLimitPermit:
+    def __init__(self, limiter: RateLimiter, host: str, proxy: str = None):
+        self.limiter = limiter
+        self.host = host
+        self.proxy = proxy
+        self.waited = 0.0
+        self._semaphores = []
+        # The (cache, key) pairs in use, their state isn't dropped while the request runs
+        self._acquired = []
+
+    async def __aenter__(self):
+        try:
+            for cache, key in self.limiter._limits(self.host, self.proxy):
+                limit = cache.acquire(key)
+                self._acquired.append((cache, key))
+
+                if isinstance(limit, asyncio.Semaphore):
+                    await limit.acquire()
+                    self._semaphores.append(limit)
+                else:
+                    self.waited += await limit.acquire()
+        except BaseException:
+            self._release()
+            raise
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._release()
+
+    def _release(self):
+        for semaphore in self._semaphores:
+            semaphore.release()
+        self._semaphores = []
+
+        for cache, key in self._acquired:
+            cache.release(key)
+        self._acquired = []
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1, min_rate: float = None, max_rate: float = None,
+                 decrease_factor: float = 0.5, increase_step: float = 0.5):
+        """
+        Async token bucket with AIMD rate adaptation.
+
+        :param rate: Tokens added per second.
+        :param burst: Maximum number of tokens the bucket can hold.
+        :param min_rate: Lower bound for the adapted rate, defaults to a tenth of the initial rate.
+        :param max_rate: Upper bound for the adapted rate, defaults to the initial rate.
+        :param decrease_factor: Multiplier applied to the rate when the origin throttles us.
+        :param increase_step: Roughly how many requests per second the rate grows per second of successes.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate if min_rate is not None else rate / 10
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        """
+        Waits until a token is available and takes it.
+
+        :return: The number of seconds spent waiting.
+        """
+        started_at = time.monotonic()
+
+        # The lock keeps waiters in FIFO order so a burst of callers can't starve an early one
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return time.monotonic() - started_at
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_throttle(self):
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        # Drop the saved up burst as well, otherwise the next requests hit the origin right away again
+        self.tokens = min(self.tokens, 1)
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            self._refill()
+            # Additive increase, dividing by the rate makes the growth per second independent of the request rate
+            self.rate = min(self.max_rate, self.rate + self.increase_step / self.rate)
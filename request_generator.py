@@ -1,23 +1,119 @@
 import asyncio
-import ssl
+import time
+from enum import Enum
 from typing import Callable
+from urllib.parse import urlencode, urlsplit
 
 import aiohttp
 
+from cache.response_cache import CachedResponse, ResponseCache
+from cache.single_flight import SingleFlight
+from hedging.hedge_policy import HedgePolicy
+from identity.identity_pool import Identity, IdentityPool
 from logs.Logger import get_logger
+from metrics.metrics import Metrics, NullMetrics
+from metrics.tracing import create_trace_config
 from proxy.proxy_manager import ProxyManager
+from rate_limit.rate_limiter import RateLimiter
 
-from retry_strategies.retry_strategy import RetryStrategy
+from retry_strategies.retry_strategy import RetryState, RetryStrategy
+from scheduling.request_scheduler import DeadlineExceededError, Priority, RequestScheduler
+from sessions.session_pool import SessionPool
+from timeouts.timeout_policy import TimeoutPolicy, Timeouts
+from transports.aiohttp_transport import AiohttpTransport
+from transports.transport import Transport
 
 logger = get_logger(__name__)
 
+
+class HttpMethod(Enum):
+    GET = 'GET'
+    POST = 'POST'
+    PUT = 'PUT'
+    PATCH = 'PATCH'
+    DELETE = 'DELETE'
+    HEAD = 'HEAD'
+
+
+class ResponseMode(Enum):
+    TEXT = 'TEXT'
+    BYTES = 'BYTES'
+    # The body is fed chunk by chunk to a StreamParser and the parse result is returned
+    STREAM = 'STREAM'
+
+
+class ResponseTooLargeError(Exception):
+    pass
+
+
+class StreamParseError(Exception):
+    pass
+
+
+class PreparedRequest:
+    __slots__ = ('method', 'url', 'headers', 'cookies', 'params', 'data', 'json', 'timeout', 'mode',
+                 'stream_parser', 'default_headers', 'priority', 'tenant', 'transport')
+
+    def __init__(self, method: HttpMethod, url: str, headers: dict, cookies: dict = None, params: dict = None,
+                 data=None, json=None, timeout=None, mode: ResponseMode = ResponseMode.TEXT,
+                 stream_parser: Callable = None, default_headers: bool = False,
+                 priority: Priority = Priority.NORMAL, tenant: str = None, transport: Transport = None):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.cookies = cookies
+        self.params = params
+        self.data = data
+        self.json = json
+        self.timeout = timeout
+        self.mode = mode
+        self.stream_parser = stream_parser
+        # The generator's default headers are used, an identity's header profile may replace them
+        self.default_headers = default_headers
+        self.priority = priority
+        self.tenant = tenant
+        self.transport = transport
+
+    @property
+    def cache_url(self) -> str:
+        # Query params are part of the cached resource
+        if not self.params:
+            return self.url
+        return f"{self.url}{'&' if '?' in self.url else '?'}{urlencode(sorted(self.params.items()))}"
+
+
 class RequestGenerator:
-    def __init__(self, headers=None, retry_strategy: RetryStrategy = None):
+    def __init__(self, headers=None, retry_strategy: RetryStrategy = None, session_pool: SessionPool = None,
+                 rate_limiter: RateLimiter = None, cache: ResponseCache = None, coalesce: bool = True,
+                 max_body_size: int = None, chunk_size: int = 64 * 1024, timeout=5,
+                 verify_ssl: bool = False, metrics: Metrics = None, hedge: HedgePolicy = None,
+                 identity_pool: IdentityPool = None, scheduler: RequestScheduler = None, transports: dict = None,
+                 default_transport: str = AiohttpTransport.name):
         """
         Initializes a new RequestGenerator object with the provided headers and retry strategy.
+        Use it as an async context manager so the pooled sessions are closed when you are done.
 
         :param headers: A dictionary of headers to be used in the HTTP requests.
         :param retry_strategy: A RetryStrategy object to be used in case of failed requests.
+        :param session_pool: A SessionPool holding the long-lived sessions, a default pool is created if omitted.
+        :param rate_limiter: A RateLimiter applying per host and per proxy limits, no limits are applied if omitted.
+        :param cache: An optional ResponseCache for GET requests, nothing is cached if omitted.
+        :param coalesce: Share one request between identical GET requests that are in flight at the same time.
+        :param max_body_size: Responses with a bigger body (in bytes) are dropped, None means no limit.
+        :param chunk_size: The size of the chunks fed to stream parsers.
+        :param timeout: A TimeoutPolicy with connect / read / total limits, per host overrides and an optional
+                        deadline across retries, or just the total timeout of a single attempt in seconds.
+        :param verify_ssl: Verify TLS certificates, off by default because many proxies break verification.
+        :param metrics: A Metrics registry to record request, retry, rate limiter, cache and connection metrics in.
+        :param hedge: A HedgePolicy to send a duplicate of slow idempotent requests through another proxy, no hedging
+                      if omitted.
+        :param identity_pool: An IdentityPool of cookie jars and header profiles pinned to proxies, rotated when a
+                              host blocks them. Requests use the default headers and no cookie jar if omitted.
+        :param scheduler: A RequestScheduler sharing a number of slots between attempts by priority, tenant and
+                          deadline, with a reserved share for retries. Attempts aren't queued if omitted.
+        :param transports: Dictionary of name -> Transport of additional backends, e.g. {'h2': HttpxTransport()}.
+                           The aiohttp transport on the session pool is always there as 'aiohttp'.
+        :param default_transport: Name of the transport of requests that don't choose one.
         """
 
         logger.info("Initializing RequestGenerator")
@@ -29,104 +125,438 @@ class RequestGenerator:
                 "Accept-Language": "en-US,en;q=0.9",
                 "Connection": "keep-alive",
                 "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
-                              "Chrome/106.0.0.0 Safari/537.36 "
+                              "Chrome/106.0.0.0 Safari/537.36"
             }
 
         self.headers = headers
         self.retry_strategy = retry_strategy
-
-    async def get(self, url, headers=None, cookies=None, proxy: dict = None, message_id=None):
+        self.session_pool = session_pool or SessionPool()
+        self.transports = {AiohttpTransport.name: AiohttpTransport(self.session_pool), **(transports or {})}
+        if default_transport not in self.transports:
+            raise ValueError(f"Unknown default transport {default_transport}")
+        self.default_transport = default_transport
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.scheduler = scheduler or RequestScheduler()
+        self.cache = cache
+        self.coalesce = coalesce
+        self.single_flight = SingleFlight()
+        self.max_body_size = max_body_size
+        self.chunk_size = chunk_size
+        self.timeout_policy = timeout if isinstance(timeout, TimeoutPolicy) else TimeoutPolicy(total=timeout)
+        self.ssl = None if verify_ssl else False
+        self.metrics = metrics or NullMetrics()
+        self.hedge = hedge
+        self.identity_pool = identity_pool
+        self.in_flight = 0
+
+        if identity_pool is not None:
+            identity_pool.bind(self.session_pool, retry_strategy.proxy_manager if retry_strategy else None, self.ssl)
+
+        if self.metrics.enabled:
+            # DNS, connect and time to first byte come from aiohttp's tracing hooks
+            self.session_pool.trace_configs.append(create_trace_config(self.metrics))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        if self.identity_pool is not None:
+            await self.identity_pool.close()
+        await asyncio.gather(*(transport.close() for transport in self.transports.values()))
+        if self.retry_strategy is not None:
+            self.retry_strategy.close()
+
+    def capabilities(self) -> dict:
         """
-        Sends an HTTP GET request to the specified URL with the specified headers and cookies.
+        The capabilities of every transport by name, see TransportCapabilities.
+        """
+        return {name: transport.capabilities.to_dict() for name, transport in self.transports.items()}
 
-        :param url: The URL to send the GET request to.
-        :param headers: A dictionary of headers to be used in the GET request.
-        :param cookies: A dictionary of cookies to be used in the GET request.
+    async def request(self, method, url, headers=None, cookies=None, params=None, data=None, json=None,
+                      proxy: dict = None, message_id=None, timeout=None, mode: ResponseMode = None,
+                      stream_parser: Callable = None, priority: Priority = Priority.NORMAL, tenant: str = None,
+                      transport: str = None):
+        """
+        Sends an HTTP request with retries. Every method goes through this single path, get/post/put/... are
+        shortcuts for it. Identical GET requests that are in flight at the same time share one request and get the
+        same result object.
+
+        :param method: The HttpMethod (or its name) of the request.
+        :param url: The URL to send the request to.
+        :param headers: A dictionary of headers, the generator's default headers are used if omitted.
+        :param cookies: A dictionary of cookies to be used in the request.
+        :param params: A dictionary of query parameters.
+        :param data: A form dictionary or raw body (str/bytes).
+        :param json: An object sent as JSON body.
         :param proxy: A dictionary representing the proxy to use for the request.
         :param message_id: An identifier for the message associated with the request.
-        :return: The response text if the request was successful, otherwise None.
+        :param timeout: Overrides the generator's timeouts for this request: a Timeouts, a dictionary of its fields
+                        (total, connect, sock_read, deadline) or the total timeout of a single attempt in seconds.
+        :param mode: ResponseMode.TEXT (default) returns the decoded text, ResponseMode.BYTES the raw body as bytes
+                     and ResponseMode.STREAM feeds the body to a parser created by stream_parser.
+        :param stream_parser: A callable (e.g. a StreamParser class) returning a new StreamParser, used in STREAM mode.
+        :param priority: The Priority class the scheduler queues the request's attempts in.
+        :param tenant: The tenant or job the request belongs to, the scheduler shares slots fairly between tenants.
+        :param transport: Name of the transport to send the request with, the default transport if omitted.
+        :return: The response body (or parse result) if the request was successful, otherwise None.
         """
-
+        method = HttpMethod(method.upper() if isinstance(method, str) else method)
+        default_headers = not headers
         headers = headers or self.headers
-        response = None
-
-        try:
-            logger.info(f"Inside the get method for URL: {url}")
-            async with aiohttp.ClientSession(headers=headers, cookies=cookies, timeout=5) as session:
-                async with session.get(url=url, proxy=ProxyManager.proxy_to_string(proxy), ssl=False, timeout=5) as response:
-                    if response.status != 200 and response.status != 201:
-                        raise aiohttp.ClientError(f"Unexpected status code {response.status} for URL: {url}")
-
-                    logger.info(f"Succesfully made request for URL: {url}")
-                    self.retry_strategy.update_proxy_rank(proxy, 1)
-                    self.retry_strategy.reset_retries()
-                    return await response.text()
+        mode = mode or ResponseMode.TEXT
 
-                # return response.text()
+        if mode == ResponseMode.STREAM and stream_parser is None:
+            raise ValueError("stream_parser is required in STREAM mode")
 
-        except (aiohttp.ClientError, asyncio.TimeoutError, AttributeError) as e:
+        transport_name = transport or self.default_transport
+        if transport_name not in self.transports:
+            raise ValueError(f"Unknown transport {transport_name}")
 
-            logger.error(f"Request failed for URL: {url}, with id: {message_id}. Going to evaluate.")
+        request = PreparedRequest(method, url, headers, cookies, params, data, json, timeout, mode, stream_parser,
+                                  default_headers, Priority(priority), tenant, self.transports[transport_name])
 
-            # If the request failed, evaluate the retry strategy to determine if the request should be retried
-            # Check retry strategy to see the evaluation logic
-            if self.retry_strategy.evaluate(response=response, message_id=message_id):
+        # Only idempotent GETs are shared, parsers are stateful so streamed requests never are
+        if not self.coalesce or method != HttpMethod.GET or mode == ResponseMode.STREAM:
+            return await self._request(request, proxy, message_id)
 
-                logger.warning(f"Retrying request for URL: {url}")
-                # Decrease the rank of the proxy that was used for the failed request
-                self.retry_strategy.update_proxy_rank(proxy, -1)
+        # The query params are part of the url the key is built from, a dict couldn't go into the key itself.
+        # Requests only share with their own priority class and tenant, an interactive request joining a queued bulk
+        # one would wait behind the backfill
+        key = SingleFlight.make_key(method.value, request.cache_url, headers, cookies, mode, request.priority, tenant)
+        return await self.single_flight.do(key, lambda: self._request(request, proxy, message_id))
 
-                # Get new proxy and new cookies for new request
-                new_proxy = self.retry_strategy.get_new_proxy()
-                new_cookies = self.retry_strategy.get_new_cookies()
-
-                # Try again
-                return await self.get(url, headers, new_cookies, new_proxy, message_id)
-
-            else:
-                logger.error(f"Request failed for URL: {url}, status code: {response.status if response else 0}, returning None")
-                return None
+    async def get(self, url, headers=None, cookies=None, proxy: dict = None, message_id=None, **kwargs):
+        """
+        Sends an HTTP GET request to the specified URL with the specified headers and cookies.
+        See request for the other keyword arguments.
+        """
+        return await self.request(HttpMethod.GET, url, headers, cookies, proxy=proxy, message_id=message_id,
+                                  **kwargs)
 
-    async def post(self, url, headers=None, body=None, proxy: dict = None, message_id=None):
+    async def post(self, url, headers=None, body=None, proxy: dict = None, message_id=None, **kwargs):
         """
         Sends an HTTP POST request to the specified URL with the specified headers and body.
-
-        :param url: The URL to send the POST request to.
-        :param headers: A dictionary of headers to be used in the POST request
-        :param body: The body of the POST request.
-        :param proxy: A dictionary representing the proxy to use for the request.
-        :param message_id: An identifier for the message associated with the request.
-
-        :return: The response text if the request was successful, otherwise None.
-    """
-        headers = headers or self.headers
-        response = None
+        See request for the other keyword arguments.
+        """
+        return await self.request(HttpMethod.POST, url, headers, data=body, proxy=proxy, message_id=message_id,
+                                  **kwargs)
+
+    async def put(self, url, headers=None, body=None, proxy: dict = None, message_id=None, **kwargs):
+        return await self.request(HttpMethod.PUT, url, headers, data=body, proxy=proxy, message_id=message_id,
+                                  **kwargs)
+
+    async def patch(self, url, headers=None, body=None, proxy: dict = None, message_id=None, **kwargs):
+        return await self.request(HttpMethod.PATCH, url, headers, data=body, proxy=proxy, message_id=message_id,
+                                  **kwargs)
+
+    async def delete(self, url, headers=None, proxy: dict = None, message_id=None, **kwargs):
+        return await self.request(HttpMethod.DELETE, url, headers, proxy=proxy, message_id=message_id, **kwargs)
+
+    async def head(self, url, headers=None, proxy: dict = None, message_id=None, **kwargs):
+        return await self.request(HttpMethod.HEAD, url, headers, proxy=proxy, message_id=message_id, **kwargs)
+
+    async def _request(self, request: PreparedRequest, proxy: dict, message_id):
+        url = request.url
+        headers = request.headers
+        mode = request.mode
+        host = urlsplit(url).netloc
+
+        cached = None
+        request_headers = headers
+        use_cache = (self.cache is not None and request.method == HttpMethod.GET and mode != ResponseMode.STREAM
+                     and not self.cache.bypass(headers))
+
+        if use_cache:
+            cached = await self.cache.get(request.cache_url, headers)
+            if cached is not None and cached.is_fresh():
+                self.cache.record_hit()
+                self.metrics.increment('cache_requests_total', result='hit')
+                return self._cached_body(cached, mode)
+
+            # Stale entries are revalidated, a 304 answer means we can keep serving the cached body
+            if cached is not None:
+                request_headers = {**headers, **cached.validators()}
+
+        timeouts = self.timeout_policy.timeouts_for(host, request.timeout)
+        state = self.retry_strategy.new_state(message_id, self.timeout_policy.deadline_at(timeouts))
+        self.in_flight += 1
+        self.metrics.gauge('requests_in_flight', self.in_flight)
 
         try:
-            logger.info(f"Inside the post method for id: {message_id}")
-            async with aiohttp.ClientSession(headers=headers, timeout=5) as session:
-                async with session.post(url=url, data=body, proxy=ProxyManager.proxy_to_string(proxy), timeout=5) as response:
-                    if response.status != 200 and response.status != 201:
-                        raise aiohttp.ClientError(f"Unexpected status code {response.status} for URL: {url}")
-
-                    logger.info(f"Succesfully made request for URL: {url} with id: {message_id}")
-                    self.retry_strategy.update_proxy_rank(proxy, 1)
-                    self.retry_strategy.reset_retries()
-                    return await response.text()
-
-                # return response.text()
-
-        except (aiohttp.ClientError, asyncio.TimeoutError, AttributeError) as e:
+            if self.hedge is not None and self.hedge.applies(request.method.value):
+                return await self._hedged_send(request, request_headers, cached, use_cache, host, proxy, message_id,
+                                               state, timeouts)
+            return await self._send(request, request_headers, cached, use_cache, host, proxy, message_id, state,
+                                    timeouts)
+        finally:
+            self.in_flight -= 1
+            self.metrics.gauge('requests_in_flight', self.in_flight)
+
+    async def _hedged_send(self, request: PreparedRequest, request_headers: dict, cached: [CachedResponse, None],
+                           use_cache: bool, host: str, proxy: dict, message_id, state: RetryState,
+                           timeouts: Timeouts):
+        """
+        Sends the request and, if it is still running after the hedge delay of the host, a duplicate through another
+        proxy. The first successful result wins and the other attempt is cancelled.
+        """
+        self.hedge.record_request()
 
-            logger.error(f"Request failed for URL: {url}, with id: {message_id}. Going to evaluate.")
+        primary = asyncio.ensure_future(self._send(request, request_headers, cached, use_cache, host, proxy,
+                                                   message_id, state, timeouts))
+        pending = {primary}
 
-            if self.retry_strategy.evaluate(response=response, message_id=message_id):
-                logger.warning(f"Retrying request for URL: {url}")
-                self.retry_strategy.update_proxy_rank(proxy, -1)
+        try:
+            delay = self.hedge.delay(host)
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+
+                if not done:
+                    try:
+                        hedge_proxy = self.retry_strategy.get_hedge_proxy(proxy, host)
+                    except LookupError:
+                        logger.info("No other proxy to hedge request for URL: %s with id: %s", request.url,
+                                    message_id)
+                    else:
+                        if self.hedge.try_hedge():
+                            logger.info("Hedging request for URL: %s with id: %s after %.3fs", request.url,
+                                        message_id, delay)
+                            self.metrics.increment('hedges_total', host=host)
+                            # The hedge has its own retries, it must not use up the ones of the primary request
+                            hedge_state = RetryState(message_id, state.deadline)
+                            pending.add(asyncio.ensure_future(self._send(request, request_headers, cached, use_cache,
+                                                                         host, hedge_proxy, message_id, hedge_state,
+                                                                         timeouts)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is not None:
+                        if task is not primary:
+                            self.metrics.increment('hedge_wins_total', host=host)
+                        return result
+
+            return None
+
+        finally:
+            # Cancel the loser, or both attempts when the caller was cancelled
+            for task in pending:
+                task.cancel()
+
+    async def _send(self, request: PreparedRequest, request_headers: dict, cached: [CachedResponse, None],
+                    use_cache: bool, host: str, proxy: dict, message_id, state: RetryState, timeouts: Timeouts):
+        url = request.url
+        headers = request.headers
+        mode = request.mode
+
+        # Every request (and every hedge) gets its own identity, it brings its cookies and its pinned proxy
+        identity = None
+        if self.identity_pool is not None:
+            identity = self.identity_pool.acquire(host)
+            if proxy is None:
+                proxy = identity.proxy
+
+        while True:
+            response = None
+            proxy_label = 'direct'
+            blocked = False
+
+            client_timeout = self.timeout_policy.client_timeout(timeouts, state.deadline)
+            if client_timeout is None:
+                logger.error("Deadline exceeded for URL: %s, with id: %s after %s retries", url, message_id,
+                             state.retries)
+                self.metrics.increment('deadline_exceeded_total', host=host)
+                return None
 
-                new_proxy = self.retry_strategy.get_new_proxy()
+            try:
+                logger.info("Sending %s request for URL: %s with id: %s", request.method.value, url, message_id)
+                proxy_str = ProxyManager.proxy_to_string(proxy)
+                proxy_label = proxy_str or 'direct'
+                attempt_headers, attempt_cookies = self._identity_headers(request, request_headers, cached, identity)
+                slot = self.scheduler.slot(request.priority, request.tenant, state.deadline, retry=state.retries > 0)
+                async with slot, self.rate_limiter.limit(url, proxy_str) as permit:
+                    if self.scheduler.concurrency:
+                        self.metrics.observe('scheduler_wait_seconds', slot.waited, priority=request.priority.name)
+                    self.metrics.observe('rate_limit_wait_seconds', permit.waited, host=host)
+                    if state.deadline is not None:
+                        # Waiting for a slot and for the rate limiter ate into the deadline
+                        client_timeout = self.timeout_policy.client_timeout(timeouts, state.deadline)
+                        if client_timeout is None:
+                            raise DeadlineExceededError("Deadline passed while waiting to be sent")
+                    started_at = time.perf_counter()
+                    async with request.transport.request(request.method.value, url, headers=attempt_headers,
+                                                         cookies=attempt_cookies, params=request.params,
+                                                         data=request.data, json=request.json, proxy=proxy_str,
+                                                         ssl=self.ssl, timeout=client_timeout) as response:
+                        latency = time.perf_counter() - started_at
+                        self.rate_limiter.record(url, response.status)
+
+                        labels = dict(host=host, proxy=proxy_label, status=response.status, attempt=state.retries + 1)
+                        self.metrics.increment('requests_total', **labels)
+                        self.metrics.observe('request_latency_seconds', latency, **labels)
+
+                        if identity is not None:
+                            self.identity_pool.update_cookies(identity, response.cookies)
+                            blocked = self.identity_pool.is_blocked_status(response.status)
+
+                        if cached is not None and response.status == 304:
+                            logger.info("Cached response for URL: %s is still valid", url)
+                            self.retry_strategy.report_proxy_result(proxy, True, latency, host)
+                            self._record_latency(host, latency)
+                            self.cache.record_hit(revalidated=True)
+                            self.metrics.increment('cache_requests_total', result='revalidated')
+                            await self.cache.refresh(request.cache_url, headers, cached, response.headers)
+                            return self._cached_body(cached, mode)
+
+                        if not 200 <= response.status < 300:
+                            raise aiohttp.ClientError(f"Unexpected status code {response.status} for URL: {url}")
+
+                        logger.info("Succesfully made request for URL: %s with id: %s", url, message_id)
+                        self.retry_strategy.report_proxy_result(proxy, True, latency, host)
+                        self._record_latency(host, latency)
+
+                        if not use_cache:
+                            result = await self._read_response(response, mode, request.stream_parser)
+                            if self._is_block_page(identity, response, result):
+                                blocked = True
+                                raise aiohttp.ClientError(f"Block page returned for URL: {url}")
+                            return result
+
+                        body = await self._read_body(response)
+                        if self._is_block_page(identity, response, body):
+                            # Block pages must not end up in the cache
+                            blocked = True
+                            raise aiohttp.ClientError(f"Block page returned for URL: {url}")
+                        self.cache.record_miss()
+                        self.metrics.increment('cache_requests_total', result='miss')
+                        await self.cache.store(request.cache_url, headers, response.status, response.headers, body,
+                                               response.charset)
+
+                        return body if mode == ResponseMode.BYTES else await self._decode(response, body)
+
+            except (ResponseTooLargeError, StreamParseError) as e:
+                logger.error("Dropping response for URL: %s, with id: %s: %s", url, message_id, e)
+                return None
 
-                return await self.post(url=url, headers=headers, body=body, proxy=new_proxy, message_id=message_id)
-            else:
-                logger.error(f"Request failed for URL: {url}, status code: {response.status if response else 0}, returning None")
+            except DeadlineExceededError as e:
+                # Expired work is dropped before it is sent
+                logger.error("Dropping request for URL: %s, with id: %s: %s", url, message_id, e)
+                self.metrics.increment('deadline_exceeded_total', host=host)
                 return None
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, AttributeError) as e:
+
+                logger.error("Request failed for URL: %s, with id: %s. Going to evaluate.", url, message_id)
+
+                if response is None:
+                    self.metrics.increment('request_errors_total', host=host, proxy=proxy_label,
+                                           error=type(e).__name__, attempt=state.retries + 1)
+
+                # If the request failed, evaluate the retry strategy to determine if the request should be retried
+                # Check retry strategy to see the evaluation logic
+                if not self.retry_strategy.evaluate(response=response, state=state):
+                    logger.error("Request failed for URL: %s, status code: %s, returning None", url,
+                                 response.status if response else 0)
+                    return None
+
+                delay = self.retry_strategy.get_delay(state, response)
+
+                # Don't sleep through the deadline just to give up afterwards
+                if state.deadline is not None and time.monotonic() + delay >= state.deadline:
+                    logger.error("Deadline for URL: %s, with id: %s would pass during backoff, returning None", url,
+                                 message_id)
+                    self.metrics.increment('deadline_exceeded_total', host=host)
+                    return None
+
+                logger.warning("Retrying request for URL: %s", url)
+                self.metrics.increment('retries_total', host=host)
+                # Lower the score of the proxy that was used for the failed request
+                self.retry_strategy.report_proxy_result(proxy, False, host=host)
+
+                if blocked:
+                    # The host blocked this identity, the retry uses another one with its own proxy
+                    self.metrics.increment('identity_rotations_total', host=host)
+                    identity = self.identity_pool.rotate(identity)
+                    proxy = identity.proxy
+                else:
+                    # Get new proxy for the next attempt and back off before trying again
+                    try:
+                        proxy = self.retry_strategy.get_new_proxy(host, proxy)
+                    except LookupError:
+                        logger.error("No proxy left to retry URL: %s, with id: %s, returning None", url, message_id)
+                        return None
+                    if identity is not None:
+                        identity.proxy = proxy
+
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _identity_headers(request: PreparedRequest, request_headers: dict, cached: [CachedResponse, None],
+                          identity: [Identity, None]) -> tuple:
+        if identity is None:
+            return request_headers, request.cookies
+
+        headers = request_headers
+        if request.default_headers:
+            headers = {**identity.headers, **cached.validators()} if cached is not None else identity.headers
+
+        # Cookies passed with the request win over the ones in the identity's jar
+        cookies = {**identity.cookies, **request.cookies} if request.cookies else identity.cookies
+        return headers, cookies
+
+    def _is_block_page(self, identity: [Identity, None], response: aiohttp.ClientResponse, body) -> bool:
+        return identity is not None and self.identity_pool.is_blocked_body(body, response.content_type)
+
+    def _record_latency(self, host: str, latency: float):
+        self.timeout_policy.record(host, latency)
+        if self.hedge is not None:
+            self.hedge.record(host, latency)
+
+    @staticmethod
+    def _cached_body(cached: CachedResponse, mode: ResponseMode):
+        return cached.body if mode == ResponseMode.BYTES else cached.text()
+
+    async def _iter_body(self, response: aiohttp.ClientResponse):
+        max_body_size = self.max_body_size
+
+        if max_body_size is not None and (response.content_length or 0) > max_body_size:
+            raise ResponseTooLargeError(f"Content-Length {response.content_length} exceeds {max_body_size} bytes")
+
+        size = 0
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            size += len(chunk)
+            if max_body_size is not None and size > max_body_size:
+                raise ResponseTooLargeError(f"Body exceeds {max_body_size} bytes")
+            yield chunk
+
+    async def _read_body(self, response: aiohttp.ClientResponse) -> bytes:
+        if self.max_body_size is None:
+            return await response.read()
+        return b''.join([chunk async for chunk in self._iter_body(response)])
+
+    async def _decode(self, response: aiohttp.ClientResponse, body: bytes) -> str:
+        if self.max_body_size is None:
+            # text() decodes the body that read() already loaded, it doesn't read it again
+            return await response.text()
+        return body.decode(response.charset or 'utf-8', errors='replace')
+
+    async def _read_response(self, response: aiohttp.ClientResponse, mode: ResponseMode,
+                             stream_parser: Callable = None):
+        if mode == ResponseMode.STREAM:
+            # A new parser per attempt, a failed attempt can't leave half a body behind
+            parser = stream_parser()
+            try:
+                async for chunk in self._iter_body(response):
+                    parser.feed(chunk)
+                return parser.close()
+            except (ResponseTooLargeError, aiohttp.ClientError, asyncio.TimeoutError):
+                raise
+            except Exception as e:
+                # A body the parser can't handle (e.g. a block page instead of JSON) only fails this request
+                raise StreamParseError(f"{type(e).__name__}: {e}") from e
+
+        body = await self._read_body(response)
+        return body if mode == ResponseMode.BYTES else await self._decode(response, body)
@@ -0,0 +1,82 @@
+import random
+import time
+from abc import ABC, abstractmethod
+from email.utils import parsedate_to_datetime
+
+
+class BackoffPolicy(ABC):
+    """
+    Decides how long to wait before the next attempt of a request.
+    Policies get the per-request RetryState so they can keep their own history on it.
+    """
+
+    @abstractmethod
+    def get_delay(self, state, response=None) -> float:
+        pass
+
+
+class ExponentialBackoff(BackoffPolicy):
+    def __init__(self, base: float = 0.5, factor: float = 2, max_delay: float = 30, jitter: bool = True):
+        """
+        :param base: Delay before the first retry in seconds.
+        :param factor: Multiplier applied for every following retry.
+        :param max_delay: Upper bound for a single delay.
+        :param jitter: Use "full jitter", a random delay between 0 and the exponential value.
+        """
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def get_delay(self, state, response=None) -> float:
+        delay = min(self.max_delay, self.base * self.factor ** max(state.retries - 1, 0))
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class DecorrelatedJitterBackoff(BackoffPolicy):
+    def __init__(self, base: float = 0.5, max_delay: float = 30):
+        """
+        Decorrelated jitter, every delay is picked between base and three times the previous delay.
+        """
+        self.base = base
+        self.max_delay = max_delay
+
+    def get_delay(self, state, response=None) -> float:
+        previous = state.last_delay or self.base
+        return min(self.max_delay, random.uniform(self.base, previous * 3))
+
+
+class RetryAfterBackoff(BackoffPolicy):
+    def __init__(self, fallback: BackoffPolicy = None, max_delay: float = 60):
+        """
+        Honors the Retry-After header of 429/503 responses and uses the fallback policy otherwise.
+
+        :param fallback: The policy used when the response has no usable Retry-After header.
+        :param max_delay: Upper bound for the delay asked by the server.
+        """
+        self.fallback = fallback or ExponentialBackoff()
+        self.max_delay = max_delay
+
+    @staticmethod
+    def parse_retry_after(value: str) -> [float, None]:
+        if not value:
+            return None
+
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+
+        # Retry-After can also be an HTTP date
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def get_delay(self, state, response=None) -> float:
+        headers = getattr(response, 'headers', None)
+        retry_after = self.parse_retry_after(headers.get('Retry-After')) if headers else None
+
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+
+        return self.fallback.get_delay(state, response)
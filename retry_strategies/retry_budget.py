@@ -0,0 +1,44 @@
+import time
+
+from logs.Logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = 0.2, min_retries_per_second: float = 10, max_tokens: float = None):
+        """
+        Global budget shared by all requests, caps retries to a share of the traffic so an outage can't turn
+        into a retry storm.
+
+        Every new request deposits `ratio` tokens and every retry spends one token. On top of that the budget is
+        refilled with `min_retries_per_second` so low traffic can still retry.
+
+        :param ratio: Share of the requests that is allowed to be retried, 0.2 means 20%.
+        :param min_retries_per_second: Retries per second that are always allowed.
+        :param max_tokens: The maximum number of saved up retries, defaults to ten seconds worth of minimum retries.
+        """
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_tokens = max_tokens if max_tokens is not None else max(min_retries_per_second * 10, 1)
+
+        self.tokens = self.max_tokens
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self.updated_at) * self.min_retries_per_second)
+        self.updated_at = now
+
+    def record_request(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill()
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+
+        logger.warning("Retry budget exhausted, not retrying")
+        return False
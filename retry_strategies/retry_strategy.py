@@ -1,58 +1,123 @@
 from abc import ABC
 
-import requests
-
 from proxy.proxy_manager import ProxyManager
 from logs.Logger import get_logger
+from retry_strategies.backoff import BackoffPolicy, RetryAfterBackoff
+from retry_strategies.retry_budget import RetryBudget
 
 logger = get_logger(__name__)
 
 
-class RetryStrategy(ABC):
-
-    def __init__(self, max_retries: int, proxy_manager=None):
-        logger.info(f"Initializing {self.__class__.__name__} with max_retries: {max_retries}")
-
-        self.proxy_manager = proxy_manager or ProxyManager(proxy_list_size=50)
-        self.proxy_manager.load_proxies()
+class RetryState:
+    """
+    Retry bookkeeping of a single request. Every request gets its own state so concurrent requests can't
+    reset or use up each other's retries.
+    """
+    __slots__ = ('message_id', 'retries', 'last_delay', 'deadline')
 
-        self.max_retries = max_retries
+    def __init__(self, message_id=None, deadline: float = None):
+        self.message_id = message_id
         self.retries = 0
+        self.last_delay = None
+        # time.monotonic() after which no further attempt is made, None means no deadline
+        self.deadline = deadline
 
-    def update_proxy_rank(self, proxy: dict, delta: int):
-        self.proxy_manager.update_proxy_rank(proxy, delta)
 
-    def get_new_proxy(self):
-        proxy = self.proxy_manager.get_proxy()
-        logger.info(f"New proxy: {proxy}")
-        return proxy
+class RetryStrategy(ABC):
+
+    def __init__(self, max_retries: int, proxy_manager=None, backoff: BackoffPolicy = None,
+                 retry_budget: RetryBudget = None, allow_direct: bool = False):
+        """
+        :param max_retries: The maximum number of retries per request.
+        :param proxy_manager: The ProxyManager used to pick new proxies, a default one is created if omitted.
+        :param backoff: The BackoffPolicy deciding the delay between attempts, defaults to exponential backoff
+                        with jitter that honors Retry-After.
+        :param retry_budget: A RetryBudget shared by all requests, retries are unlimited (up to max_retries) if omitted.
+        :param allow_direct: Retry and hedge requests that were sent through a proxy without one when there are no
+                             proxies left. Off by default, such requests fail instead of going out from our own IP.
+        """
+        logger.info("Initializing %s with max_retries: %s", self.__class__.__name__, max_retries)
+
+        # The proxies are loaded once, on first use
+        self.proxy_manager = proxy_manager or ProxyManager(proxy_list_size=50)
 
+        self.max_retries = max_retries
+        self.backoff = backoff or RetryAfterBackoff()
+        self.retry_budget = retry_budget
+        self.allow_direct = allow_direct
+
+    def new_state(self, message_id=None, deadline: float = None) -> RetryState:
+        if self.retry_budget is not None:
+            self.retry_budget.record_request()
+        return RetryState(message_id, deadline)
+
+    def report_proxy_result(self, proxy: dict, success: bool, latency: float = None, host: str = None):
+        if proxy is None:
+            return
+        self.proxy_manager.report_result(proxy, success, latency, host)
+
+    def get_new_proxy(self, host: str = None, proxy: dict = None):
+        """
+        Picks the proxy for the next attempt of a request sent through `proxy`. When there are no proxies direct
+        requests are retried directly, proxied ones only with allow_direct, otherwise LookupError is raised.
+        """
+        try:
+            new_proxy = self.proxy_manager.get_proxy(host)
+        except LookupError:
+            if proxy is not None and not self.allow_direct:
+                raise
+            logger.warning("Proxy list is empty, retrying without a proxy")
+            return None
+
+        logger.info("New proxy: %s", new_proxy)
+        return new_proxy
+
+    def get_hedge_proxy(self, proxy: dict = None, host: str = None):
+        """
+        Picks the proxy for a hedged duplicate of a request sent through `proxy`. Like for retries, the hedge is only
+        sent directly when there are no proxies and the request was direct or allow_direct is set. Raises LookupError
+        when no other proxy is available.
+        """
+        try:
+            return self.proxy_manager.get_other_proxy(proxy, host)
+        except LookupError:
+            if proxy is not None and not self.allow_direct:
+                raise
+            return None
 
     def refresh_proxy(self):
-        logger.info(f"Refreshing proxy...")
-        self.proxy_manager.load_proxies()
-
-    def reset_retries(self):
-        if self.retries > 0:
-            logger.info(f"Resetting retry counter to 0")
-            self.retries = 0
+        logger.info("Refreshing proxy...")
+        self.proxy_manager.refresh_proxies()
+
+    def close(self):
+        self.proxy_manager.close()
+
+    def get_delay(self, state: RetryState, response=None) -> float:
+        delay = self.backoff.get_delay(state, response)
+        state.last_delay = delay
+        return delay
+
+    def should_retry(self, state: RetryState):
+        logger.info("Retries for message %s is %s and max_retries is %s", state.message_id, state.retries,
+                    self.max_retries)
+        if state.retries >= self.max_retries:
+            logger.warning("Max retries reached for message %s", state.message_id)
+            return False
 
-    def should_retry(self):
-        logger.info(f"Retries for {self.__class__.__name__} is {self.retries} and max_retries is {self.max_retries}")
-        if self.retries < self.max_retries:
-            self.retries += 1
-            return True
+        if self.retry_budget is not None and not self.retry_budget.try_spend():
+            return False
 
-        logger.warning(f"Max retries reached for {self.__class__.__name__}")
-        return False
+        state.retries += 1
+        return True
 
-    def evaluate(self, response, message_id : str) -> bool:
+    def evaluate(self, response, state: RetryState) -> bool:
+        message_id = state.message_id
 
         if response:
             response_code = response.status
-            logger.warning(f"Response code: {response_code} for message {message_id}")
+            logger.warning("Response code: %s for message %s", response_code, message_id)
         else:
-            logger.warning(f"No response received for message {message_id}")
+            logger.warning("No response received for message %s", message_id)
             response_code = 0
 
         # Sometimes the url doesn't exist, so we can just ignore it
@@ -60,15 +125,14 @@ class RetryStrategy(ABC):
             return False
 
         # Define a set of HTTP status codes that indicate an error that you can solve via retrying.
-        error_codes = {403, 500, 503, 504, 412, 0}
+        error_codes = {403, 429, 500, 503, 504, 412, 0}
 
         # Check the retry count
-        should_retry = self.should_retry()
+        should_retry = self.should_retry(state)
 
         # 3 is arbitrary, load the proxy list again. It will be running parallely so new proxies will be loaded
-        if response_code in error_codes and self.retries % 3 == 0:
-            logger.info(f"Received status code {self.retries}, retry limit reached, refreshing proxy")
+        if should_retry and response_code in error_codes and state.retries % 3 == 0:
+            logger.info("Received status code %s on retry %s, refreshing proxy", response_code, state.retries)
             self.refresh_proxy()
 
-        return True
-
+        return should_retry
@@ -0,0 +1,238 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from enum import IntEnum
+
+from logs.Logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class Priority(IntEnum):
+    # Lower values are sent first
+    INTERACTIVE = 0
+    NORMAL = 1
+    BULK = 2
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+class Waiter:
+    __slots__ = ('priority', 'tenant', 'deadline', 'future')
+
+    def __init__(self, priority: Priority, tenant: str, deadline: [float, None], future: asyncio.Future):
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+        self.future = future
+
+
+class TenantQueues:
+    def __init__(self, weights: dict, default_weight: float):
+        """
+        The waiting requests of one priority class, one queue per tenant, served with deficit round robin so every
+        tenant gets a share of the slots proportional to its weight however many requests it queued.
+        """
+        self.weights = weights
+        self.default_weight = default_weight
+
+        self.queues = {}
+        self.credits = {}
+        self.order = deque()
+
+    def push(self, waiter: Waiter):
+        queue = self.queues.get(waiter.tenant)
+        if queue is None:
+            queue = self.queues[waiter.tenant] = deque()
+            self.credits[waiter.tenant] = 0.0
+            self.order.append(waiter.tenant)
+        queue.append(waiter)
+
+    def pop(self) -> [Waiter, None]:
+        while self.order:
+            tenant = self.order[0]
+            queue = self.queues[tenant]
+
+            if self.credits[tenant] < 1:
+                # Out of credit, top it up and let the next tenant go first
+                self.credits[tenant] += self.weights.get(tenant, self.default_weight)
+                self.order.rotate(-1)
+                continue
+
+            waiter = queue.popleft()
+            # Requests that gave up waiting are dropped without using up credit
+            live = not waiter.future.done()
+            if live:
+                self.credits[tenant] -= 1
+
+            if not queue:
+                # Idle tenants don't save up credit
+                del self.queues[tenant], self.credits[tenant]
+                self.order.popleft()
+
+            if live:
+                return waiter
+
+        return None
+
+
+class RequestScheduler:
+    def __init__(self, concurrency: int = None, retry_share: float = 0.1, tenant_weights: dict = None,
+                 default_weight: float = 1):
+        """
+        Decides which request attempt gets to go out next when more of them are waiting than there are slots.
+        Waiting attempts are served by priority class first, then fairly between the tenants of a class. Retries get
+        a reserved share of the slots that first attempts can't use, and go before first attempts, so a backlog of
+        new work never delays the retries of requests that are already running. Attempts whose deadline passes
+        while they wait are dropped before they are sent.
+
+        :param concurrency: Maximum number of attempts in flight, no limit (and no scheduling) if omitted.
+        :param retry_share: Share of the slots reserved for retries, 0.1 keeps one slot in ten free for them.
+        :param tenant_weights: Dictionary of tenant -> weight, a tenant with weight 2 gets twice the slots of one with
+                               weight 1 while both have requests waiting.
+        :param default_weight: Weight of the tenants that aren't in tenant_weights. Weights must be greater than 0.
+        """
+        self.concurrency = concurrency
+        self.reserved = math.ceil(concurrency * retry_share) if concurrency else 0
+        if concurrency and self.reserved >= concurrency:
+            raise ValueError("retry_share leaves no slots for first attempts")
+
+        # A tenant without weight would never earn the credit to be served, and would stall the others
+        if default_weight <= 0 or any(weight <= 0 for weight in (tenant_weights or {}).values()):
+            raise ValueError("Tenant weights must be greater than 0")
+
+        self.tenant_weights = tenant_weights or {}
+        self.default_weight = default_weight
+
+        self.in_flight = 0
+        self.classes = {priority: TenantQueues(self.tenant_weights, default_weight) for priority in Priority}
+        # (priority, sequence, waiter), retries are only ordered by priority and arrival
+        self.retries = []
+        self.sequence = itertools.count()
+
+    def slot(self, priority: Priority = Priority.NORMAL, tenant: str = None, deadline: float = None,
+             retry: bool = False) -> 'SchedulerPermit':
+        """
+        Returns an async context manager that waits for a slot and holds it while the attempt runs. It raises
+        DeadlineExceededError if the deadline passes before a slot is free.
+
+        :param priority: The Priority class of the request.
+        :param tenant: The tenant or job the request belongs to, requests without one share a single queue.
+        :param deadline: time.monotonic() by which the attempt must have started, None waits as long as it takes.
+        :param retry: Whether this is a retry, retries can use the reserved slots.
+        """
+        return SchedulerPermit(self, priority, tenant, deadline, retry)
+
+    def _has_capacity(self, retry: bool) -> bool:
+        return self.in_flight < self.concurrency - (0 if retry else self.reserved)
+
+    def _grant(self, waiter: Waiter):
+        self.in_flight += 1
+        waiter.future.set_result(None)
+
+    def _expire(self, waiter: Waiter) -> bool:
+        if waiter.deadline is None or waiter.deadline > time.monotonic():
+            return False
+
+        waiter.future.set_exception(DeadlineExceededError("Deadline passed while waiting for a slot"))
+        return True
+
+    def _dispatch(self):
+        while self.retries and self._has_capacity(True):
+            waiter = heapq.heappop(self.retries)[2]
+            if not waiter.future.done() and not self._expire(waiter):
+                self._grant(waiter)
+
+        while self._has_capacity(False):
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if not self._expire(waiter):
+                self._grant(waiter)
+
+    def _next_waiter(self) -> [Waiter, None]:
+        # Strict priority between the classes, a waiting interactive request always goes before bulk ones
+        for priority in Priority:
+            waiter = self.classes[priority].pop()
+            if waiter is not None:
+                return waiter
+        return None
+
+    async def acquire(self, priority: Priority = Priority.NORMAL, tenant: str = None, deadline: float = None,
+                      retry: bool = False):
+        if not self.concurrency:
+            return
+
+        if deadline is not None and deadline <= time.monotonic():
+            raise DeadlineExceededError("Deadline passed before the request was scheduled")
+
+        waiter = Waiter(Priority(priority), tenant, deadline, asyncio.get_running_loop().create_future())
+        if retry:
+            heapq.heappush(self.retries, (waiter.priority, next(self.sequence), waiter))
+        else:
+            self.classes[waiter.priority].push(waiter)
+
+        # Queue first and dispatch right away, so a free slot still goes to whoever is first in line
+        self._dispatch()
+        if waiter.future.done():
+            return waiter.future.result()
+
+        timeout = deadline - time.monotonic() if deadline is not None else None
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            if self._granted(waiter):
+                return
+            raise DeadlineExceededError("Deadline passed while waiting for a slot") from None
+        except asyncio.CancelledError:
+            # The slot may have been granted right before the cancellation
+            if self._granted(waiter):
+                self.release()
+            raise
+
+    @staticmethod
+    def _granted(waiter: Waiter) -> bool:
+        return waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None
+
+    def release(self):
+        if not self.concurrency:
+            return
+
+        self.in_flight -= 1
+        self._dispatch()
+
+    def waiting(self) -> dict:
+        """
+        Number of waiting first attempts per priority class and tenant, and of waiting retries.
+        """
+        return {
+            'retries': sum(not entry[2].future.done() for entry in self.retries),
+            **{priority.name.lower(): {tenant: sum(not waiter.future.done() for waiter in queue)
+                                       for tenant, queue in self.classes[priority].queues.items()}
+               for priority in Priority},
+        }
+
+
+class SchedulerPermit:
+    def __init__(self, scheduler: RequestScheduler, priority: Priority, tenant: str, deadline: [float, None],
+                 retry: bool):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+        self.retry = retry
+        self.waited = 0.0
+
+    async def __aenter__(self):
+        started_at = time.monotonic()
+        await self.scheduler.acquire(self.priority, self.tenant, self.deadline, self.retry)
+        self.waited = time.monotonic() - started_at
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.scheduler.release()
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from logs.Logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ClientCache:
+    def __init__(self, create: Callable, dispose: Callable = None, is_closed: Callable = None,
+                 max_clients: int = 256, idle_timeout: float = 300):
+        """
+        Long-lived clients (aiohttp sessions, httpx clients, rate limiter buckets) by key, e.g. one per proxy.
+        Proxies keep rotating, so clients that weren't used for idle_timeout seconds are closed, and the least
+        recently used ones as soon as there are more than max_clients. Clients with requests in flight (see acquire)
+        are never closed.
+
+        :param create: Called with a key to create its client.
+        :param dispose: Coroutine function closing a client, evicted clients are just dropped if omitted.
+        :param is_closed: Tells whether a client was closed, closed clients are replaced.
+        :param max_clients: Number of clients kept open, None means no limit.
+        :param idle_timeout: Seconds after which an unused client is closed, None keeps it until it is evicted.
+        """
+        self.create = create
+        self.dispose = dispose
+        self.is_closed = is_closed
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+
+        # Least recently used first
+        self.clients = OrderedDict()
+        self.last_used = {}
+        self.in_use = {}
+        self.closing = set()
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def __contains__(self, key) -> bool:
+        return key in self.clients
+
+    def get(self, key):
+        """
+        Returns the client for the key, creating it on first use. Must be called from inside the running event loop.
+        """
+        client = self.clients.get(key)
+
+        if client is None or (self.is_closed is not None and self.is_closed(client)):
+            client = self.clients[key] = self.create(key)
+            self._touch(key)
+            self._evict(keep=key)
+        else:
+            self._touch(key)
+
+        return client
+
+    def peek(self, key):
+        """
+        Returns the client for the key if there is one, without creating it or counting it as used.
+        """
+        return self.clients.get(key)
+
+    def acquire(self, key):
+        """
+        Returns the client for the key like get and keeps it open until release is called with the same key.
+        """
+        client = self.get(key)
+        self.in_use[key] = self.in_use.get(key, 0) + 1
+        return client
+
+    def release(self, key):
+        count = self.in_use.pop(key, 0) - 1
+        if count > 0:
+            self.in_use[key] = count
+        if key in self.clients:
+            self._touch(key)
+
+    def _touch(self, key):
+        self.last_used[key] = time.monotonic()
+        self.clients.move_to_end(key)
+
+    def _evict(self, keep=None):
+        now = time.monotonic()
+
+        for key in list(self.clients):
+            if key == keep or self.in_use.get(key):
+                continue
+
+            idle = self.idle_timeout is not None and now - self.last_used[key] >= self.idle_timeout
+            full = self.max_clients is not None and len(self.clients) > self.max_clients
+            if not idle and not full:
+                # The rest was used more recently
+                break
+
+            client = self._pop(key)
+            if self.dispose is None:
+                continue
+
+            logger.info("Closing %s client for: %s", 'idle' if idle else 'least recently used', key)
+            task = asyncio.ensure_future(self.dispose(client))
+            self.closing.add(task)
+            task.add_done_callback(self.closing.discard)
+
+    def _pop(self, key):
+        self.last_used.pop(key, None)
+        return self.clients.pop(key)
+
+    async def remove(self, key):
+        if key in self.clients:
+            client = self._pop(key)
+            if self.dispose is not None:
+                await self.dispose(client)
+
+    async def close(self) -> int:
+        """
+        Closes every client, returns how many were open.
+        """
+        clients = list(self.clients.values())
+        self.clients.clear()
+        self.last_used.clear()
+
+        if self.dispose is not None:
+            await asyncio.gather(*(self.dispose(client) for client in clients), *self.closing,
+                                 return_exceptions=True)
+        return len(clients)
@@ -0,0 +1,80 @@
+import aiohttp
+
+from logs.Logger import get_logger
+from sessions.client_cache import ClientCache
+
+logger = get_logger(__name__)
+
+
+class SessionPool:
+    def __init__(self, limit: int = 100, limit_per_host: int = 0, ttl_dns_cache: int = 300,
+                 keepalive_timeout: float = 15, timeout: float = 5, trace_configs: list = None,
+                 max_sessions: int = 256, idle_timeout: float = 300):
+        """
+        Keeps long-lived aiohttp sessions around so connections, DNS lookups and TLS handshakes are reused.
+
+        aiohttp pins the proxy per request, so every proxy gets its own session and connector. Requests without
+        a proxy share the session stored under the None key.
+
+        :param limit: Total number of simultaneous connections per connector (0 means unlimited).
+        :param limit_per_host: Number of simultaneous connections to the same endpoint (0 means unlimited).
+        :param ttl_dns_cache: Seconds to keep resolved DNS entries cached, None caches forever.
+        :param keepalive_timeout: Seconds an idle keep-alive connection stays in the pool.
+        :param timeout: Default total timeout in seconds for requests made through the sessions.
+        :param trace_configs: aiohttp TraceConfigs attached to every session, e.g. for metrics.
+        :param max_sessions: Number of sessions kept open, the least recently used one is closed beyond that.
+        :param idle_timeout: Seconds after which the session of a proxy that isn't used anymore is closed.
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.trace_configs = trace_configs or []
+        self.sessions = ClientCache(self._create_session, self._close, lambda session: session.closed,
+                                    max_sessions, idle_timeout)
+
+    def create_connector(self) -> aiohttp.TCPConnector:
+        return aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                    ttl_dns_cache=self.ttl_dns_cache, keepalive_timeout=self.keepalive_timeout)
+
+    def _create_session(self, proxy: [str, None]) -> aiohttp.ClientSession:
+        logger.info("Opening new session for proxy: %s", proxy)
+        # Cookies are passed per request, a shared jar would leak cookies between unrelated requests
+        return aiohttp.ClientSession(connector=self.create_connector(), cookie_jar=aiohttp.DummyCookieJar(),
+                                     timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                     trace_configs=self.trace_configs or None)
+
+    @staticmethod
+    async def _close(session: aiohttp.ClientSession):
+        await session.close()
+
+    def get_session(self, proxy: str = None) -> aiohttp.ClientSession:
+        """
+        Returns the session for the given proxy string, creating it on first use.
+        Must be called from inside the running event loop.
+        """
+        return self.sessions.get(proxy)
+
+    def acquire(self, proxy: str = None) -> aiohttp.ClientSession:
+        """
+        Returns the session for the given proxy string like get_session, it isn't closed as idle until release is
+        called for the proxy.
+        """
+        return self.sessions.acquire(proxy)
+
+    def release(self, proxy: str = None):
+        self.sessions.release(proxy)
+
+    async def close_session(self, proxy: str = None):
+        await self.sessions.remove(proxy)
+
+    async def close(self):
+        closed = await self.sessions.close()
+        logger.info("Closed %s sessions", closed)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
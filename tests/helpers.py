@@ -0,0 +1,32 @@
+import socket
+
+from aiohttp import web
+
+from proxy.proxy_manager import ProxyManager
+from proxy.proxy_pool import ProxyPool
+from proxy.proxy_store import CsvProxyStore
+from request_generator import RequestGenerator
+from retry_strategies.retry_strategy import RetryStrategy
+
+
+async def start_origin(handler) -> tuple:
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}'
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def direct_generator(tmp_path, **kwargs) -> RequestGenerator:
+    proxy_manager = ProxyManager(proxy_list_size=0, store=CsvProxyStore(str(tmp_path / 'proxies.csv')))
+    proxy_manager.pool = ProxyPool()
+    return RequestGenerator(retry_strategy=RetryStrategy(max_retries=2, proxy_manager=proxy_manager), **kwargs)
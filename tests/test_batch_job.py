@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+from aiohttp import web
+
+from jobs.batch_job import BatchJob
+from jobs.checkpoint import Checkpoint
+from jobs.request_queue import JsonlRequestQueue
+from jobs.result_sink import JsonlResultSink
+from request_generator import HttpMethod
+from tests.helpers import direct_generator, start_origin
+
+
+def test_resumed_job_counts_the_requests_it_skips(tmp_path):
+    async def handler(request):
+        return web.Response(text=request.query_string)
+
+    async def run():
+        runner, origin = await start_origin(handler)
+        with open(tmp_path / 'requests.jsonl', 'w') as f:
+            for i in range(5):
+                f.write(json.dumps({'url': f'{origin}/?i={i}'}) + '\n')
+
+        # Ids of an older queue and a torn last line don't count, only the requests actually filtered out do
+        with open(tmp_path / 'checkpoint.log', 'w') as f:
+            f.write('0\n3\nold\n4')
+
+        async with direct_generator(tmp_path) as generator:
+            job = BatchJob(JsonlRequestQueue(str(tmp_path / 'requests.jsonl')),
+                           Checkpoint(str(tmp_path / 'checkpoint.log')),
+                           JsonlResultSink(str(tmp_path / 'results.jsonl')), HttpMethod.GET, generator)
+            counts = await job.run()
+            job.close()
+
+        await runner.cleanup()
+        return counts
+
+    assert asyncio.run(run()) == {'completed': 3, 'failed': 0, 'skipped': 2}
+    with open(tmp_path / 'checkpoint.log') as f:
+        lines = f.read().splitlines()
+    assert lines[:4] == ['0', '3', 'old', '4'] and sorted(lines[4:]) == ['1', '2', '4']
@@ -0,0 +1,67 @@
+import random
+from collections import Counter
+
+from proxy.proxy_pool import ProxyPool, ProxyRecord
+
+
+def assert_consistent(pool: ProxyPool):
+    assert len(pool.positions) == len(pool.index) == sum(len(bucket) for bucket in pool.buckets.values())
+    for rank, bucket in pool.buckets.items():
+        assert bucket
+        for position, record in enumerate(bucket):
+            assert record.rank == rank
+            assert pool.index[record.key] is record
+            assert pool.positions[record.key] == position
+    assert pool.total_weight == sum(pool.weight_of(record.rank) for record in pool)
+
+
+def test_add_remove_and_set_rank_keep_positions_consistent():
+    rng = random.Random(7)
+    pool = ProxyPool(ProxyRecord(f'10.0.0.{i}', '8080', rank=rng.randint(0, 3)) for i in range(20))
+    assert_consistent(pool)
+    assert not pool.add(ProxyRecord('10.0.0.0', '8080'))
+
+    for i in range(500):
+        operation = rng.random()
+        if operation < 0.3:
+            pool.add(ProxyRecord(f'10.0.1.{i % 50}', '8080', rank=rng.randint(0, 3)))
+        elif operation < 0.6 and len(pool):
+            pool.remove(rng.choice(list(pool)))
+        elif len(pool):
+            pool.set_rank(rng.choice(list(pool)), rng.randint(0, 3))
+        assert_consistent(pool)
+
+    # Removing the first proxy of a bucket moves the last one into its place
+    pool.clear()
+    first, middle, last = (ProxyRecord(f'10.0.2.{i}', '8080', rank=1) for i in range(3))
+    for record in (first, middle, last):
+        pool.add(record)
+    pool.remove({'ip': '10.0.2.0', 'port': 8080})
+    assert pool.buckets[1] == [last, middle]
+    assert_consistent(pool)
+
+    assert pool.remove(first) is None
+    assert_consistent(pool)
+
+
+def test_select_weights_rank_buckets(monkeypatch):
+    pool = ProxyPool([ProxyRecord('10.0.0.1', '8080', rank=9), ProxyRecord('10.0.0.2', '8080', rank=0),
+                      ProxyRecord('10.0.0.3', '8080', rank=0)])
+    # Rank 9 weighs 10, the rank 0 bucket 2 * 1
+    assert pool.total_weight == 12
+
+    random.seed(3)
+    counts = Counter(pool.select().ip for _ in range(12000))
+    assert 9500 < counts['10.0.0.1'] < 10500
+    assert 600 < counts['10.0.0.2'] < 1400
+    assert 600 < counts['10.0.0.3'] < 1400
+
+    # Walks the buckets highest rank first
+    monkeypatch.setattr(random, 'random', lambda: 0.8)
+    assert pool.select().ip == '10.0.0.1'
+    monkeypatch.setattr(random, 'random', lambda: 0.9)
+    assert pool.select().rank == 0
+
+    pool.set_rank(pool.get({'ip': '10.0.0.1', 'port': '8080'}), 0)
+    assert pool.total_weight == 3 and list(pool.buckets) == [0]
+    assert ProxyPool().select() is None
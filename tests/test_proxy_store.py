@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+
+from proxy.proxy_manager import ProxyManager
+from proxy.proxy_pool import ProxyRecord
+from proxy.proxy_store import BatchedPersister, CsvProxyStore, SqliteProxyStore
+
+
+class SlowCsvProxyStore(CsvProxyStore):
+    def __init__(self, filepath: str, delay: float):
+        super().__init__(filepath)
+        self.delay = delay
+
+    def save(self, rows: list):
+        # Only the first save is slow, a later one would overtake it without the flush lock
+        delay, self.delay = self.delay, 0
+        time.sleep(delay)
+        super().save(rows)
+
+    def load(self) -> list:
+        time.sleep(self.delay)
+        return super().load()
+
+
+def test_concurrent_flushes_keep_the_newest_snapshot(tmp_path):
+    store = SlowCsvProxyStore(str(tmp_path / 'proxies.csv'), delay=0.2)
+    persister = BatchedPersister(store, flush_interval=60)
+    record = ProxyRecord('10.0.0.1', '8080', rank=5)
+    persister.reset([record])
+
+    persister.mark(record)
+    older = threading.Thread(target=persister.flush)
+    older.start()
+    time.sleep(0.02)
+
+    # Changed and flushed while the older snapshot is still being written
+    record.rank = 9
+    persister.mark(record)
+    persister.flush()
+    older.join()
+    persister.stop()
+
+    assert [proxy.rank for proxy in CsvProxyStore(store.filepath).load()] == [9]
+
+
+def test_refresh_reads_the_store_off_the_event_loop(tmp_path):
+    store = SlowCsvProxyStore(str(tmp_path / 'proxies.csv'), delay=0)
+    store.save([('10.0.0.1', '8080', '', 'no', 5)])
+    proxy_manager = ProxyManager(proxy_list_size=2, store=store)
+    assert len(proxy_manager.pool) == 1
+
+    # Another process adds a proxy
+    CsvProxyStore(store.filepath).save([('10.0.0.1', '8080', '', 'no', 5), ('10.0.0.2', '8080', '', 'no', 5)])
+    store.delay = 0.2
+
+    async def run():
+        start = time.monotonic()
+        proxy_manager.refresh_proxies()
+        assert time.monotonic() - start < 0.1
+        assert len(proxy_manager.pool) == 1
+
+        while len(proxy_manager.pool) < 2:
+            assert time.monotonic() - start < 5
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    proxy_manager.close()
+
+
+def test_incremental_flush_upserts_changed_rows(tmp_path):
+    store = SqliteProxyStore(str(tmp_path / 'proxies.db'))
+    store.save([('10.0.0.1', '8080', '', 'no', 5), ('10.0.0.2', '8080', '', 'no', 5)])
+    persister = BatchedPersister(store, flush_interval=60)
+    records = store.load()
+    persister.reset(records)
+
+    records[0].rank = 9
+    persister.mark(records[0])
+    persister.mark(ProxyRecord('10.0.0.3', '8080', rank=2))
+    persister.stop()
+
+    assert sorted((proxy.ip, proxy.rank) for proxy in store.load()) == [('10.0.0.1', 9), ('10.0.0.2', 5),
+                                                                       ('10.0.0.3', 2)]
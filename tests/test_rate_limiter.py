@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+from rate_limit.rate_limiter import RateLimiter
+
+
+async def send(limiter: RateLimiter, proxies: int, url: str = 'http://example.com/'):
+    for i in range(proxies):
+        async with limiter.limit(url, f'http://10.0.{i // 256}.{i % 256}:8080'):
+            pass
+
+
+def test_limiter_without_limits_keeps_no_state():
+    limiter = RateLimiter()
+    asyncio.run(send(limiter, 1000))
+
+    assert sum(map(len, (limiter.host_buckets, limiter.proxy_buckets, limiter.host_semaphores,
+                         limiter.proxy_semaphores))) == 0
+
+
+def test_state_of_rotated_proxies_is_dropped():
+    limiter = RateLimiter(proxy_rate=1000, proxy_burst=10, proxy_concurrency=2, max_entries=100)
+    asyncio.run(send(limiter, 1000))
+
+    assert len(limiter.proxy_buckets) == 100 and len(limiter.proxy_semaphores) == 100
+
+
+def test_proxy_in_use_keeps_its_limit():
+    limiter = RateLimiter(proxy_concurrency=1, max_entries=1, idle_timeout=0)
+
+    async def run():
+        async with limiter.limit('http://example.com/', 'http://10.1.0.1:8080'):
+            await send(limiter, 10)
+            # Still the same semaphore, a second request through the proxy has to wait
+            assert limiter.proxy_semaphores.peek('http://10.1.0.1:8080').locked()
+
+    asyncio.run(run())
+
+
+def test_host_concurrency_is_still_enforced():
+    limiter = RateLimiter(host_concurrency=2)
+    in_flight = []
+
+    async def request():
+        async with limiter.limit('http://example.com/'):
+            in_flight.append(1)
+            assert len(in_flight) <= 2
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+    async def run():
+        start = time.monotonic()
+        await asyncio.gather(*(request() for _ in range(6)))
+        assert time.monotonic() - start >= 0.03
+
+    asyncio.run(run())
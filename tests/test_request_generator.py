@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from data_fetcher import fetch_data
+from parsers.stream_parsers import JsonParser
+from request_generator import HttpMethod
+from retry_strategies.backoff import ExponentialBackoff
+from scheduling.request_scheduler import Priority
+from tests.helpers import direct_generator, start_origin, unused_port
+
+
+def test_coalesced_get_with_params(tmp_path):
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return web.Response(text=request.query_string)
+
+    async def run():
+        runner, url = await start_origin(handler)
+        try:
+            async with direct_generator(tmp_path) as generator:
+                assert await generator.get(url, params={'a': 1}) == 'a=1'
+
+                # Identical params share one request, different ones don't
+                results = await asyncio.gather(generator.get(url, params={'a': 1, 'b': 2}),
+                                               generator.get(url, params={'b': 2, 'a': 1}),
+                                               generator.get(url, params={'a': 3}))
+                assert results == ['a=1&b=2', 'a=1&b=2', 'a=3']
+                assert generator.single_flight.coalesced == 1
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_coalescing_keeps_priority_classes_and_tenants_apart(tmp_path):
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return web.Response(text='ok')
+
+    async def run():
+        runner, url = await start_origin(handler)
+        try:
+            async with direct_generator(tmp_path) as generator:
+                results = await asyncio.gather(generator.get(url, priority=Priority.INTERACTIVE),
+                                               generator.get(url, priority=Priority.BULK),
+                                               generator.get(url, priority=Priority.BULK, tenant='backfill'),
+                                               generator.get(url, priority=Priority.BULK, tenant='backfill'))
+                assert results == ['ok'] * 4
+                assert generator.single_flight.coalesced == 1
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_direct_request_retries_without_proxies(tmp_path):
+    statuses = [500, 200]
+
+    async def handler(request):
+        return web.Response(status=statuses.pop(0), text='ok')
+
+    async def run():
+        runner, url = await start_origin(handler)
+        try:
+            async with direct_generator(tmp_path) as generator:
+                generator.retry_strategy.backoff = ExponentialBackoff(base=0.01)
+                start = time.monotonic()
+                assert await generator.get(url) == 'ok'
+                assert time.monotonic() - start < 1
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_stream_parser_error_only_fails_its_request(tmp_path):
+    async def handler(request):
+        return web.Response(text='<html>blocked</html>' if request.path == '/bad' else '"ok"')
+
+    async def run():
+        runner, url = await start_origin(handler)
+        try:
+            async with direct_generator(tmp_path) as generator:
+                results = await fetch_data([{'url': f'{url}/bad'}, {'url': f'{url}/'}], HttpMethod.GET, generator,
+                                           stream_parser=JsonParser)
+                assert results == [None, 'ok']
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_proxied_request_is_not_retried_directly(tmp_path):
+    requests = []
+
+    async def handler(request):
+        requests.append(request.path)
+        return web.Response(text='ok')
+
+    async def run():
+        runner, url = await start_origin(handler)
+        # Nothing listens on the port of the proxy
+        dead_proxy = {'ip': '127.0.0.1', 'port': unused_port()}
+        try:
+            async with direct_generator(tmp_path) as generator:
+                generator.retry_strategy.backoff = ExponentialBackoff(base=0.01)
+                assert await generator.get(url, proxy=dead_proxy) is None
+                assert requests == []
+
+                generator.retry_strategy.allow_direct = True
+                assert await generator.get(url, proxy=dead_proxy) == 'ok'
+                assert requests == ['/']
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
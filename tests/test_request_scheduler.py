@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from scheduling.request_scheduler import DeadlineExceededError, Priority, RequestScheduler
+
+
+async def run_requests(scheduler: RequestScheduler, requests: list, hold: float = 0.01) -> list:
+    """
+    Sends (priority, tenant) requests through the scheduler while a blocker holds every slot, and returns them in
+    the order they got a slot.
+    """
+    order = []
+
+    async def send(priority, tenant):
+        async with scheduler.slot(priority, tenant):
+            order.append((priority, tenant))
+            await asyncio.sleep(hold)
+
+    blockers = [asyncio.ensure_future(send(Priority.NORMAL, 'blocker')) for _ in range(scheduler.concurrency)]
+    await asyncio.sleep(0)
+    await asyncio.gather(*blockers, *(send(priority, tenant) for priority, tenant in requests))
+    return [entry for entry in order if entry[1] != 'blocker']
+
+
+def test_weights_must_be_positive():
+    with pytest.raises(ValueError):
+        RequestScheduler(concurrency=2, tenant_weights={'bulk': 0})
+    with pytest.raises(ValueError):
+        RequestScheduler(concurrency=2, default_weight=0)
+
+
+def test_higher_priority_classes_go_first():
+    scheduler = RequestScheduler(concurrency=1, retry_share=0)
+    requests = [(Priority.BULK, None)] * 3 + [(Priority.NORMAL, None)] * 2 + [(Priority.INTERACTIVE, None)]
+
+    order = asyncio.run(run_requests(scheduler, requests))
+    assert [priority for priority, _ in order] == sorted(priority for priority, _ in requests)
+
+
+def test_tenants_share_slots_by_weight():
+    scheduler = RequestScheduler(concurrency=1, retry_share=0, tenant_weights={'a': 2, 'b': 1})
+    requests = [(Priority.NORMAL, 'a')] * 20 + [(Priority.NORMAL, 'b')] * 20
+
+    order = asyncio.run(run_requests(scheduler, requests, hold=0))
+    # While both have requests waiting, a gets two slots for every one of b
+    first = [tenant for _, tenant in order[:30]]
+    assert first.count('a') == 20 and first.count('b') == 10
+
+
+def test_deadline_expires_while_queued():
+    scheduler = RequestScheduler(concurrency=1, retry_share=0)
+
+    async def run():
+        async with scheduler.slot():
+            start = time.monotonic()
+            with pytest.raises(DeadlineExceededError):
+                async with scheduler.slot(deadline=time.monotonic() + 0.05):
+                    pass
+            assert time.monotonic() - start < 1
+
+        # The expired request didn't keep its slot
+        assert scheduler.in_flight == 0
+
+    asyncio.run(run())
@@ -0,0 +1,75 @@
+import asyncio
+import os
+
+from aiohttp import web
+
+from cache.response_cache import DiskCache, ResponseCache
+from tests.helpers import direct_generator, start_origin
+
+
+def test_vary_headers_are_part_of_the_key(tmp_path):
+    async def run():
+        cache = ResponseCache(disk_dir=str(tmp_path))
+        url = 'http://example.com/'
+        await cache.store(url, {'Accept-Language': 'en'}, 200, {'Vary': 'Accept-Language'}, b'hello')
+        await cache.store(url, {'Accept-Language': 'de'}, 200, {'Vary': 'Accept-Language'}, b'hallo')
+
+        # A new cache on the same directory reads both back from disk
+        cache = ResponseCache(disk_dir=str(tmp_path))
+        assert (await cache.get(url, {'accept-language': 'en'})).body == b'hello'
+        assert (await cache.get(url, {'Accept-Language': 'de'})).body == b'hallo'
+        assert await cache.get(url, {'Accept-Language': 'fr'}) is None
+
+    asyncio.run(run())
+
+
+def test_stale_response_is_revalidated(tmp_path):
+    requests = []
+
+    async def handler(request):
+        requests.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304, headers={'ETag': '"v1"', 'Cache-Control': 'max-age=0'})
+        return web.Response(text='body', headers={'ETag': '"v1"', 'Cache-Control': 'max-age=0'})
+
+    async def run():
+        runner, url = await start_origin(handler)
+        try:
+            cache = ResponseCache(disk_dir=str(tmp_path / 'cache'))
+            async with direct_generator(tmp_path, cache=cache) as generator:
+                assert await generator.get(url) == 'body'
+                assert await generator.get(url) == 'body'
+
+            assert requests == [None, '"v1"']
+            assert cache.stats()['revalidations'] == 1
+        finally:
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    disk = DiskCache(str(tmp_path), max_bytes=10000, max_entries=3)
+    for i in range(5):
+        disk.store(f'key {i}', {'i': i}, b'x' * 100)
+    assert disk.load('key 4')[0]['i'] == 4
+
+    # The least recently used files are removed, key 4 was just read
+    disk.store('key 5', {'i': 5}, b'x' * 100)
+    assert [disk.load(f'key {i}') is not None for i in range(6)] == [False, False, False, True, True, True]
+    assert len(os.listdir(str(tmp_path))) == 3
+
+    disk.store('big', {}, b'x' * 9000)
+    assert disk.stats()['bytes'] <= 10000
+
+
+def test_expired_and_unreadable_files_are_misses(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    disk.store('expired', {}, b'old', delete_at=0)
+    disk.store('corrupt', {}, b'body')
+    with open(os.path.join(str(tmp_path), DiskCache._name('corrupt')), 'wb') as file:
+        file.write(b'\x80\x04garbage')
+
+    assert disk.load('expired') is None
+    assert disk.load('corrupt') is None
+    assert os.listdir(str(tmp_path)) == []
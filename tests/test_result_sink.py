@@ -0,0 +1,19 @@
+import json
+
+from jobs.result_sink import JsonlResultSink
+
+
+def test_resumed_sink_starts_after_a_torn_line(tmp_path):
+    filepath = str(tmp_path / 'results.jsonl')
+    with open(filepath, 'w') as f:
+        f.write('{"message_id": 0, "url": "u", "result": "a"}\n{"message_id": 1, "url": "u", "res')
+
+    sink = JsonlResultSink(filepath)
+    sink.write({'message_id': 1, 'url': 'u'}, 'b')
+    sink.close()
+
+    with open(filepath) as f:
+        lines = f.read().splitlines()
+
+    assert json.loads(lines[-1]) == {'message_id': 1, 'url': 'u', 'result': 'b'}
+    assert len(lines) == 3
@@ -0,0 +1,27 @@
+import asyncio
+
+from sessions.session_pool import SessionPool
+
+
+def test_sessions_of_unused_proxies_are_closed():
+    async def run():
+        pool = SessionPool(max_sessions=2, idle_timeout=60)
+        first = pool.acquire('http://10.0.0.1:8080')
+        second = pool.get_session('http://10.0.0.2:8080')
+        pool.get_session('http://10.0.0.3:8080')
+        await asyncio.sleep(0)
+
+        # The first proxy has a request in flight, the least recently used idle one goes instead
+        assert not first.closed and second.closed
+        assert len(pool.sessions) == 2
+
+        pool.release('http://10.0.0.1:8080')
+        pool.sessions.idle_timeout = 0
+        fourth = pool.get_session('http://10.0.0.4:8080')
+        await asyncio.sleep(0)
+
+        assert first.closed and not fourth.closed
+        assert len(pool.sessions) == 1
+        await pool.close()
+
+    asyncio.run(run())
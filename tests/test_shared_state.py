@@ -0,0 +1,54 @@
+import multiprocessing
+import threading
+
+from proxy.proxy_pool import ProxyRecord
+from proxy.proxy_scoring import ProxyStats
+from proxy.shared_state import SEQ, SharedProxyState, SharedProxyScorer
+
+
+def _fail(state: SharedProxyState, failures: int):
+    scorer = SharedProxyScorer(state, failure_threshold=3, cooldown=60)
+    record = ProxyRecord('10.0.0.1', '8080')
+    for _ in range(failures):
+        scorer.record(record, success=False)
+
+
+def test_processes_share_a_cooldown(tmp_path):
+    state = SharedProxyState(str(tmp_path / 'state'), capacity=8)
+    scorer = SharedProxyScorer(state, failure_threshold=3, cooldown=60)
+    record = ProxyRecord('10.0.0.1', '8080')
+    assert scorer.is_available(record)
+
+    process = multiprocessing.get_context('spawn').Process(target=_fail, args=(state, 3))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+
+    assert not scorer.is_available(record)
+    assert scorer.stats_of(record).consecutive_failures == 3
+    state.close()
+
+
+def test_torn_record_is_repaired(tmp_path):
+    state = SharedProxyState(str(tmp_path / 'state'), capacity=8)
+    with state.update(('10.0.0.1', '8080'), ProxyStats()) as stats:
+        stats.consecutive_failures = 2
+
+    # A writer that died between bumping the sequence and finishing the record
+    offset = state._offset(0)
+    SEQ.pack_into(state.buffer, offset, SEQ.unpack_from(state.buffer, offset)[0] + 1)
+
+    reader = threading.Thread(target=state.read, args=(('10.0.0.1', '8080'), ProxyStats()))
+    reader.start()
+    reader.join(5)
+    assert not reader.is_alive()
+    assert not SEQ.unpack_from(state.buffer, offset)[0] & 1
+
+    stats = ProxyStats()
+    assert state.read(('10.0.0.1', '8080'), stats)
+    assert stats.consecutive_failures == 2
+
+    with state.update(('10.0.0.1', '8080'), ProxyStats()) as stats:
+        stats.consecutive_failures += 1
+    assert state.read(('10.0.0.1', '8080'), stats) and stats.consecutive_failures == 3
+    state.close()
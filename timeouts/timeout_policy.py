@@ -0,0 +1,140 @@
+import time
+
+import aiohttp
+
+from metrics.rolling_quantile import RollingQuantile
+
+
+class Timeouts:
+    FIELDS = ('total', 'connect', 'sock_read', 'deadline')
+    __slots__ = FIELDS
+
+    def __init__(self, total: float = None, connect: float = None, sock_read: float = None, deadline: float = None):
+        """
+        A set of timeouts in seconds, None means not set.
+
+        :param total: Total time of a single attempt, connecting and reading the body included.
+        :param connect: Time to get a connection, waiting for a free pooled connection included.
+        :param sock_read: Maximum time between two reads, the wait for the response headers included.
+        :param deadline: Total time of the request across all its attempts and backoff delays.
+        """
+        self.total = total
+        self.connect = connect
+        self.sock_read = sock_read
+        self.deadline = deadline
+
+    @classmethod
+    def coerce(cls, value) -> 'Timeouts':
+        """
+        Accepts a Timeouts, a dictionary of its fields or a number, which is the total timeout like before.
+        """
+        if value is None:
+            return cls()
+        if isinstance(value, Timeouts):
+            return value
+        if isinstance(value, dict):
+            return cls(**value)
+        return cls(total=value)
+
+    def merge(self, other: 'Timeouts') -> 'Timeouts':
+        # The timeouts set in other win
+        return Timeouts(*(getattr(other, field) if getattr(other, field) is not None else getattr(self, field)
+                          for field in self.FIELDS))
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class TimeoutPolicy:
+    def __init__(self, total: float = 5, connect: float = None, sock_read: float = None, deadline: float = None,
+                 host_overrides: dict = None, adaptive: bool = False, quantile: float = 0.99, multiplier: float = 3,
+                 min_sock_read: float = 1, max_sock_read: float = None, window: int = 200, min_samples: int = 20):
+        """
+        Decides the timeouts of every attempt. Precedence from lowest to highest: the defaults, the adaptive read
+        timeout of the host, the host override and the timeout passed with the request.
+
+        :param total: Default total time of a single attempt in seconds.
+        :param connect: Default time to get a connection, a short one fails fast on dead proxies.
+        :param sock_read: Default maximum time between two reads, headers included.
+        :param deadline: Default time budget of a request across all its retries, no deadline if omitted.
+        :param host_overrides: Dictionary of host -> Timeouts or dict(total=..., connect=..., sock_read=...,
+                               deadline=...) for specific origins.
+        :param adaptive: Derive the read timeout of every host from its observed latencies.
+        :param quantile: The latency quantile the adaptive read timeout is based on.
+        :param multiplier: The adaptive read timeout is the latency quantile times this.
+        :param min_sock_read: Lower bound of the adaptive read timeout in seconds.
+        :param max_sock_read: Upper bound of the adaptive read timeout in seconds, defaults to the total timeout.
+        :param window: Number of recent latencies per host the quantile is computed from.
+        :param min_samples: Hosts with fewer latencies keep the default read timeout.
+        """
+        self.defaults = Timeouts(total, connect, sock_read, deadline)
+        self.host_overrides = {host: Timeouts.coerce(value) for host, value in (host_overrides or {}).items()}
+        self.adaptive = adaptive
+        self.quantile = quantile
+        self.multiplier = multiplier
+        self.min_sock_read = min_sock_read
+        self.max_sock_read = max_sock_read
+        self.window = window
+        self.min_samples = min_samples
+
+        self.latencies = {}
+
+    def record(self, host: str, latency: float):
+        if not self.adaptive:
+            return
+
+        latencies = self.latencies.get(host)
+        if latencies is None:
+            latencies = self.latencies[host] = RollingQuantile(self.quantile, self.window)
+
+        latencies.add(latency)
+
+    def adaptive_sock_read(self, host: str) -> [float, None]:
+        latencies = self.latencies.get(host)
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+
+        sock_read = max(latencies.get() * self.multiplier, self.min_sock_read)
+        max_sock_read = self.max_sock_read if self.max_sock_read is not None else self.defaults.total
+        return min(sock_read, max_sock_read) if max_sock_read is not None else sock_read
+
+    def timeouts_for(self, host: str, override=None) -> Timeouts:
+        """
+        The timeouts of a request to `host`.
+
+        :param host: The target host of the request.
+        :param override: The timeout passed with the request, see Timeouts.coerce.
+        """
+        timeouts = self.defaults
+
+        if self.adaptive:
+            timeouts = timeouts.merge(Timeouts(sock_read=self.adaptive_sock_read(host)))
+
+        host_override = self.host_overrides.get(host)
+        if host_override is not None:
+            timeouts = timeouts.merge(host_override)
+
+        if override is not None:
+            timeouts = timeouts.merge(Timeouts.coerce(override))
+
+        return timeouts
+
+    @staticmethod
+    def deadline_at(timeouts: Timeouts) -> [float, None]:
+        return time.monotonic() + timeouts.deadline if timeouts.deadline is not None else None
+
+    @staticmethod
+    def client_timeout(timeouts: Timeouts, deadline_at: float = None) -> [aiohttp.ClientTimeout, None]:
+        """
+        The aiohttp timeout of the next attempt, its total is cut to what is left of the deadline. None means the
+        deadline has passed.
+        """
+        total = timeouts.total
+
+        if deadline_at is not None:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                return None
+            total = remaining if total is None else min(total, remaining)
+
+        return aiohttp.ClientTimeout(total=total, connect=timeouts.connect, sock_read=timeouts.sock_read)
@@ -0,0 +1,52 @@
+import aiohttp
+
+from sessions.session_pool import SessionPool
+from transports.transport import Transport, TransportCapabilities
+
+
+class AiohttpTransport(Transport):
+    name = 'aiohttp'
+    capabilities = TransportCapabilities(http2=False, multiplexing=False, proxies=True, tracing=True)
+
+    def __init__(self, session_pool: SessionPool = None):
+        """
+        The default transport: HTTP/1.1 through the pooled aiohttp sessions, one per proxy.
+
+        :param session_pool: The SessionPool to send the requests through.
+        """
+        self.session_pool = session_pool or SessionPool()
+
+    def request(self, method: str, url: str, headers: dict = None, cookies: dict = None, params: dict = None,
+                data=None, json=None, proxy: str = None, ssl=None, timeout: aiohttp.ClientTimeout = None):
+        return PooledRequestContext(self.session_pool, proxy, dict(method=method, url=url, headers=headers,
+                                                                   cookies=cookies, params=params, data=data,
+                                                                   json=json, proxy=proxy, ssl=ssl, timeout=timeout))
+
+    async def close(self):
+        await self.session_pool.close()
+
+
+class PooledRequestContext:
+    def __init__(self, session_pool: SessionPool, proxy: [str, None], kwargs: dict):
+        """
+        Holds the session of the proxy while the request runs, so it isn't closed as idle under the request.
+        """
+        self.session_pool = session_pool
+        self.proxy = proxy
+        self.kwargs = kwargs
+        self.context = None
+
+    async def __aenter__(self) -> aiohttp.ClientResponse:
+        session = self.session_pool.acquire(self.proxy)
+        try:
+            self.context = session.request(**self.kwargs)
+            return await self.context.__aenter__()
+        except BaseException:
+            self.session_pool.release(self.proxy)
+            raise
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self.context.__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.session_pool.release(self.proxy)
@@ -0,0 +1,224 @@
+import asyncio
+import time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from http.cookies import CookieError, SimpleCookie
+
+import aiohttp
+
+from logs.Logger import get_logger
+from sessions.client_cache import ClientCache
+from transports.transport import Transport, TransportCapabilities, TransportError
+
+logger = get_logger(__name__)
+
+
+class HttpxTransport(Transport):
+    name = 'httpx'
+
+    def __init__(self, http2: bool = True, http1: bool = True, max_connections: int = 100,
+                 max_keepalive_connections: int = 20, keepalive_expiry: float = 15, max_clients: int = 256,
+                 idle_timeout: float = 300):
+        """
+        HTTP/2 capable transport on httpx (pip install 'httpx[http2]'). Every proxy gets its own client and a client
+        keeps one HTTP/2 connection per origin, so all concurrent requests for one (origin, proxy) pair are
+        multiplexed as streams over a single connection instead of opening one connection each.
+
+        HTTPS origins negotiate HTTP/2 with ALPN and fall back to HTTP/1.1. Plain http origins only get HTTP/2 with
+        http1=False, which speaks it without negotiation (h2c prior knowledge).
+
+        :param http2: Use HTTP/2 where the origin supports it.
+        :param http1: Allow HTTP/1.1, set it to False for h2c origins.
+        :param max_connections: Maximum number of connections per client.
+        :param max_keepalive_connections: Number of idle connections kept per client.
+        :param keepalive_expiry: Seconds an idle connection stays in the pool.
+        :param max_clients: Number of clients kept open, the least recently used one is closed beyond that.
+        :param idle_timeout: Seconds after which the client of a proxy that isn't used anymore is closed.
+        """
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("HttpxTransport needs httpx with HTTP/2 support: pip install 'httpx[http2]'") from e
+
+        self.httpx = httpx
+        self.http2 = http2
+        self.capabilities = TransportCapabilities(http2=http2, multiplexing=http2, proxies=True, tracing=False)
+        self.http1 = http1
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        # Keyed by (proxy string, certificate verification)
+        self.clients = ClientCache(self._create_client, self._close_client, lambda client: client.is_closed,
+                                   max_clients, idle_timeout)
+
+    def _create_client(self, key: tuple):
+        proxy, verify = key
+        logger.info("Opening new httpx client for proxy: %s", proxy)
+        # Cookies are passed per request, the client must not keep the ones responses set
+        return self.httpx.AsyncClient(http1=self.http1, http2=self.http2, proxy=proxy, verify=verify,
+                                      limits=self.limits, trust_env=False,
+                                      cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])))
+
+    @staticmethod
+    async def _close_client(client):
+        await client.aclose()
+
+    @staticmethod
+    def client_key(proxy: str = None, ssl=None) -> tuple:
+        return proxy, True if ssl is None else ssl
+
+    def get_client(self, proxy: str = None, ssl=None):
+        """
+        Returns the client for the given proxy string and certificate verification, creating it on first use.
+        """
+        return self.clients.get(self.client_key(proxy, ssl))
+
+    def request(self, method: str, url: str, headers: dict = None, cookies: dict = None, params: dict = None,
+                data=None, json=None, proxy: str = None, ssl=None, timeout: aiohttp.ClientTimeout = None):
+        # h11 rejects the surrounding whitespace aiohttp lets through, it isn't part of the value anyway
+        headers = {name: value.strip() for name, value in (headers or {}).items()}
+        if cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in cookies.items())
+
+        # aiohttp takes raw bodies and forms as data, httpx wants raw bodies as content
+        content = None
+        if isinstance(data, (str, bytes)):
+            content, data = data, None
+
+        return HttpxRequestContext(self, self.client_key(proxy, ssl),
+                                   dict(method=method, url=url, headers=headers, params=params, content=content,
+                                        data=data, json=json, timeout=self._timeout(timeout)),
+                                   timeout.total if timeout is not None else None)
+
+    def _timeout(self, timeout: [aiohttp.ClientTimeout, None]):
+        if timeout is None:
+            return self.httpx.Timeout(None)
+        # Waiting for a pooled connection counts as connecting, like in aiohttp. The total is enforced by the context
+        return self.httpx.Timeout(connect=timeout.connect, read=timeout.sock_read, write=None, pool=timeout.connect)
+
+    async def close(self):
+        closed = await self.clients.close()
+        logger.info("Closed %s httpx clients", closed)
+
+
+class HttpxRequestContext:
+    def __init__(self, transport: HttpxTransport, key: tuple, request: dict, total: float = None):
+        """
+        Holds the client of the proxy while the request runs, so it isn't closed as idle under the request.
+        """
+        self.transport = transport
+        self.key = key
+        self.request = request
+        self.deadline = time.monotonic() + total if total is not None else None
+        self.response = None
+
+    async def __aenter__(self) -> 'HttpxResponse':
+        client = self.transport.clients.acquire(self.key)
+        try:
+            request = client.build_request(**self.request)
+            response = await guard(self.transport.httpx, client.send(request, stream=True), self.deadline)
+        except BaseException:
+            self.transport.clients.release(self.key)
+            raise
+
+        self.response = HttpxResponse(self.transport.httpx, response, self.deadline)
+        return self.response
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self.response.response.aclose()
+        finally:
+            self.transport.clients.release(self.key)
+
+
+async def guard(httpx, awaitable, deadline: [float, None]):
+    """
+    Awaits an httpx operation within what is left of the total timeout and turns httpx errors into the ones the
+    generator handles.
+    """
+    timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except httpx.TimeoutException as e:
+        raise asyncio.TimeoutError(str(e)) from e
+    except httpx.HTTPError as e:
+        raise TransportError(f"{type(e).__name__}: {e}") from e
+
+
+class HttpxResponse:
+    """
+    An httpx response with the parts of the aiohttp.ClientResponse interface the generator uses.
+    """
+
+    def __init__(self, httpx, response, deadline: float = None):
+        self.httpx = httpx
+        self.response = response
+        self.deadline = deadline
+        self._cookies = None
+
+    @property
+    def status(self) -> int:
+        return self.response.status_code
+
+    @property
+    def headers(self):
+        return self.response.headers
+
+    @property
+    def url(self):
+        return self.response.url
+
+    @property
+    def http_version(self) -> str:
+        return self.response.http_version
+
+    @property
+    def content_type(self) -> str:
+        content_type = self.headers.get('content-type')
+        if not content_type:
+            return 'application/octet-stream'
+        return content_type.split(';', 1)[0].strip().lower()
+
+    @property
+    def charset(self) -> [str, None]:
+        for parameter in self.headers.get('content-type', '').split(';')[1:]:
+            name, _, value = parameter.partition('=')
+            if name.strip().lower() == 'charset':
+                return value.strip().strip('"') or None
+        return None
+
+    @property
+    def content_length(self) -> [int, None]:
+        value = self.headers.get('content-length')
+        return int(value) if value is not None and value.isdigit() else None
+
+    @property
+    def cookies(self) -> SimpleCookie:
+        if self._cookies is None:
+            self._cookies = SimpleCookie()
+            for header in self.headers.get_list('set-cookie'):
+                try:
+                    self._cookies.load(header)
+                except CookieError:
+                    logger.warning("Ignoring malformed cookie from %s", self.url)
+        return self._cookies
+
+    @property
+    def content(self) -> 'HttpxResponse':
+        # response.content.iter_chunked(n) like on an aiohttp response
+        return self
+
+    async def iter_chunked(self, size: int):
+        chunks = self.response.aiter_bytes(size)
+        while True:
+            try:
+                chunk = await guard(self.httpx, chunks.__anext__(), self.deadline)
+            except StopAsyncIteration:
+                return
+            yield chunk
+
+    async def read(self) -> bytes:
+        return await guard(self.httpx, self.response.aread(), self.deadline)
+
+    async def text(self) -> str:
+        await self.read()
+        return self.response.text
@@ -0,0 +1,58 @@
+from abc import ABC, abstractmethod
+
+import aiohttp
+
+
+class TransportError(aiohttp.ClientError):
+    """
+    A request failed in a non-aiohttp transport. It is an aiohttp.ClientError so the retry handling treats failures
+    of every transport the same.
+    """
+
+
+class TransportCapabilities:
+    FIELDS = ('http2', 'multiplexing', 'proxies', 'tracing')
+    __slots__ = FIELDS
+
+    def __init__(self, http2: bool = False, multiplexing: bool = False, proxies: bool = True, tracing: bool = False):
+        """
+        :param http2: The transport can speak HTTP/2.
+        :param multiplexing: Concurrent requests to the same origin share a connection.
+        :param proxies: Requests can go through HTTP proxies.
+        :param tracing: DNS, connect and time to first byte metrics are reported (aiohttp TraceConfigs).
+        """
+        self.http2 = http2
+        self.multiplexing = multiplexing
+        self.proxies = proxies
+        self.tracing = tracing
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class Transport(ABC):
+    """
+    Sends the requests of a RequestGenerator. The response the request context manager yields has to look like an
+    aiohttp.ClientResponse as far as the generator uses it: status, headers, cookies (a SimpleCookie), url,
+    content_type, charset, content_length, content.iter_chunked(n), read() and text().
+    """
+
+    name = None
+    capabilities = TransportCapabilities()
+
+    @abstractmethod
+    def request(self, method: str, url: str, headers: dict = None, cookies: dict = None, params: dict = None,
+                data=None, json=None, proxy: str = None, ssl=None, timeout: aiohttp.ClientTimeout = None):
+        """
+        Returns an async context manager sending the request and yielding the response, the connection is released
+        on exit.
+
+        :param proxy: The proxy string (http://ip:port), None for direct requests.
+        :param ssl: None verifies certificates, False doesn't.
+        :param timeout: The total, connect and sock_read timeouts of the attempt.
+        """
+        pass
+
+    @abstractmethod
+    async def close(self):
+        pass